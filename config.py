@@ -8,7 +8,19 @@ import os
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
+
+# إعدادات مجمع الاتصالات (PostgreSQL وMySQL) كمعاملات في DATABASE_URL وقيمها الافتراضية:
+# pool_min_size/pool_max_size عدد الاتصالات، pool_timeout أقصى انتظار لاتصال متاح (ثانية)،
+# pool_recycle بالثواني: في PostgreSQL مدة خمول الاتصال قبل إغلاقه، وفي MySQL أقصى عمر للاتصال منذ فتحه،
+# health_check فحص الاتصال قبل استخدامه
+POOL_DEFAULTS = {
+    'pool_min_size': 1,
+    'pool_max_size': 10,
+    'pool_timeout': 10.0,
+    'pool_recycle': 300.0,
+    'health_check': True
+}
 
 class DatabaseConfig:
     """فئة إعدادات قاعدة البيانات"""
@@ -17,8 +29,10 @@ class DatabaseConfig:
         self.database_url = database_url or os.getenv('DATABASE_URL', 'sqlite:///archive.db')
         self.parsed_url = urlparse(self.database_url)
         
-        # تحديد نوع قاعدة البيانات
+        # تحديد نوع قاعدة البيانات (postgres:// اسم آخر لـ postgresql://)
         self.db_type = self.parsed_url.scheme.lower()
+        if self.db_type == 'postgres':
+            self.db_type = 'postgresql'
         
         # إعدادات الاتصال
         self.host = self.parsed_url.hostname
@@ -27,13 +41,40 @@ class DatabaseConfig:
         self.password = self.parsed_url.password
         self.database = self.parsed_url.path.lstrip('/')
         
+        # إعدادات مجمع الاتصالات
+        self._setup_pool_config()
+        
         # إعدادات خاصة بكل نوع
         self._setup_db_specific_config()
     
+    def _setup_pool_config(self):
+        """قراءة إعدادات مجمع الاتصالات من معاملات الرابط"""
+        query = {key: values[-1] for key, values in parse_qs(self.parsed_url.query).items()}
+        
+        for key, default in POOL_DEFAULTS.items():
+            value = query.get(key)
+            if value is None:
+                setattr(self, key, default)
+            elif isinstance(default, bool):
+                setattr(self, key, value.strip().lower() in ('1', 'true', 'yes', 'on'))
+            else:
+                try:
+                    setattr(self, key, type(default)(value))
+                except ValueError:
+                    logging.warning(f"⚠️ قيمة غير صالحة لـ {key}: {value} - سيتم استخدام {default}")
+                    setattr(self, key, default)
+        
+        self.pool_min_size = max(0, self.pool_min_size)
+        self.pool_max_size = max(1, self.pool_max_size, self.pool_min_size)
+    
+    def get_pool_params(self):
+        """الحصول على إعدادات مجمع الاتصالات"""
+        return {key: getattr(self, key) for key in POOL_DEFAULTS}
+    
     def _setup_db_specific_config(self):
         """إعداد خاص بنوع قاعدة البيانات"""
         if self.db_type == 'sqlite':
-            self.db_file = self.database_url.replace('sqlite:///', '')
+            self.db_file = self.database_url.replace('sqlite:///', '').split('?')[0]
             self.connection_string = self.db_file
         
         elif self.db_type == 'postgresql':
@@ -48,12 +89,13 @@ class DatabaseConfig:
         
         elif self.db_type == 'mysql':
             self.port = self.port or 3306
+            # aiomysql يستخدم db وليس database
             self.connection_string = {
                 'host': self.host,
                 'port': self.port,
                 'user': self.username,
                 'password': self.password,
-                'database': self.database
+                'db': self.database
             }
     
     def get_connection_params(self):
@@ -61,7 +103,8 @@ class DatabaseConfig:
         return {
             'db_type': self.db_type,
             'connection_string': self.connection_string,
-            'database_url': self.database_url
+            'database_url': self.database_url,
+            'pool': self.get_pool_params()
         }
 
 class Config:
@@ -11,10 +11,53 @@ CREATE TABLE archived_messages (
     media_type TEXT,
     file_id TEXT,
     file_name TEXT,
+    grouped_id INTEGER,
+    edited_at TEXT,
+    deleted_at TEXT,
+    content_hash TEXT,
+    -- بيانات الملف الكامل (تُعرف دون تنزيله)
+    media_size INTEGER,
+    mime_type TEXT,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    dc_id INTEGER,
+    -- رابط معاينة الصفحة، والعنوان (الصفحة أو سؤال الاستطلاع أو المقطع الصوتي)
+    url TEXT,
+    title TEXT,
+    -- النص الموحد للبحث (دون تشكيل، مع توحيد الحروف وصيغ الكلمات بدون سوابقها)
+    search_text TEXT,
+    -- تاريخ الرسالة بثواني Unix، ويومها بتوقيت الأرشيف (ARCHIVE_TIMEZONE) بصيغة YYYY-MM-DD
+    date_ts INTEGER,
+    local_date TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(message_id, channel_id)
 );
 
+-- الألبومات (أجزاؤها مرتبطة عبر archived_messages.grouped_id)
+CREATE TABLE message_groups (
+    channel_id INTEGER NOT NULL,
+    grouped_id INTEGER NOT NULL,
+    first_message_id INTEGER NOT NULL,
+    part_count INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (channel_id, grouped_id)
+);
+
+-- النسخ السابقة للرسائل المعدلة
+CREATE TABLE message_revisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER,
+    message_id INTEGER NOT NULL,
+    content TEXT,
+    media_type TEXT,
+    file_id TEXT,
+    file_name TEXT,
+    replaced_at TEXT NOT NULL,
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- جدول الإعدادات
 CREATE TABLE settings (
     key TEXT PRIMARY KEY,
@@ -30,7 +73,192 @@ CREATE TABLE admins (
     added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- مهام الأرشفة الرجعية (نقاط الاستئناف)
+CREATE TABLE backfill_jobs (
+    job_id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    min_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    archived_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- أجزاء مهام الأرشفة وآخر رسالة تمت معالجتها في كل جزء
+CREATE TABLE backfill_shards (
+    job_id TEXT NOT NULL,
+    low_id INTEGER NOT NULL,
+    high_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, low_id)
+);
+
+-- حدود معرفات الرسائل لكل يوم (نتائج البحث الثنائي)
+CREATE TABLE date_id_bounds (
+    channel TEXT NOT NULL,
+    day TEXT NOT NULL,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    timezone TEXT NOT NULL DEFAULT 'UTC',  -- توقيت الأرشيف الذي حُسب به اليوم
+    PRIMARY KEY (channel, day)
+);
+
+-- نطاقات المعرفات المؤرشفة (أو المفحوصة) لكل قناة
+CREATE TABLE id_coverage (
+    channel_id INTEGER NOT NULL,
+    start_id INTEGER NOT NULL,
+    end_id INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, start_id)
+) WITHOUT ROWID;
+
+-- آخر pts تمت أرشفته لكل قناة (لاستكمال التحديثات الفائتة)
+CREATE TABLE channel_update_state (
+    channel_id INTEGER PRIMARY KEY,
+    pts INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ملفات الوسائط المنزلة حسب بصمة محتواها (الملف المكرر يُخزن مرة واحدة)
+CREATE TABLE media_files (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mime_type TEXT,
+    stored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_access REAL NOT NULL,
+    evicted_at TEXT
+);
+
+-- ربط الرسائل بملفات الوسائط
+CREATE TABLE message_media (
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    file_id TEXT,
+    sha256 TEXT,
+    thumb_sha256 TEXT,
+    PRIMARY KEY (channel_id, message_id)
+);
+
 -- فهارس للبحث السريع
 CREATE INDEX idx_date ON archived_messages(date);
-CREATE INDEX idx_content ON archived_messages(content);
 CREATE INDEX idx_year_month_day ON archived_messages(year, month, day);
+CREATE INDEX idx_channel_message ON archived_messages(channel_id, message_id);
+CREATE INDEX idx_grouped ON archived_messages(channel_id, grouped_id);
+CREATE INDEX idx_messages_media_local_date ON archived_messages(media_type, local_date, media_size);
+CREATE INDEX idx_messages_mime_size ON archived_messages(mime_type, media_size);
+CREATE INDEX idx_messages_date_ts ON archived_messages(date_ts);
+CREATE INDEX idx_messages_local_date ON archived_messages(local_date);
+CREATE INDEX idx_revisions_message ON message_revisions(channel_id, message_id);
+CREATE INDEX idx_backfill_jobs_status ON backfill_jobs(status, channel);
+CREATE INDEX idx_message_media_file ON message_media(file_id);
+CREATE INDEX idx_media_files_lru ON media_files(evicted_at, last_access);
+
+-- البحث النصي الكامل في archived_messages.search_text (تحدّثه الـ triggers)
+CREATE VIRTUAL TABLE messages_fts USING fts5(
+    search_text,
+    content='archived_messages', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+-- الصفوف حتى indexed_upto مفهرسة (أثناء بناء الفهرس للأرشيف الموجود)
+CREATE TABLE search_index_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    indexed_upto INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER messages_fts_insert AFTER INSERT ON archived_messages
+WHEN new.id <= (SELECT indexed_upto FROM search_index_state WHERE id = 1)
+BEGIN
+    INSERT INTO messages_fts (rowid, search_text) VALUES (new.id, new.search_text);
+END;
+
+CREATE TRIGGER messages_fts_delete AFTER DELETE ON archived_messages
+WHEN old.id <= (SELECT indexed_upto FROM search_index_state WHERE id = 1)
+BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+END;
+
+CREATE TRIGGER messages_fts_update AFTER UPDATE OF search_text ON archived_messages
+WHEN old.id <= (SELECT indexed_upto FROM search_index_state WHERE id = 1)
+     AND old.search_text IS NOT new.search_text
+BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    INSERT INTO messages_fts (rowid, search_text) VALUES (new.id, new.search_text);
+END;
+
+-- الصفوف حتى migrated_upto لها date_ts وlocal_date (أثناء ترحيل الأرشيف الموجود أو بعد تغيير التوقيت)
+CREATE TABLE timestamp_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    timezone TEXT NOT NULL,
+    migrated_upto INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- عدد الرسائل لكل يوم (local_date بتوقيت الأرشيف) وقناة ونوع وسائط (text للرسائل النصية) تحدّثه الـ triggers
+-- item_count يعد الألبوم عنصراً واحداً: تحت نوع album مرة لكل يوم فيه جزء منه
+-- الصفوف التي لم يُحسب local_date لها بعد تُعد عند ترحيلها (daily_counts_update)
+CREATE TABLE daily_counts (
+    local_date TEXT NOT NULL,
+    channel_id INTEGER NOT NULL,
+    media_type TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (local_date, channel_id, media_type)
+) WITHOUT ROWID;
+
+CREATE TRIGGER daily_counts_insert AFTER INSERT ON archived_messages
+BEGIN
+    INSERT INTO daily_counts (local_date, channel_id, media_type, message_count, item_count)
+    SELECT new.local_date, new.channel_id, COALESCE(new.media_type, 'text'), 1, new.grouped_id IS NULL
+    WHERE new.local_date IS NOT NULL
+    ON CONFLICT (local_date, channel_id, media_type) DO UPDATE SET
+        message_count = message_count + 1, item_count = item_count + excluded.item_count;
+    INSERT INTO daily_counts (local_date, channel_id, media_type, message_count, item_count)
+    SELECT new.local_date, new.channel_id, 'album', 0, 1
+    WHERE new.local_date IS NOT NULL AND new.grouped_id IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM archived_messages
+        WHERE channel_id = new.channel_id AND grouped_id = new.grouped_id
+          AND local_date = new.local_date AND id != new.id
+    )
+    ON CONFLICT (local_date, channel_id, media_type) DO UPDATE SET item_count = item_count + 1;
+END;
+
+CREATE TRIGGER daily_counts_delete AFTER DELETE ON archived_messages
+BEGIN
+    UPDATE daily_counts SET message_count = message_count - 1, item_count = item_count - (old.grouped_id IS NULL)
+    WHERE local_date = old.local_date
+      AND channel_id = old.channel_id AND media_type = COALESCE(old.media_type, 'text');
+    UPDATE daily_counts SET item_count = item_count - 1
+    WHERE local_date = old.local_date
+      AND channel_id = old.channel_id AND media_type = 'album'
+      AND old.grouped_id IS NOT NULL AND NOT EXISTS (
+          SELECT 1 FROM archived_messages
+          WHERE channel_id = old.channel_id AND grouped_id = old.grouped_id
+            AND local_date = old.local_date AND id != old.id
+      );
+END;
+
+-- daily_counts_update (عند تغير اليوم المحلي أو القناة أو النوع أو الألبوم): نفس عبارات الحذف لـ old ثم الإدراج لـ new
+
+-- العمليات الفاشلة بانتظار إعادة المحاولة (في ملف منفصل: dead_letters.db)
+CREATE TABLE dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    channel_id INTEGER,
+    message_id INTEGER,
+    payload TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    next_attempt_at REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_dead_letters_due ON dead_letters(status, next_attempt_at);
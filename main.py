@@ -8,13 +8,13 @@ Telegram Archive Bot - Production Ready
 import asyncio
 import os
 import json
-import sqlite3
 import logging
 import sys
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from typing import Optional, List, Dict
 from pathlib import Path
 import subprocess
+import mimetypes
 
 # تثبيت المكتبات المطلوبة تلقائياً
 def install_required_packages():
@@ -53,7 +53,7 @@ if not install_required_packages():
 
 # استيراد المكتبات بعد التثبيت
 try:
-    from telethon import TelegramClient, events
+    from telethon import events
     from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
     from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
     from dotenv import load_dotenv
@@ -63,6 +63,26 @@ except ImportError as e:
     print(f"❌ خطأ في استيراد المكتبات: {e}")
     sys.exit(1)
 
+from utils.storage_executor import StorageExecutor
+from utils.write_queue import ArchiveWriteQueue
+from utils.rate_governor import RateGovernor, GovernedTelegramClient
+from utils.json_segments import append_messages, seal_segment, seal_closed_days, read_day, day_path
+from utils.backfill import BackfillEngine
+from utils.channels import ChannelIngestion, parse_channels
+from utils.message_rows import build_row, json_record, MEDIA_COLUMNS
+from utils.coverage import IdCoverage, init_schema as init_coverage_schema
+from utils.dead_letters import DeadLetterQueue
+from utils.search import SearchIndex, init_schema as init_search_schema
+from utils.timestamps import TimestampMigration, init_schema as init_timestamp_schema, set_archive_timezone, local_today, day_bounds, month_bounds, range_filter, row_local_date
+from utils.daily_counts import init_schema as init_daily_counts_schema, count_years, count_months, count_days, count_messages
+from utils.media_store import MediaStore, init_schema as init_media_schema, format_media_caption, MEDIA_ICONS, BOT_UPLOAD_LIMIT
+from utils.catch_up import UpdateCatchUp, update_pts, init_schema as init_update_state_schema
+from utils.revisions import apply_edit, apply_deletes, init_schema as init_revision_schema, get_revisions
+from utils.edit_sweeper import EditSweeper
+from utils.albums import AlbumAggregator, init_schema as init_album_schema, ITEM_KEY_SQL, group_items
+from utils.checkpoints import BackfillCheckpoints, init_schema as init_checkpoint_schema
+from utils.date_resolver import DateIdResolver, init_schema as init_date_bounds_schema
+
 # إعداد نظام السجلات
 def setup_logging():
     """إعداد نظام السجلات"""
@@ -104,9 +124,75 @@ class TelegramArchiveBot:
         # إعداد قاعدة البيانات
         self.init_database()
         
+        # نقاط استئناف الأرشفة الرجعية
+        self.checkpoints = BackfillCheckpoints(self.storage)
+        
+        # حاكم معدل طلبات Telethon
+        self.rate_governor = RateGovernor(
+            default_rate=self.api_rate_limit,
+            global_rate=self.api_global_rate_limit,
+            backfill_share=self.backfill_share
+        )
+        
+        # خريطة المعرفات المؤرشفة لكل قناة
+        self.coverage = IdCoverage(self.storage)
+        self.coverage.load(self.conn)
+        
+        # فهرس البحث النصي الكامل
+        self.search_index = SearchIndex(self.storage)
+        
+        # ترحيل تواريخ الرسائل المؤرشفة قبل إضافة date_ts وlocal_date
+        self.timestamp_migration = TimestampMigration(self.storage)
+        
+        # العمليات الفاشلة وإعادة محاولتها
+        self.dead_letters = DeadLetterQueue(
+            self.storage,
+            base_delay=self.dead_letter_base_delay,
+            max_attempts=self.dead_letter_max_attempts
+        )
+        
+        # آخر يوم (بتوقيت الأرشيف) أُغلقت قبله مقاطع JSONL
+        self.sealed_before = None
+        
+        # طابور الكتابة المؤجلة
+        self.write_queue = ArchiveWriteQueue(
+            self.storage,
+            max_batch=self.write_batch_size,
+            max_latency=self.write_max_latency_ms / 1000,
+            on_flush=self.mirror_batch_to_json,
+            backfill_share=self.backfill_share,
+            coverage=self.coverage,
+            dead_letters=self.dead_letters,
+            max_pending=self.write_queue_max,
+            overflow=self.backpressure_policy,
+            lag_alert=self.lag_alert_seconds,
+            on_lag_alert=self.notify_lag
+        )
+        
+        # تجميع أجزاء الألبومات قبل الكتابة
+        self.albums = AlbumAggregator(self.write_queue.enqueue_group, window=self.album_window_ms / 1000)
+        
+        # دوال إعادة تنفيذ كل نوع من العمليات الفاشلة
+        self.dead_letters.register('rows', lambda row: self.write_queue.write_rows([row], keep_existing=True))
+        self.dead_letters.register('json', self.write_json_records)
+        self.dead_letters.register('edit', lambda payload: self.apply_edit_row(payload['row'], payload['edited_at']))
+        self.dead_letters.register('delete', lambda payload: self.apply_deletion(
+            payload['channel_id'], payload['message_ids'], payload['deleted_at']
+        ))
+        
+        # عمال الأرشفة لكل قناة مصدر
+        self.ingestion = ChannelIngestion(self.archive_message)
+        self.ingestion.set_channels(self.source_channels)
+        
         # متغيرات العملاء
         self.userbot = None
         self.bot_app = None
+        self.backfill = None
+        self.sweeper = None
+        self.sweep_task = None
+        self.media = None
+        self.update_state = None
+        self.update_state_task = None
         self.is_running = False
         
         logger.info("✅ تم تهيئة البوت بنجاح")
@@ -127,11 +213,52 @@ class TelegramArchiveBot:
         # إعدادات Bot Token
         self.bot_token = os.getenv('BOT_TOKEN')
         
-        # إعدادات القناة والمدراء
-        self.source_channel = os.getenv('SOURCE_CHANNEL')
+        # إعدادات القنوات والمدراء (SOURCE_CHANNELS لعدة قنوات مفصولة بفواصل)
+        self.source_channels = parse_channels(os.getenv('SOURCE_CHANNELS') or os.getenv('SOURCE_CHANNEL'))
+        self.source_channel = self.source_channels[0] if self.source_channels else None
         admin_ids_str = os.getenv('ADMIN_IDS', '')
         self.admin_ids = [int(x.strip()) for x in admin_ids_str.split(',') if x.strip().isdigit()]
         
+        # إعدادات طابور الكتابة
+        self.write_batch_size = int(os.getenv('WRITE_BATCH_SIZE', '500'))
+        self.write_max_latency_ms = int(os.getenv('WRITE_MAX_LATENCY_MS', '200'))
+        # حد الرسائل غير المحفوظة في الذاكرة وسياسة الامتلاء (block أو spill أو shed_backfill)
+        self.write_queue_max = int(os.getenv('WRITE_QUEUE_MAX', '10000'))
+        self.backpressure_policy = os.getenv('BACKPRESSURE_POLICY', 'block').strip().lower()
+        # تنبيه المدراء عند تأخر أرشفة الرسائل المباشرة عن نشرها (بالثواني، 0 لإيقافه)
+        self.lag_alert_seconds = float(os.getenv('LAG_ALERT_SECONDS', '60'))
+        self.db_readers = int(os.getenv('DB_READER_THREADS', '2'))
+        self.album_window_ms = int(os.getenv('ALBUM_WINDOW_MS', '500'))
+        self.update_state_interval = float(os.getenv('UPDATE_STATE_INTERVAL', '10'))
+        
+        # إعادة محاولة عمليات الأرشفة الفاشلة (تأخير أسي يبدأ من DEAD_LETTER_BASE_DELAY ثانية)
+        self.dead_letter_base_delay = float(os.getenv('DEAD_LETTER_BASE_DELAY', '5'))
+        self.dead_letter_max_attempts = int(os.getenv('DEAD_LETTER_MAX_ATTEMPTS', '10'))
+        
+        # تنزيل الوسائط (اختياري) مع حدود الحجم وميزانية القرص
+        self.media_download = os.getenv('MEDIA_DOWNLOAD', 'false').lower() == 'true'
+        self.media_dir = os.getenv('MEDIA_DIR', 'media')
+        self.media_concurrency = int(os.getenv('MEDIA_CONCURRENCY', '3'))
+        self.media_per_dc = int(os.getenv('MEDIA_PER_DC', '2'))
+        self.media_max_file_mb = float(os.getenv('MEDIA_MAX_FILE_MB', '50'))
+        self.media_budget_mb = float(os.getenv('MEDIA_BUDGET_MB', '2048'))
+        # full: تنزيل الملفات كاملة، thumbnail: الصور المصغرة فقط وتنزيل الملف عند طلبه
+        self.media_mode = os.getenv('MEDIA_MODE', 'full').strip().lower()
+        
+        # توقيت الأرشيف لأيام الرسائل المحلية (اسم مثل Asia/Riyadh أو إزاحة مثل +03:00)
+        self.archive_timezone = os.getenv('ARCHIVE_TIMEZONE', 'UTC')
+        set_archive_timezone(self.archive_timezone)
+        
+        # حدود معدل طلبات Telegram (طلب/ثانية)
+        self.api_rate_limit = float(os.getenv('API_RATE_LIMIT', '20'))
+        self.api_global_rate_limit = float(os.getenv('API_GLOBAL_RATE_LIMIT', '30'))
+        
+        # إعدادات الأرشفة الرجعية
+        self.backfill_concurrency = int(os.getenv('BACKFILL_CONCURRENCY', '4'))
+        self.backfill_shard_size = int(os.getenv('BACKFILL_SHARD_SIZE', '2000'))
+        # نسبة السعة المتاحة للأرشفة الرجعية (الرسائل المباشرة تأخذ الأولوية دائماً)
+        self.backfill_share = min(1.0, max(0.05, float(os.getenv('BACKFILL_SHARE', '0.5'))))
+        
         # التحقق من المتغيرات المطلوبة
         self.validate_environment()
 
@@ -179,7 +306,7 @@ ADMIN_IDS=123456789,987654321
 
     def create_directories(self):
         """إنشاء المجلدات المطلوبة"""
-        directories = ['archive', 'exports', 'backups', 'logs', 'config', 'sessions']
+        directories = ['archive', 'exports', 'backups', 'logs', 'config', 'sessions', 'spill']
         
         for directory in directories:
             Path(directory).mkdir(exist_ok=True)
@@ -189,7 +316,9 @@ ADMIN_IDS=123456789,987654321
     def init_database(self):
         """إنشاء قاعدة البيانات وجداولها"""
         try:
-            self.conn = sqlite3.connect('archive.db', check_same_thread=False)
+            # طبقة التخزين: إنشاء الجداول يتم عبر اتصال الكتابة قبل بدء الخيوط
+            self.storage = StorageExecutor('archive.db', readers=self.db_readers)
+            self.conn = self.storage.conn
             cursor = self.conn.cursor()
             
             # جدول الرسائل المؤرشفة
@@ -206,6 +335,19 @@ ADMIN_IDS=123456789,987654321
                     media_type TEXT,
                     file_id TEXT,
                     file_name TEXT,
+                    grouped_id INTEGER,
+                    edited_at TEXT,
+                    deleted_at TEXT,
+                    content_hash TEXT,
+                    media_size INTEGER,
+                    mime_type TEXT,
+                    duration REAL,
+                    width INTEGER,
+                    height INTEGER,
+                    dc_id INTEGER,
+                    url TEXT,
+                    title TEXT,
+                    search_text TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE(message_id, channel_id)
                 )
@@ -232,8 +374,38 @@ ADMIN_IDS=123456789,987654321
             
             # إنشاء فهارس للبحث السريع
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_date ON archived_messages(date)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_content ON archived_messages(content)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_year_month_day ON archived_messages(year, month, day)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_channel_message ON archived_messages(channel_id, message_id)')
+            
+            # جدول الألبومات وعمود grouped_id
+            init_album_schema(self.conn)
+            
+            # جدول نسخ الرسائل المعدلة وعلامات الحذف
+            init_revision_schema(self.conn)
+            
+            # خريطة تغطية معرفات الرسائل لكل قناة
+            init_coverage_schema(self.conn)
+            
+            # آخر pts تمت أرشفته لكل قناة
+            init_update_state_schema(self.conn)
+            
+            # جداول نقاط استئناف الأرشفة الرجعية
+            init_checkpoint_schema(self.conn)
+            
+            # جدول حدود المعرفات لكل يوم
+            init_date_bounds_schema(self.conn)
+            
+            # جداول ملفات الوسائط المنزلة
+            init_media_schema(self.conn)
+            
+            # فهرس البحث النصي الكامل (FTS5) والـ triggers التي تحدّثه
+            init_search_schema(self.conn)
+            
+            # عمودا date_ts وlocal_date للاستعلام عن الفترات (الأرشيف الموجود يُرحّل في الخلفية)
+            init_timestamp_schema(self.conn)
+            
+            # عدادات الرسائل اليومية للتصفح والإحصائيات (تحدّثها الـ triggers)
+            init_daily_counts_schema(self.conn)
             
             self.conn.commit()
             logger.info("✅ تم إعداد قاعدة البيانات بنجاح")
@@ -249,7 +421,10 @@ ADMIN_IDS=123456789,987654321
             return False
         
         try:
-            self.userbot = TelegramClient('sessions/userbot', self.api_id, self.api_hash)
+            self.userbot = GovernedTelegramClient(
+                'sessions/userbot', self.api_id, self.api_hash,
+                governor=self.rate_governor
+            )
             
             await self.userbot.start(phone=self.phone)
             
@@ -257,14 +432,48 @@ ADMIN_IDS=123456789,987654321
             me = await self.userbot.get_me()
             logger.info(f"✅ تم تشغيل Userbot بنجاح - {me.first_name}")
             
+            # محرك الأرشفة الرجعية المتوازي
+            self.backfill = BackfillEngine(
+                self.userbot,
+                self.archive_message,
+                shard_size=self.backfill_shard_size,
+                concurrency=self.backfill_concurrency,
+                checkpoints=self.checkpoints,
+                wait_committed=self.wait_archived,
+                resolver=DateIdResolver(self.userbot, self.storage),
+                coverage=self.coverage
+            )
+            
+            # تخزين الوسائط حسب بصمة محتواها (بدون MEDIA_DOWNLOAD تُنزل عند طلبها بـ /media فقط)
+            self.media = MediaStore(
+                self.userbot, self.storage,
+                root=self.media_dir,
+                concurrency=self.media_concurrency,
+                per_dc=self.media_per_dc,
+                max_file_size=int(self.media_max_file_mb * 1024 ** 2),
+                budget=int(self.media_budget_mb * 1024 ** 2),
+                mode=self.media_mode
+            )
+            await self.media.start(eager=self.media_download)
+            
+            # مراجعة الرسائل المؤرشفة للكشف عن التعديلات والحذف الفائتة
+            self.sweeper = EditSweeper(self.userbot, self.storage, self.archive_edit, self.mark_deleted)
+            
+            # حالة التحديثات لكل قناة لاستكمال ما فات بعد إعادة التشغيل أو انقطاع الاتصال
+            self.update_state = UpdateCatchUp(
+                self.userbot, self.storage, self.ingestion,
+                self.archive_edit, self.archive_deletion, self.wait_archived,
+                on_too_long=self.backfill_missed
+            )
+            await self.update_state.load()
+            self.userbot.on_reconnect = self.update_state.catch_up_all
+            self.update_state_task = asyncio.create_task(self.update_state.run_saver(self.update_state_interval))
+            
+            # استئناف مهام الأرشفة التي توقفت قبل إعادة التشغيل
+            asyncio.create_task(self.resume_backfill_jobs())
+            
             # إعداد مراقب الرسائل الجديدة
-            if self.source_channel:
-                @self.userbot.on(events.NewMessage(chats=self.source_channel))
-                async def handle_new_message(event):
-                    await self.archive_message(event.message)
-                    logger.info(f"📥 تم أرشفة رسالة جديدة: {event.message.id}")
-                
-                logger.info(f"👀 بدء مراقبة القناة: {self.source_channel}")
+            await self.watch_channels()
             
             return True
             
@@ -272,6 +481,40 @@ ADMIN_IDS=123456789,987654321
             logger.error(f"❌ خطأ في تشغيل Userbot: {e}")
             return False
 
+    async def watch_channels(self):
+        """تسجيل مراقب الرسائل الجديدة لجميع القنوات المصدر (يعاد استدعاؤها عند تغيير القنوات)"""
+        for handler in (self.handle_new_message, self.handle_message_edited, self.handle_message_deleted):
+            self.userbot.remove_event_handler(handler)
+        self.ingestion.set_channels(self.source_channels)
+        
+        if not self.source_channels:
+            return
+        
+        await self.ingestion.resolve(self.userbot)
+        self.ingestion.start()
+        self.userbot.add_event_handler(self.handle_new_message, events.NewMessage(chats=self.source_channels))
+        self.userbot.add_event_handler(self.handle_message_edited, events.MessageEdited(chats=self.source_channels))
+        self.userbot.add_event_handler(self.handle_message_deleted, events.MessageDeleted(chats=self.source_channels))
+        logger.info(f"👀 بدء مراقبة القنوات: {', '.join(self.source_channels)}")
+        
+        # استكمال ما فات منذ آخر تشغيل قبل معالجة الأحداث المباشرة
+        if self.update_state:
+            await self.update_state.catch_up_all()
+
+    async def handle_new_message(self, event):
+        """توجيه الرسالة الجديدة إلى عامل قناتها"""
+        self.ingestion.submit(event.chat_id, event.message, pts=update_pts(event))
+        logger.info(f"📥 تمت إضافة رسالة جديدة لطابور الأرشفة: {event.message.id}")
+
+    async def handle_message_edited(self, event):
+        """توجيه التعديل إلى عامل القناة (بعد أي رسائل سابقة منها)"""
+        self.ingestion.submit(event.chat_id, event.message, self.archive_edit, pts=update_pts(event))
+
+    async def handle_message_deleted(self, event):
+        """توجيه الحذف إلى عامل القناة"""
+        if event.chat_id is not None:
+            self.ingestion.submit(event.chat_id, event, self.archive_deletion, pts=update_pts(event))
+
     async def start_bot(self):
         """بدء تشغيل Bot"""
         if not self.bot_token:
@@ -290,8 +533,14 @@ ADMIN_IDS=123456789,987654321
                 CommandHandler("archive_day", self.cmd_archive_day),
                 CommandHandler("browse", self.cmd_browse),
                 CommandHandler("search", self.cmd_search),
+                CommandHandler("reindex", self.cmd_reindex),
                 CommandHandler("export", self.cmd_export),
                 CommandHandler("set_channel", self.cmd_set_channel),
+                CommandHandler("sweep", self.cmd_sweep),
+                CommandHandler("gaps", self.cmd_gaps),
+                CommandHandler("media", self.cmd_media),
+                CommandHandler("files", self.cmd_files),
+                CommandHandler("dead_letters", self.cmd_dead_letters),
                 CallbackQueryHandler(self.handle_callback),
             ]
             
@@ -308,101 +557,199 @@ ADMIN_IDS=123456789,987654321
     async def archive_message(self, message):
         """أرشفة رسالة واحدة"""
         try:
-            msg_date = message.date
-            year = msg_date.year
-            month = msg_date.month
-            day = msg_date.day
-            
-            # تحضير بيانات الرسالة
-            content = message.text or message.caption or ""
-            media_type = None
-            file_id = None
-            file_name = None
-            
-            # معالجة الوسائط
-            if message.media:
-                if message.photo:
-                    media_type = "photo"
-                    file_id = str(message.photo.id)
-                elif message.video:
-                    media_type = "video"
-                    file_id = str(message.video.id)
-                    file_name = getattr(message.video, 'file_name', None)
-                elif message.document:
-                    media_type = "document"
-                    file_id = str(message.document.id)
-                    file_name = getattr(message.document, 'file_name', None)
-                elif message.audio:
-                    media_type = "audio"
-                    file_id = str(message.audio.id)
-                    file_name = getattr(message.audio, 'file_name', None)
-            
-            # حفظ في قاعدة البيانات
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO archived_messages 
-                (message_id, channel_id, date, year, month, day, content, media_type, file_id, file_name)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                message.id,
-                message.chat_id,
-                msg_date.isoformat(),
-                year, month, day,
-                content,
-                media_type,
-                file_id,
-                file_name
-            ))
-            self.conn.commit()
+            # إضافة إلى طابور الكتابة (يتم الحفظ على دفعات، وأجزاء الألبوم معاً)
+            await self.albums.add(build_row(message))
             
-            # حفظ في ملف JSON
-            await self.save_to_json_file(year, month, day, {
-                'message_id': message.id,
-                'date': msg_date.isoformat(),
-                'content': content,
-                'media_type': media_type,
-                'file_id': file_id,
-                'file_name': file_name
-            })
+            if self.media:
+                await self.media.submit(message)
             
         except Exception as e:
             logger.error(f"❌ خطأ في أرشفة الرسالة {message.id}: {e}")
 
-    async def save_to_json_file(self, year: int, month: int, day: int, message_data: dict):
-        """حفظ الرسالة في ملف JSON"""
+    async def archive_edit(self, message):
+        """تطبيق تعديل رسالة على الأرشيف مع حفظ النسخة السابقة"""
         try:
-            # إنشاء مسار الملف
-            year_dir = Path('archive') / str(year)
-            month_dir = year_dir / f"{month:02d}"
-            month_dir.mkdir(parents=True, exist_ok=True)
-            
-            file_path = month_dir / f"{day:02d}.json"
+            # التعديل يُطبق بعد حفظ الرسالة الأصلية إن كانت ما زالت في الطابور
+            await self.wait_archived()
             
-            # قراءة البيانات الموجودة
-            messages = []
-            if file_path.exists():
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read().strip()
-                        if content:
-                            messages = json.loads(content)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    messages = []
-            
-            # إضافة الرسالة الجديدة
-            messages.append(message_data)
-            
-            # حفظ الملف
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(messages, f, ensure_ascii=False, indent=2)
-                
+            edited_at = (message.edit_date or datetime.now(timezone.utc)).isoformat()
+            row = build_row(message)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تحديث الرسالة المعدلة {message.id}: {e}")
+            return
+        
+        try:
+            await self.apply_edit_row(row, edited_at)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تحديث الرسالة المعدلة {message.id}: {e}")
+            await self.dead_letters.add('edit', {
+                'channel_id': row['channel_id'], 'message_id': row['message_id'],
+                'row': row, 'edited_at': edited_at
+            }, e)
+
+    async def apply_edit_row(self, row: Dict, edited_at: str):
+        """حفظ التعديل في قاعدة البيانات وملفات JSON (يرفع الخطأ عند الفشل)"""
+        updated = await self.storage.write(apply_edit, row, edited_at, self.coverage)
+        if updated:
+            await self.mirror_batch_to_json([updated])
+            logger.info(f"✏️ تم تحديث الرسالة المعدلة: {row['message_id']}")
+
+    async def archive_deletion(self, event):
+        """وضع علامة حذف على الرسائل المحذوفة من القناة"""
+        if event.chat_id is None:
+            return
+        
+        await self.mark_deleted(event.chat_id, list(event.deleted_ids))
+
+    async def backfill_missed(self, channel, channel_id: int, top_message: int):
+        """أرشفة الرسائل الفائتة بالأرشفة الرجعية عندما يكون الفرق أكبر من أن يُجلب بالتحديثات"""
+        last_id = self.coverage.gaps(channel_id, limit=0)['last']
+        if not self.backfill or last_id is None:
+            logger.warning(f"⚠️ لا توجد رسائل مؤرشفة من {channel} - استخدم /archive_day لأرشفة ما فات")
+            return
+        
+        if top_message > last_id:
+            asyncio.create_task(self.backfill.archive_id_range(channel, last_id, top_message))
+
+    async def mark_deleted(self, channel_id: int, message_ids: List[int]):
+        """تعليم رسائل القناة كمحذوفة في قاعدة البيانات وملفات JSON"""
+        await self.wait_archived()
+        
+        deleted_at = datetime.now(timezone.utc).isoformat()
+        try:
+            await self.apply_deletion(channel_id, message_ids, deleted_at)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تسجيل حذف الرسائل {message_ids}: {e}")
+            await self.dead_letters.add('delete', {
+                'channel_id': channel_id, 'message_ids': message_ids, 'deleted_at': deleted_at
+            }, e)
+
+    async def apply_deletion(self, channel_id: int, message_ids: List[int], deleted_at: str):
+        """حفظ علامات الحذف في قاعدة البيانات وملفات JSON (يرفع الخطأ عند الفشل)"""
+        rows = await self.storage.write(apply_deletes, channel_id, message_ids, deleted_at)
+        if rows:
+            await self.mirror_batch_to_json(rows)
+            logger.info(f"🗑️ تم تعليم {len(rows)} رسالة كمحذوفة")
+
+    async def mirror_batch_to_json(self, batch: List[Dict]):
+        """نسخ دفعة محفوظة إلى ملفات JSON اليومية"""
+        days: Dict[tuple, List[Dict]] = {}
+        for row in batch:
+            # مقطع اليوم بتوقيت الأرشيف (نفس أيام التصفح والتصدير)، وread_day يعيد آخر سجل لكل رسالة
+            days.setdefault(row_local_date(row), []).append(json_record(row))
+        
+        await self.seal_closed_segments()
+        for day, messages_data in days.items():
+            await self.save_to_json_file(day.year, day.month, day.day, messages_data)
+
+    async def seal_closed_segments(self):
+        """إغلاق مقاطع الأيام المنتهية بفهرس مع أول دفعة في كل يوم جديد"""
+        today = local_today()
+        if self.sealed_before == today:
+            return
+        self.sealed_before = today
+        try:
+            await self.storage.run_io(seal_closed_days, 'archive', today)
+        except Exception as e:
+            logger.error(f"❌ خطأ في إغلاق مقاطع JSON: {e}")
+
+    async def save_to_json_file(self, year: int, month: int, day: int, messages_data: List[Dict]):
+        """إلحاق مجموعة رسائل بمقطع JSONL اليومي"""
+        payload = {'year': year, 'month': month, 'day': day, 'records': messages_data}
+        try:
+            await self.write_json_records(payload)
         except Exception as e:
             logger.error(f"❌ خطأ في حفظ ملف JSON: {e}")
+            await self.dead_letters.add('json', payload, e)
+
+    async def write_json_records(self, payload: Dict):
+        """إلحاق سجلات يوم بمقطعه (يرفع الخطأ عند الفشل)"""
+        path = day_path('archive', payload['year'], payload['month'], payload['day'])
+        await self.storage.run_io(append_messages, path, payload['records'])
 
     def is_admin(self, user_id: int) -> bool:
         """التحقق من صلاحيات المدير"""
         return user_id in self.admin_ids
 
+    async def notify_lag(self, stats: Dict):
+        """تنبيه المدراء عند تأخر الأرشفة عن النشر قبل أن يلاحظوا الرسائل الناقصة"""
+        if not self.bot_app:
+            return
+
+        text = (
+            "🐢 **تأخر الأرشفة**\n\n"
+            f"• التأخر عن النشر: `{stats['end_to_end_lag']:.0f}` ثانية\n"
+            f"• الامتلاء: `{stats['depth']:,}/{stats['capacity']:,}` ({stats['overflow']})\n"
+            f"• في ملفات الفائض: `{stats['spilled']:,}`\n"
+        )
+        for admin_id in self.admin_ids:
+            try:
+                await self.bot_app.bot.send_message(admin_id, text, parse_mode='Markdown')
+            except Exception as e:
+                logger.error(f"❌ تعذر إرسال التنبيه إلى {admin_id}: {e}")
+
+    def format_rate_status(self) -> str:
+        """ملخص حاكم معدل الطلبات للعرض في الإحصائيات"""
+        snapshot = self.rate_governor.snapshot()
+        if not snapshot:
+            return ""
+        
+        text = "\n⏱️ **معدل الطلبات:**\n"
+        for method, stats in snapshot.items():
+            text += (
+                f"• {method}: `{stats['rate']:.1f}/ث` "
+                f"(انتظار `{stats['wait']:.1f}ث`، FloodWait: `{stats['flood_waits']}`)\n"
+            )
+        return text
+
+    def format_queue_status(self) -> str:
+        """ملخص طابور الكتابة وتأخر الرسائل المباشرة"""
+        stats = self.write_queue.lag_stats()
+        return (
+            "\n✍️ **طابور الكتابة:**\n"
+            f"• تأخر الرسائل المباشرة: `{stats['live_lag'] * 1000:.0f}ms` (الأقصى `{stats['max_live_lag'] * 1000:.0f}ms`)\n"
+            f"• زمن الحفظ p50/p95: `{stats['live_commit_p50'] * 1000:.0f}/{stats['live_commit_p95'] * 1000:.0f}ms` مباشرة، "
+            f"p95 `{stats['backfill_commit_p95'] * 1000:.0f}ms` أرشفة رجعية\n"
+            f"• التأخر عن النشر: `{stats['end_to_end_lag']:.1f}ث` (p95 `{stats['end_to_end_p95']:.1f}ث`، "
+            f"الأقصى `{stats['max_end_to_end_lag']:.1f}ث`)\n"
+            f"• الامتلاء: `{stats['depth']:,}/{stats['capacity']:,}` ({stats['overflow']})، "
+            f"في ملفات الفائض: `{stats['spilled']:,}`، منتظرون: `{stats['blocked']}`\n"
+            f"• بالانتظار: `{stats['live_pending']}` مباشرة، `{stats['backfill_pending']}` أرشفة رجعية\n"
+            f"• عمليات فاشلة: `{self.dead_letters.added}`، أعيد تنفيذها: `{self.dead_letters.replayed}`\n"
+        )
+
+    def format_media_status(self) -> str:
+        """ملخص تنزيل الوسائط ومساحة المخزن"""
+        if not self.media:
+            return ""
+        
+        stats = self.media.stats()
+        mode = stats['mode'] or "عند الطلب"
+        return (
+            f"\n🖼️ **الوسائط ({mode}):**\n"
+            f"• المخزن: `{stats['total_bytes'] / 1024 ** 2:,.1f}/{stats['budget'] / 1024 ** 2:,.0f} MB`\n"
+            f"• منزلة: `{stats['downloaded']:,}` ({stats['downloaded_bytes'] / 1024 ** 2:,.1f} MB)، "
+            f"مكررة: `{stats['deduplicated']:,}`، مستأنفة: `{stats['resumed']:,}`، بالانتظار: `{stats['pending']}`\n"
+            f"• تخطي: `{stats['skipped']:,}` (الحجم) و`{stats['dropped']:,}` (الطابور)، "
+            f"فشل: `{stats['failed']:,}`، أُخليت: `{stats['evicted']:,}`\n"
+        )
+
+    def format_channel_status(self) -> str:
+        """ملخص عمال القنوات للعرض في الإحصائيات"""
+        channels = self.ingestion.stats()
+        if not channels:
+            return ""
+        
+        requests = self.rate_governor.channel_requests()
+        text = "\n📡 **القنوات:**\n"
+        for stats in channels:
+            text += (
+                f"• {stats['channel']}: `{stats['archived']:,}` مؤرشفة، "
+                f"`{stats['pending']}` بالانتظار، `{stats['errors']}` أخطاء، "
+                f"`{requests.get(stats['channel'], 0):,}` طلب\n"
+            )
+        return text
+
     # معالجات الأوامر
     async def cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """أمر البداية"""
@@ -433,7 +780,7 @@ ADMIN_IDS=123456789,987654321
 • 📤 تصدير واستيراد البيانات
 
 📊 **الحالة الحالية:**
-• القناة المصدر: `{self.source_channel or 'غير محددة'}`
+• القنوات المصدر: `{', '.join(self.source_channels) or 'غير محددة'}`
 • Userbot: {'🟢 متصل' if self.userbot and self.userbot.is_connected() else '🔴 غير متصل'}
 
 اختر من القائمة أدناه للبدء:
@@ -462,11 +809,17 @@ ADMIN_IDS=123456789,987654321
 • `/browse` - تصفح الأرشيف تفاعلياً
 
 **🔍 البحث:**
-• `/search كلمة البحث` - البحث في المحتوى
+• `/search كلمة البحث` - البحث في المحتوى (كلمة* للبحث بالبادئة)
+• `/reindex` - إعادة بناء فهرس البحث
 
 **⚙️ الإدارة:**
-• `/set_channel @channel` - تحديد القناة المصدر
-• `/export YYYY-MM-DD` - تصدير أرشيف يوم
+• `/set_channel @channel [@channel2 ...]` - تحديد القنوات المصدر
+• `/export YYYY-MM-DD [media]` - تصدير أرشيف يوم (مع تنزيل الوسائط الناقصة)
+• `/sweep [YYYY-MM-DD] [YYYY-MM-DD]` - مراجعة الأرشيف وتحديث الرسائل المعدلة والمحذوفة
+• `/gaps [@channel]` - عرض نطاقات المعرفات المفقودة من الأرشيف
+• `/media MESSAGE_ID [@channel]` - إرسال وسائط رسالة مؤرشفة (الصورة المصغرة ثم الملف)
+• `/files TYPE [YYYY-MM]` - أكبر الملفات حسب النوع (video، voice...) أو الامتداد (pdf) أو MIME
+• `/dead_letters [show|replay|drop] [id]` - عرض العمليات الفاشلة وإعادة تنفيذها
 
 **💡 نصائح:**
 - استخدم الأزرار التفاعلية للتنقل السهل
@@ -484,28 +837,14 @@ ADMIN_IDS=123456789,987654321
         if not self.is_admin(update.effective_user.id):
             return
         
-        try:
-            cursor = self.conn.cursor()
+        def collect_stats(conn):
+            cursor = conn.cursor()
             
-            # إجمالي الرسائل
-            cursor.execute("SELECT COUNT(*) FROM archived_messages")
-            total_messages = cursor.fetchone()[0]
-            
-            # رسائل اليوم
-            today = datetime.now().date()
-            cursor.execute(
-                "SELECT COUNT(*) FROM archived_messages WHERE date LIKE ?",
-                (f"{today}%",)
-            )
-            today_messages = cursor.fetchone()[0]
-            
-            # رسائل هذا الشهر
-            this_month = today.strftime("%Y-%m")
-            cursor.execute(
-                "SELECT COUNT(*) FROM archived_messages WHERE date LIKE ?",
-                (f"{this_month}%",)
-            )
-            month_messages = cursor.fetchone()[0]
+            # إجمالي الرسائل ورسائل اليوم والشهر بتوقيت الأرشيف (من العدادات اليومية)
+            today = local_today()
+            total_messages = count_messages(conn)
+            today_messages = count_messages(conn, today.year, today.month, today.day)
+            month_messages = count_messages(conn, today.year, today.month)
             
             # أحدث رسالة
             cursor.execute(
@@ -517,6 +856,12 @@ ADMIN_IDS=123456789,987654321
             # حجم قاعدة البيانات
             db_size = Path('archive.db').stat().st_size / (1024 * 1024)  # MB
             
+            return total_messages, today_messages, month_messages, latest_date, db_size
+        
+        try:
+            total_messages, today_messages, month_messages, latest_date, db_size = \
+                await self.storage.read(collect_stats)
+            
             status_text = f"""
 📊 **إحصائيات الأرشيف:**
 
@@ -530,11 +875,15 @@ ADMIN_IDS=123456789,987654321
 • وقت التحديث: `{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`
 
 ⚙️ **النظام:**
-• القناة المصدر: `{self.source_channel or 'غير محددة'}`
+• القنوات المصدر: `{', '.join(self.source_channels) or 'غير محددة'}`
 • حجم قاعدة البيانات: `{db_size:.2f} MB`
 • Userbot: {'🟢 متصل' if self.userbot and self.userbot.is_connected() else '🔴 غير متصل'}
 • Bot: {'🟢 يعمل' if self.is_running else '🔴 متوقف'}
             """
+            status_text += self.format_queue_status()
+            status_text += self.format_media_status()
+            status_text += self.format_channel_status()
+            status_text += self.format_rate_status()
             
             await update.message.reply_text(status_text, parse_mode='Markdown')
             
@@ -547,20 +896,14 @@ ADMIN_IDS=123456789,987654321
             return
         
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT DISTINCT year FROM archived_messages ORDER BY year DESC")
-            years = [row[0] for row in cursor.fetchall()]
+            year_counts = await self.storage.read(count_years)
             
-            if not years:
+            if not year_counts:
                 await update.message.reply_text("📭 لا توجد رسائل مؤرشفة بعد")
                 return
             
             keyboard = []
-            for year in years:
-                cursor.execute(
-                    "SELECT COUNT(*) FROM archived_messages WHERE year = ?", (year,)
-                )
-                count = cursor.fetchone()[0]
+            for year, count in year_counts:
                 keyboard.append([
                     InlineKeyboardButton(
                         f"📅 {year} ({count:,} رسالة)",
@@ -593,37 +936,47 @@ ADMIN_IDS=123456789,987654321
         search_term = " ".join(context.args)
         
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                """SELECT message_id, date, content, media_type 
-                   FROM archived_messages 
-                   WHERE content LIKE ? 
-                   ORDER BY date DESC LIMIT 20""",
-                (f"%{search_term}%",)
-            )
-            results = cursor.fetchall()
+            total = await self.search_index.count(search_term)
+            results = await self.search_index.search(search_term, limit=10)
+            progress = await self.search_index.progress()
+            
+            building = f"\n⏳ فهرس البحث قيد البناء ({progress:.0%}) - النتائج جزئية" if progress is not None else ""
             
             if not results:
-                await update.message.reply_text(f"❌ لم يتم العثور على نتائج لـ: **{search_term}**", parse_mode='Markdown')
+                await update.message.reply_text(f"❌ لم يتم العثور على نتائج لـ: **{search_term}**{building}", parse_mode='Markdown')
                 return
             
             response = f"🔍 **نتائج البحث عن:** `{search_term}`\n\n"
             
-            for i, (msg_id, date, content, media_type) in enumerate(results[:10], 1):
-                preview = content[:100] + "..." if len(content) > 100 else content
-                media_icon = {"photo": "🖼️", "video": "🎥", "document": "📄", "audio": "🎵"}.get(media_type, "💬")
+            for i, result in enumerate(results, 1):
+                media_icon = MEDIA_ICONS.get(result['media_type'], "💬")
+                mark = " 🗑️" if result['deleted_at'] else ""
                 
-                response += f"{i}. {media_icon} **{date[:10]}**\n"
-                response += f"   `{preview}`\n\n"
+                response += f"{i}. {media_icon} **{result['date'][:10]}** • #{result['message_id']}{mark}\n"
+                response += f"   `{result['snippet']}`\n\n"
             
-            if len(results) > 10:
-                response += f"... و {len(results) - 10} نتيجة أخرى"
+            if total > len(results):
+                response += f"... و {total - len(results)} نتيجة أخرى"
+            response += building
             
             await update.message.reply_text(response, parse_mode='Markdown')
             
         except Exception as e:
             await update.message.reply_text(f"❌ خطأ في البحث: {e}")
 
+    async def cmd_reindex(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """إعادة بناء فهرس البحث من الأرشيف"""
+        if not self.is_admin(update.effective_user.id):
+            return
+        
+        if self.search_index.is_building:
+            progress = await self.search_index.progress()
+            await update.message.reply_text(f"⏳ فهرس البحث قيد البناء بالفعل ({(progress or 1):.0%})")
+            return
+        
+        await self.search_index.reindex()
+        await update.message.reply_text("🔎 جاري إعادة بناء فهرس البحث في الخلفية (البحث يعطي نتائج جزئية حتى يكتمل)")
+
     async def cmd_archive_today(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """أرشفة منشورات اليوم"""
         if not self.is_admin(update.effective_user.id):
@@ -633,14 +986,14 @@ ADMIN_IDS=123456789,987654321
             await update.message.reply_text("❌ Userbot غير متصل")
             return
         
-        if not self.source_channel:
+        if not self.source_channels:
             await update.message.reply_text("❌ لم يتم تحديد القناة المصدر. استخدم `/set_channel @channel`")
             return
         
         await update.message.reply_text("🔄 جاري أرشفة منشورات اليوم...")
         
         try:
-            today = datetime.now().date()
+            today = local_today()
             count = await self.archive_date_range(today, today)
             await update.message.reply_text(f"✅ تم أرشفة **{count}** رسالة من اليوم", parse_mode='Markdown')
         except Exception as e:
@@ -672,64 +1025,433 @@ ADMIN_IDS=123456789,987654321
         except Exception as e:
             await update.message.reply_text(f"❌ خطأ في الأرشفة: {e}")
 
-    async def archive_date_range(self, start_date, end_date) -> int:
-        """أرشفة نطاق من التواريخ"""
-        if not self.userbot or not self.source_channel:
+    async def archive_date_range(self, start_date, end_date, channels: Optional[List[str]] = None) -> int:
+        """أرشفة نطاق من التواريخ لجميع القنوات المصدر بالتوازي عبر محرك الأرشفة"""
+        channels = channels or self.source_channels
+        if not self.userbot or not self.backfill or not channels:
             return 0
         
+        results = await asyncio.gather(*[
+            self.backfill.archive_date_range(channel, start_date, end_date)
+            for channel in channels
+        ], return_exceptions=True)
+        
         count = 0
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ خطأ في أرشفة النطاق للقناة {channel}: {result}")
+            else:
+                count += result
+        
+        await self.finalize_backfill(start_date, end_date)
+        return count
+
+    async def wait_archived(self):
+        """انتظار حفظ كل ما أُرسل للأرشفة (قبل تقديم نقاط الاستئناف)"""
+        await self.albums.flush()
+        await self.write_queue.wait_committed()
+
+    async def resume_backfill_jobs(self):
+        """استئناف مهام الأرشفة غير المكتملة من نقاط الاستئناف المحفوظة"""
         try:
-            async for message in self.userbot.iter_messages(
-                self.source_channel,
-                offset_date=end_date + timedelta(days=1),
-                reverse=True
-            ):
-                if message.date.date() < start_date:
-                    break
-                if message.date.date() <= end_date:
-                    await self.archive_message(message)
-                    count += 1
-                    
-                    # تحديث كل 100 رسالة
-                    if count % 100 == 0:
-                        logger.info(f"📊 تم أرشفة {count} رسالة...")
-                        
+            jobs = await self.checkpoints.unfinished_jobs()
         except Exception as e:
-            logger.error(f"❌ خطأ في أرشفة النطاق: {e}")
+            logger.error(f"❌ خطأ في قراءة مهام الأرشفة المتوقفة: {e}")
+            return
         
-        return count
+        for job in jobs:
+            try:
+                logger.info(f"↩️ استئناف مهمة الأرشفة: {job['job_id']} ({job['archived_count']:,} رسالة سابقاً)")
+                count = await self.backfill.resume_job(job)
+                start_date = datetime.strptime(job['start_date'], "%Y-%m-%d").date() if job['start_date'] else None
+                end_date = datetime.strptime(job['end_date'], "%Y-%m-%d").date() if job['end_date'] else None
+                await self.finalize_backfill(start_date, end_date)
+                logger.info(f"✅ تم استئناف المهمة {job['job_id']} - {count:,} رسالة إضافية")
+            except Exception as e:
+                logger.error(f"❌ خطأ في استئناف المهمة {job['job_id']}: {e}")
 
-    async def cmd_set_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """تحديد القناة المصدر"""
+    async def finalize_backfill(self, start_date, end_date):
+        """انتظار حفظ الرسائل وإغلاق مقاطع الأيام المكتملة"""
+        # انتظار حفظ جميع الرسائل المضافة للطابور (بما فيها الألبومات المفتوحة)
+        await self.albums.flush()
+        await self.write_queue.flush()
+        
+        if start_date is None or end_date is None:
+            return
+        
+        # إغلاق مقاطع الأيام المكتملة بفهرس
+        today = local_today()
+        current = start_date
+        while current <= end_date and current < today:
+            await self.storage.run_io(seal_segment, day_path('archive', current.year, current.month, current.day))
+            current += timedelta(days=1)
+
+    async def cmd_sweep(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """مراجعة الرسائل المؤرشفة وتحديث المعدلة والمحذوفة"""
+        if not self.is_admin(update.effective_user.id):
+            return
+        
+        if not self.userbot or not self.userbot.is_connected() or not self.sweeper:
+            await update.message.reply_text("❌ Userbot غير متصل")
+            return
+        
+        if self.sweep_task and not self.sweep_task.done():
+            await update.message.reply_text("⏳ توجد مراجعة قيد التشغيل بالفعل")
+            return
+        
+        try:
+            dates = [datetime.strptime(arg, "%Y-%m-%d").date() for arg in context.args[:2]]
+        except ValueError:
+            await update.message.reply_text("❌ تنسيق التاريخ غير صحيح. استخدم: **YYYY-MM-DD**", parse_mode='Markdown')
+            return
+        
+        start_date = dates[0] if dates else None
+        end_date = dates[-1] if dates else None
+        period = f"{start_date} → {end_date}" if dates else "كامل الأرشيف"
+        
+        await update.message.reply_text(f"🔍 جاري مراجعة الرسائل المؤرشفة ({period})...")
+        
+        # المراجعة قد تستغرق ساعات - تعمل في الخلفية وترسل النتيجة عند الانتهاء
+        self.sweep_task = asyncio.create_task(self.run_sweep(update, start_date, end_date))
+
+    async def run_sweep(self, update: Update, start_date, end_date):
+        """تشغيل المراجعة لجميع القنوات وإرسال ملخص النتائج"""
+        totals = {'checked': 0, 'changed': 0, 'deleted': 0, 'requests': 0}
+        for channel in self.source_channels:
+            try:
+                stats = await self.sweeper.sweep(channel, start_date, end_date)
+                for key in totals:
+                    totals[key] += stats[key]
+            except Exception as e:
+                logger.error(f"❌ خطأ في مراجعة القناة {channel}: {e}")
+        
+        await self.wait_archived()
+        await update.message.reply_text(
+            f"✅ **اكتملت المراجعة**\n\n"
+            f"🔍 تمت مراجعة: `{totals['checked']:,}` رسالة\n"
+            f"✏️ معدلة: `{totals['changed']:,}`\n"
+            f"🗑️ محذوفة: `{totals['deleted']:,}`\n"
+            f"📡 الطلبات: `{totals['requests']:,}`",
+            parse_mode='Markdown'
+        )
+
+    async def cmd_gaps(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """عرض نطاقات المعرفات المفقودة بين أول وآخر رسالة مؤرشفة لكل قناة"""
+        if not self.is_admin(update.effective_user.id):
+            return
+        
+        channels = await self.resolve_coverage_channels(context.args or self.source_channels)
+        if not channels:
+            await update.message.reply_text("📭 لا توجد رسائل مؤرشفة بعد")
+            return
+        
+        text = "🕳️ **فجوات الأرشيف**\n"
+        for name, channel_id in channels:
+            gaps = self.coverage.gaps(channel_id)
+            text += f"\n📢 **{name}**\n"
+            if not gaps['covered']:
+                text += "• لا توجد رسائل مؤرشفة\n"
+                continue
+            
+            text += (
+                f"• المعرفات: `{gaps['first']}` → `{gaps['last']}`\n"
+                f"• المؤرشفة: `{gaps['covered']:,}`\n"
+                f"• المفقودة: `{gaps['missing']:,}` في `{gaps['gaps']:,}` فجوة\n"
+            )
+            for start, end in gaps['ranges']:
+                text += f"  ◦ `{start}`" + (f" → `{end}` ({end - start + 1:,})\n" if end > start else "\n")
+            if gaps['gaps'] > len(gaps['ranges']):
+                text += f"  ◦ ... و {gaps['gaps'] - len(gaps['ranges']):,} فجوة أخرى\n"
+        
+        await update.message.reply_text(text, parse_mode='Markdown')
+
+    async def cmd_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """إرسال وسائط رسالة مؤرشفة: الصورة المصغرة فوراً ثم الملف الكامل"""
+        if not self.is_admin(update.effective_user.id):
+            return
+        
+        if not context.args or not context.args[0].isdigit():
+            await update.message.reply_text(
+                "🖼️ **استخدم:** `/media MESSAGE_ID [@channel]`\n"
+                "**مثال:** `/media 1234 @channel`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        message_id = int(context.args[0])
+        if len(context.args) > 1:
+            channel_ids = [channel_id for _, channel_id in await self.resolve_coverage_channels(context.args[1:2])]
+        else:
+            rows = await self.storage.fetchall(
+                "SELECT channel_id FROM archived_messages WHERE message_id = ? AND file_id IS NOT NULL",
+                (message_id,)
+            )
+            channel_ids = [row[0] for row in rows]
+        
+        if len(channel_ids) > 1:
+            await update.message.reply_text("⚠️ المعرف موجود في أكثر من قناة - حدد القناة: `/media ID @channel`", parse_mode='Markdown')
+            return
+        if not channel_ids:
+            await update.message.reply_text("❌ لا توجد وسائط مؤرشفة بهذا المعرف")
+            return
+        
+        await self.send_media(update.message, channel_ids[0], message_id)
+
+    async def cmd_files(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """أكبر الملفات المؤرشفة حسب نوع الوسائط أو نوع MIME (مع شهر اختياري)"""
         if not self.is_admin(update.effective_user.id):
             return
         
         if not context.args:
+            await update.message.reply_text(
+                "📂 **استخدم:** `/files TYPE [YYYY-MM]`\n"
+                f"**الأنواع:** {', '.join(f'`{name}`' for name in MEDIA_ICONS)}\n"
+                "**أو امتداد/MIME:** `pdf`، `application/zip`\n"
+                "**مثال:** `/files video 2025-05`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        kind = context.args[0].lower()
+        if kind in MEDIA_ICONS:
+            column, value = 'media_type', kind
+        else:
+            column, value = 'mime_type', kind if '/' in kind else mimetypes.guess_type(f"file.{kind}")[0]
+            if value is None:
+                await update.message.reply_text(f"❌ نوع غير معروف: `{kind}`", parse_mode='Markdown')
+                return
+        
+        year = month = None
+        if len(context.args) > 1:
+            try:
+                period = datetime.strptime(context.args[1], "%Y-%m")
+                year, month = period.year, period.month
+            except ValueError:
+                await update.message.reply_text("❌ تنسيق الشهر غير صحيح. استخدم: **YYYY-MM**", parse_mode='Markdown')
+                return
+        
+        count, total_size, rows = await self.storage.read(self._query_files, column, value, year, month)
+        period = f" ({year}-{month:02d})" if year else ""
+        if not count:
+            await update.message.reply_text(f"📭 لا توجد ملفات `{value}`{period}", parse_mode='Markdown')
+            return
+        
+        text = (
+            f"📂 **ملفات {value}{period}**\n"
+            f"• العدد: `{count:,}`، الحجم: `{(total_size or 0) / 1024 ** 2:,.1f} MB`\n\n"
+        )
+        for i, (message_id, msg_date, media_type, file_name, media_size, duration, title, deleted_at) in enumerate(rows, 1):
+            name = file_name or title or media_type
+            details = f"{(media_size or 0) / 1024 ** 2:,.1f} MB"
+            if duration:
+                details += f"، {int(duration) // 60}:{int(duration) % 60:02d}"
+            text += f"{i}. {MEDIA_ICONS.get(media_type, '📎')} `{name}` - {details} - {msg_date} - `/media {message_id}`"
+            text += " 🗑️\n" if deleted_at else "\n"
+        if count > len(rows):
+            text += f"\n... (عرض أكبر {len(rows)} ملف)"
+        
+        await update.message.reply_text(text, parse_mode='Markdown')
+
+    @staticmethod
+    def _query_files(conn, column: str, value: str, year: Optional[int], month: Optional[int], limit: int = 20) -> tuple:
+        """(العدد، مجموع الأحجام، أكبر الملفات) لنوع وسائط أو نوع MIME (عبر فهارس الحجم)"""
+        where = f"{column} = ?"
+        params = [value]
+        if year:
+            # الشهر بأيام توقيت الأرشيف
+            where += " AND local_date >= ? AND local_date < ?"
+            params += list(month_bounds(year, month))
+        
+        count, total_size = conn.execute(
+            f"SELECT COUNT(*), SUM(media_size) FROM archived_messages WHERE {where}", params
+        ).fetchone()
+        rows = conn.execute(
+            # اليوم بتوقيت الأرشيف كما في فلتر الشهر (الصفوف غير المرحّلة بعد تعرض يوم UTC)
+            f"""SELECT message_id, COALESCE(local_date, substr(date, 1, 10)), media_type, file_name,
+                       media_size, duration, title, deleted_at
+                FROM archived_messages WHERE {where} ORDER BY media_size DESC LIMIT ?""",
+            params + [limit]
+        ).fetchall()
+        return count, total_size, rows
+
+    async def send_media(self, target, channel_id: int, message_id: int):
+        """إرسال الصورة المصغرة المخزنة ثم الملف الكامل (يُنزل عند أول طلب) ردّاً على target"""
+        row = await self.storage.fetchone(
+            f"""SELECT media_type, file_name, file_id, {', '.join(MEDIA_COLUMNS)} FROM archived_messages
+               WHERE channel_id = ? AND message_id = ?""",
+            (channel_id, message_id)
+        )
+        if not row or not row[0]:
+            await target.reply_text("❌ لا توجد وسائط مؤرشفة لهذه الرسالة")
+            return
+        
+        caption = format_media_caption(row[0], row[1], dict(zip(MEDIA_COLUMNS, row[3:])))
+        if not row[2]:
+            # الاستطلاع ومعاينة الصفحة بلا ملف
+            await target.reply_text(caption, parse_mode='Markdown')
+            return
+        if not self.media:
+            await target.reply_text(f"{caption}\n\n❌ Userbot غير متصل - لا يمكن تنزيل الوسائط", parse_mode='Markdown')
+            return
+        
+        cached = await self.media.cached(channel_id, message_id)
+        if cached['thumb_path'] and not cached['path']:
+            thumb = await self.storage.run_io(Path(cached['thumb_path']).read_bytes)
+            await target.reply_photo(photo=thumb, caption=caption, parse_mode='Markdown')
+        else:
+            await target.reply_text(caption, parse_mode='Markdown')
+        
+        path = cached['path']
+        if path is None:
+            if not self.userbot or not self.userbot.is_connected():
+                await target.reply_text("❌ Userbot غير متصل - لا يمكن تنزيل الملف الكامل")
+                return
+            
+            message = await self.userbot.get_messages(channel_id, ids=message_id)
+            if not message or not message.media:
+                await target.reply_text("🗑️ الرسالة أو وسائطها لم تعد موجودة في القناة")
+                return
+            
+            status = await target.reply_text("⏬ جاري تنزيل الملف الكامل...")
+            path = await self.media.fetch(message)
+            if path is None:
+                await status.edit_text(f"⏭️ الملف أكبر من حد التنزيل ({self.media_max_file_mb:,.0f} MB)")
+                return
+            await status.delete()
+        
+        size = await self.storage.run_io(os.path.getsize, path)
+        if size > BOT_UPLOAD_LIMIT:
+            await target.reply_text(
+                f"📦 الملف أكبر من حد إرسال البوت ({size / 1024 ** 2:,.1f} MB) - محفوظ في:\n`{path}`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        # قراءة الملف (حتى حد الإرسال) خارج حلقة الأحداث
+        data = await self.storage.run_io(Path(path).read_bytes)
+        await target.reply_document(document=data, filename=row[1] or os.path.basename(path))
+
+    async def cmd_dead_letters(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """عرض العمليات الفاشلة وإعادة تنفيذها أو حذفها"""
+        if not self.is_admin(update.effective_user.id):
+            return
+        
+        action = context.args[0] if context.args else 'list'
+        entry_id = int(context.args[1]) if len(context.args) > 1 and context.args[1].isdigit() else None
+        
+        if action == 'replay':
+            await update.message.reply_text("♻️ جاري إعادة تنفيذ العمليات الفاشلة...")
+            succeeded, failed = await self.dead_letters.replay(entry_id)
+            await update.message.reply_text(
+                f"✅ **اكتملت إعادة التنفيذ**\n\n• نجحت: `{succeeded}`\n• فشلت: `{failed}`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if action in ('show', 'drop'):
+            if entry_id is None:
+                await update.message.reply_text(f"📮 **استخدم:** `/dead_letters {action} رقم_العملية`", parse_mode='Markdown')
+                return
+            
+            entry = await self.dead_letters.get(entry_id)
+            if not entry:
+                await update.message.reply_text(f"❌ العملية `{entry_id}` غير موجودة", parse_mode='Markdown')
+                return
+            
+            if action == 'drop':
+                await self.dead_letters.drop(entry_id)
+                await update.message.reply_text(f"🗑️ تم حذف العملية `{entry_id}`", parse_mode='Markdown')
+                return
+            
+            payload = entry['payload']
+            if len(payload) > 1500:
+                payload = payload[:1500] + '...'
+            await update.message.reply_text(
+                f"📮 **العملية #{entry['id']}** ({entry['kind']})\n\n"
+                f"• الحالة: `{entry['status']}`\n"
+                f"• المحاولات: `{entry['attempts']}`\n"
+                f"• التاريخ: `{entry['created_at']}`\n"
+                f"• الخطأ: `{entry['error']}`\n\n"
+                f"```\n{payload}\n```",
+                parse_mode='Markdown'
+            )
+            return
+        
+        counts = await self.dead_letters.counts()
+        entries = await self.dead_letters.list(15)
+        if not entries:
+            await update.message.reply_text("✅ لا توجد عمليات فاشلة")
+            return
+        
+        text = (
+            "📮 **العمليات الفاشلة**\n\n"
+            f"• بانتظار إعادة المحاولة: `{counts.get('pending', 0)}`\n"
+            f"• استنفدت المحاولات: `{counts.get('failed', 0)}`\n\n"
+        )
+        for entry in entries:
+            icon = "⏳" if entry['status'] == 'pending' else "❌"
+            target = f" `{entry['channel_id']}:{entry['message_id']}`" if entry['message_id'] else ""
+            error = (entry['error'] or '')[:80]
+            text += f"{icon} `#{entry['id']}` {entry['kind']}{target} - `{entry['attempts']}` محاولة\n   `{error}`\n"
+        
+        text += "\n💡 `/dead_letters show ID` | `/dead_letters replay [ID]` | `/dead_letters drop ID`"
+        await update.message.reply_text(text, parse_mode='Markdown')
+
+    async def resolve_coverage_channels(self, channels: List[str]) -> List[tuple]:
+        """(اسم القناة، معرفها الرقمي) للقنوات المطلوبة، أو جميع القنوات المؤرشفة إن تعذر التحديد"""
+        known = {name: chat_id for chat_id, name in self.ingestion.chat_ids.items()}
+        resolved = []
+        for channel in channels:
+            channel_id = known.get(channel)
+            if channel_id is None and self.userbot and self.userbot.is_connected():
+                try:
+                    channel_id = await self.userbot.get_peer_id(channel)
+                except Exception as e:
+                    logger.error(f"❌ تعذر الوصول إلى القناة {channel}: {e}")
+            if channel_id is not None:
+                resolved.append((channel, channel_id))
+        
+        if not resolved:
+            resolved = [(str(channel_id), channel_id) for channel_id in self.coverage.channels]
+        return resolved
+
+    async def cmd_set_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """تحديد القنوات المصدر"""
+        if not self.is_admin(update.effective_user.id):
+            return
+        
+        # وسائط مثل "," فقط لا تحتوي على أي قناة
+        channels = parse_channels(' '.join(context.args or []))
+        if not channels:
             await update.message.reply_text(
                 "📢 **استخدم:** `/set_channel @channel_username`\n"
                 "**أو:** `/set_channel channel_id`\n"
+                "**لعدة قنوات:** `/set_channel @channel1 @channel2`\n"
                 "**مثال:** `/set_channel @my_channel`",
                 parse_mode='Markdown'
             )
             return
         
-        channel = context.args[0]
-        self.source_channel = channel
+        self.source_channels = channels
+        self.source_channel = channels[0]
         
         # حفظ في قاعدة البيانات
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-                ("source_channel", channel)
-            )
-            self.conn.commit()
+            def save_channels(conn):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [("source_channel", channels[0]), ("source_channels", ','.join(channels))]
+                )
+                conn.commit()
+            
+            await self.storage.write(save_channels)
             
-            await update.message.reply_text(f"✅ تم تحديد القناة المصدر: **{channel}**", parse_mode='Markdown')
+            await update.message.reply_text(f"✅ تم تحديد القنوات المصدر: **{', '.join(channels)}**", parse_mode='Markdown')
             
             # إعادة تشغيل مراقب الرسائل
             if self.userbot and self.userbot.is_connected():
                 await update.message.reply_text("🔄 جاري إعادة تشغيل مراقب الرسائل...")
+                await self.watch_channels()
                 
         except Exception as e:
             await update.message.reply_text(f"❌ خطأ في حفظ الإعدادات: {e}")
@@ -741,8 +1463,9 @@ ADMIN_IDS=123456789,987654321
         
         if not context.args:
             await update.message.reply_text(
-                "📤 **استخدم:** `/export YYYY-MM-DD`\n"
-                "**مثال:** `/export 2025-05-29`",
+                "📤 **استخدم:** `/export YYYY-MM-DD [media]`\n"
+                "**مثال:** `/export 2025-05-29`\n"
+                "`media` يُنزل الوسائط غير المخزنة ويضيف مساراتها للملف",
                 parse_mode='Markdown'
             )
             return
@@ -750,61 +1473,92 @@ ADMIN_IDS=123456789,987654321
         try:
             date_str = context.args[0]
             target_date = datetime.strptime(date_str, "%Y-%m-%d")
+            with_media = 'media' in context.args[1:]
             
-            # جلب رسائل اليوم
-            cursor = self.conn.cursor()
-            cursor.execute(
-                """SELECT * FROM archived_messages 
-                   WHERE date LIKE ? 
-                   ORDER BY date""",
-                (f"{date_str}%",)
+            # جلب رسائل اليوم (بتوقيت الأرشيف) كنطاق [بداية اليوم، بداية اليوم التالي) على date_ts
+            where, params = await self.storage.read(range_filter, *day_bounds(target_date.date()))
+            rows = await self.storage.fetchall(
+                f"""SELECT message_id, channel_id, date, content, media_type, file_id, file_name, grouped_id,
+                          edited_at, deleted_at, {', '.join(MEDIA_COLUMNS)}
+                   FROM archived_messages 
+                   WHERE {where} 
+                   ORDER BY date, message_id""",
+                params
             )
             
-            rows = cursor.fetchall()
-            
-            if not rows:
+            # بدون صفوف في قاعدة البيانات (مثلاً قاعدة جديدة) يُصدر اليوم من ملفات JSON القديمة والمقاطع
+            mirrored = [] if rows else await self.storage.run_io(
+                read_day, 'archive', target_date.year, target_date.month, target_date.day
+            )
+            if not rows and not mirrored:
                 await update.message.reply_text(f"❌ لا توجد رسائل في **{date_str}**", parse_mode='Markdown')
                 return
             
+            # النسخ السابقة للرسائل المعدلة
+            edited = [(row[1], row[0]) for row in rows if row[8]]
+            revisions = await self.storage.read(self._query_revisions, edited) if edited else {}
+            
+            # مسارات الوسائط المخزنة (والناقصة تُنزل عند طلبها)
+            media_keys = [(row[1], row[0]) for row in rows if row[4]]
+            media_paths = {}
+            if self.media and media_keys:
+                if with_media:
+                    await update.message.reply_text(f"⏬ جاري تجهيز وسائط {len(media_keys):,} رسالة...")
+                    await self.fetch_missing_media(media_keys)
+                media_paths = await self.media.cached_many(media_keys)
+            
             # تحضير البيانات
             messages = []
             for row in rows:
-                messages.append({
-                    'message_id': row[1],
-                    'channel_id': row[2],
-                    'date': row[3],
-                    'content': row[6],
-                    'media_type': row[7],
-                    'file_id': row[8],
-                    'file_name': row[9]
-                })
+                message = {
+                    'message_id': row[0],
+                    'channel_id': row[1],
+                    'date': row[2],
+                    'content': row[3],
+                    'media_type': row[4],
+                    'file_id': row[5],
+                    'file_name': row[6],
+                    'grouped_id': row[7]
+                }
+                if row[8]:
+                    message['edited_at'] = row[8]
+                    message['revisions'] = revisions.get((row[1], row[0]), [])
+                if row[9]:
+                    message['deleted_at'] = row[9]
+                message.update({key: value for key, value in zip(MEDIA_COLUMNS, row[10:]) if value is not None})
+                paths = media_paths.get((row[1], row[0]), {})
+                if paths.get('path'):
+                    message['media_path'] = paths['path']
+                if paths.get('thumb_path'):
+                    message['thumb_path'] = paths['thumb_path']
+                messages.append(message)
+            messages.extend(mirrored)
+            
+            # أجزاء الألبوم تُصدر كعنصر واحد
+            items = group_items(messages)
             
             # إنشاء ملف JSON
             export_data = {
                 'date': date_str,
                 'total_messages': len(messages),
+                'total_items': len(items),
                 'exported_at': datetime.now().isoformat(),
                 'source_channel': self.source_channel,
-                'messages': messages
+                'source_channels': self.source_channels,
+                'messages': items
             }
             
-            # حفظ في مجلد التصدير
-            exports_dir = Path('exports')
-            exports_dir.mkdir(exist_ok=True)
-            
-            filename = exports_dir / f"archive_{date_str}.json"
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
+            # حفظ في مجلد التصدير (خارج حلقة الأحداث)
+            filename = Path('exports') / f"archive_{date_str}.json"
+            payload = await self.storage.run_io(self._write_export_file, filename, export_data)
             
             # إرسال الملف
-            with open(filename, 'rb') as f:
-                await update.message.reply_document(
-                    document=f,
-                    filename=f"archive_{date_str}.json",
-                    caption=f"📤 **أرشيف {date_str}**\n📊 **{len(messages)}** رسالة",
-                    parse_mode='Markdown'
-                )
+            await update.message.reply_document(
+                document=payload,
+                filename=f"archive_{date_str}.json",
+                caption=f"📤 **أرشيف {date_str}**\n📊 **{len(messages)}** رسالة",
+                parse_mode='Markdown'
+            )
             
             logger.info(f"📤 تم تصدير أرشيف {date_str} - {len(messages)} رسالة")
             
@@ -813,6 +1567,41 @@ ADMIN_IDS=123456789,987654321
         except Exception as e:
             await update.message.reply_text(f"❌ خطأ في التصدير: {e}")
 
+    async def fetch_missing_media(self, keys: List[tuple]):
+        """تنزيل وسائط الرسائل (channel_id, message_id) غير المخزنة على القرص"""
+        if not self.userbot or not self.userbot.is_connected():
+            return
+        
+        cached = await self.media.cached_many(keys)
+        missing: Dict[int, List[int]] = {}
+        for channel_id, message_id in keys:
+            if not cached.get((channel_id, message_id), {}).get('path'):
+                missing.setdefault(channel_id, []).append(message_id)
+        
+        for channel_id, message_ids in missing.items():
+            for i in range(0, len(message_ids), 100):
+                messages = await self.userbot.get_messages(channel_id, ids=message_ids[i:i + 100])
+                for message in messages:
+                    if not message or not message.media:
+                        continue
+                    try:
+                        await self.media.fetch(message)
+                    except Exception as e:
+                        logger.error(f"❌ خطأ في تنزيل وسائط الرسالة {message.id}: {e}")
+
+    @staticmethod
+    def _write_export_file(filename: Path, export_data: dict) -> bytes:
+        """ترميز ملف التصدير وحفظه على القرص"""
+        payload = json.dumps(export_data, ensure_ascii=False, indent=2).encode('utf-8')
+        filename.parent.mkdir(exist_ok=True)
+        filename.write_bytes(payload)
+        return payload
+
+    @staticmethod
+    def _query_revisions(conn, keys: List[tuple]) -> Dict[tuple, List[Dict]]:
+        """النسخ السابقة لمجموعة رسائل (channel_id, message_id)"""
+        return {key: get_revisions(conn, *key) for key in keys}
+
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالج الأزرار التفاعلية"""
         query = update.callback_query
@@ -841,28 +1630,31 @@ ADMIN_IDS=123456789,987654321
                 parts = data.split("_")
                 year, month, day = int(parts[2]), int(parts[3]), int(parts[4])
                 await self.show_day_messages(query, year, month, day)
+            elif data.startswith("media_"):
+                channel_id, message_id = map(int, data[len("media_"):].rsplit("_", 1))
+                await self.send_media(query.message, channel_id, message_id)
         except Exception as e:
             logger.error(f"❌ خطأ في معالجة الزر: {e}")
             await query.edit_message_text(f"❌ حدث خطأ: {e}")
 
     async def show_status_callback(self, query):
         """عرض الإحصائيات عبر الزر"""
-        try:
-            cursor = self.conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) FROM archived_messages")
-            total = cursor.fetchone()[0]
+        def collect_stats(conn):
+            today = local_today()
+            total = count_messages(conn)
+            today_count = count_messages(conn, today.year, today.month, today.day)
             
-            today = datetime.now().date()
-            cursor.execute("SELECT COUNT(*) FROM archived_messages WHERE date LIKE ?", (f"{today}%",))
-            today_count = cursor.fetchone()[0]
+            return total, today_count
+        
+        try:
+            total, today_count = await self.storage.read(collect_stats)
             
             status_text = f"""
 📊 **إحصائيات سريعة:**
 
 📈 إجمالي الرسائل: `{total:,}`
 📅 رسائل اليوم: `{today_count:,}`
-📂 القناة: `{self.source_channel or 'غير محددة'}`
+📂 القنوات: `{', '.join(self.source_channels) or 'غير محددة'}`
 🤖 الحالة: {'🟢 يعمل' if self.is_running else '🔴 متوقف'}
 
 🕐 آخر تحديث: `{datetime.now().strftime('%H:%M:%S')}`
@@ -879,18 +1671,14 @@ ADMIN_IDS=123456789,987654321
     async def show_browse_callback(self, query):
         """عرض قائمة السنوات"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT DISTINCT year FROM archived_messages ORDER BY year DESC")
-            years = [row[0] for row in cursor.fetchall()]
+            year_counts = await self.storage.read(count_years)
             
-            if not years:
+            if not year_counts:
                 await query.edit_message_text("📭 لا توجد رسائل مؤرشفة")
                 return
             
             keyboard = []
-            for year in years:
-                cursor.execute("SELECT COUNT(*) FROM archived_messages WHERE year = ?", (year,))
-                count = cursor.fetchone()[0]
+            for year, count in year_counts:
                 keyboard.append([
                     InlineKeyboardButton(
                         f"📅 {year} ({count:,} رسالة)",
@@ -920,8 +1708,13 @@ ADMIN_IDS=123456789,987654321
 
 **⚙️ الإدارة:**
 • `/status` - الإحصائيات
-• `/set_channel @channel` - تحديد القناة
+• `/set_channel @channel ...` - تحديد القنوات
 • `/export YYYY-MM-DD` - تصدير أرشيف
+• `/sweep` - مراجعة التعديلات والحذف
+• `/gaps` - الفجوات في الأرشيف
+• `/media ID` - وسائط رسالة مؤرشفة
+• `/files video 2025-05` - أكبر الملفات
+• `/dead_letters` - العمليات الفاشلة
 
 💡 **نصيحة:** استخدم الأزرار للتنقل السهل!
         """
@@ -934,12 +1727,7 @@ ADMIN_IDS=123456789,987654321
     async def show_months_callback(self, query, year: int):
         """عرض شهور السنة"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "SELECT DISTINCT month FROM archived_messages WHERE year = ? ORDER BY month",
-                (year,)
-            )
-            months = [row[0] for row in cursor.fetchall()]
+            month_counts = await self.storage.read(count_months, year)
             
             keyboard = []
             month_names = [
@@ -947,12 +1735,7 @@ ADMIN_IDS=123456789,987654321
                 "يوليو", "أغسطس", "سبتمبر", "أكتوبر", "نوفمبر", "ديسمبر"
             ]
             
-            for month in months:
-                cursor.execute(
-                    "SELECT COUNT(*) FROM archived_messages WHERE year = ? AND month = ?",
-                    (year, month)
-                )
-                count = cursor.fetchone()[0]
+            for month, count in month_counts:
                 keyboard.append([
                     InlineKeyboardButton(
                         f"🗓️ {month_names[month-1]} ({count:,})",
@@ -971,20 +1754,10 @@ ADMIN_IDS=123456789,987654321
     async def show_days_callback(self, query, year: int, month: int):
         """عرض أيام الشهر"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "SELECT DISTINCT day FROM archived_messages WHERE year = ? AND month = ? ORDER BY day",
-                (year, month)
-            )
-            days = [row[0] for row in cursor.fetchall()]
+            day_counts = await self.storage.read(count_days, year, month)
             
             keyboard = []
-            for day in days:
-                cursor.execute(
-                    "SELECT COUNT(*) FROM archived_messages WHERE year = ? AND month = ? AND day = ?",
-                    (year, month, day)
-                )
-                count = cursor.fetchone()[0]
+            for day, count in day_counts:
                 keyboard.append([
                     InlineKeyboardButton(
                         f"📆 {day:02d} ({count:,})",
@@ -1008,17 +1781,24 @@ ADMIN_IDS=123456789,987654321
         except Exception as e:
             await query.edit_message_text(f"❌ خطأ في عرض الأيام: {e}")
 
+    @staticmethod
+    def _query_day_messages(conn, day, limit: int = 10) -> list:
+        """أول عناصر اليوم؛ الألبوم يظهر عنصراً واحداً بتعليقه (MAX يختار الجزء الذي يحمل التعليق)"""
+        where, params = range_filter(conn, *day_bounds(day))
+        return conn.execute(
+            f"""SELECT MAX(content), media_type, file_name, COUNT(*), MAX(edited_at), MIN(deleted_at),
+                      MIN(channel_id), MIN(message_id), MAX(file_id)
+               FROM archived_messages
+               WHERE {where}
+               GROUP BY {ITEM_KEY_SQL}
+               ORDER BY MIN(date), MIN(message_id) LIMIT ?""",
+            params + [limit]
+        ).fetchall()
+
     async def show_day_messages(self, query, year: int, month: int, day: int):
-        """عرض رسائل اليوم"""
+        """عرض رسائل اليوم (بتوقيت الأرشيف)"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                """SELECT content, media_type, file_name FROM archived_messages 
-                   WHERE year = ? AND month = ? AND day = ? 
-                   ORDER BY date LIMIT 10""",
-                (year, month, day)
-            )
-            messages = cursor.fetchall()
+            messages = await self.storage.read(self._query_day_messages, date(year, month, day))
             
             if not messages:
                 await query.edit_message_text("❌ لا توجد رسائل في هذا اليوم")
@@ -1026,21 +1806,28 @@ ADMIN_IDS=123456789,987654321
             
             response = f"📅 **رسائل {day:02d}/{month:02d}/{year}**\n\n"
             
-            for i, (content, media_type, file_name) in enumerate(messages, 1):
-                media_icon = {
-                    "photo": "🖼️", "video": "🎥", 
-                    "document": "📄", "audio": "🎵"
-                }.get(media_type, "💬")
+            media_buttons = []
+            for i, (content, media_type, file_name, parts, edited_at, deleted_at,
+                    channel_id, message_id, file_id) in enumerate(messages, 1):
+                media_icon = MEDIA_ICONS.get(media_type, "💬")
+                if parts > 1:
+                    media_icon = f"🗂️ ({parts})"
                 
+                content = content or ""
                 preview = content[:50] + "..." if len(content) > 50 else content
-                response += f"{i}. {media_icon} `{preview}`\n"
+                marks = ("✏️" if edited_at else "") + ("🗑️" if deleted_at else "")
+                response += f"{i}. {media_icon} `{preview}` {marks}".rstrip() + "\n"
+                if file_id:
+                    media_buttons.append(InlineKeyboardButton(f"{i}. 🖼️", callback_data=f"media_{channel_id}_{message_id}"))
             
             if len(messages) == 10:
                 response += "\n... (عرض أول 10 رسائل)"
             
-            keyboard = [[
+            # زر لكل رسالة بوسائط لإرسالها (5 أزرار في كل صف)
+            keyboard = [media_buttons[i:i + 5] for i in range(0, len(media_buttons), 5)]
+            keyboard.append([
                 InlineKeyboardButton("🔙 العودة", callback_data=f"browse_month_{year}_{month}")
-            ]]
+            ])
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await query.edit_message_text(response, reply_markup=reply_markup, parse_mode='Markdown')
@@ -1060,6 +1847,12 @@ ADMIN_IDS=123456789,987654321
         self.is_running = True
         
         try:
+            # بدء طابور الكتابة وإعادة محاولة العمليات الفاشلة
+            await self.write_queue.start()
+            self.dead_letters.start()
+            self.search_index.start()
+            self.timestamp_migration.start()
+            
             # بدء Userbot
             logger.info("🔄 بدء تشغيل Userbot...")
             userbot_success = await self.start_userbot()
@@ -1093,8 +1886,21 @@ ADMIN_IDS=123456789,987654321
             self.is_running = False
             if self.userbot:
                 await self.userbot.disconnect()
-            if self.conn:
-                self.conn.close()
+            await self.ingestion.stop()
+            if self.media:
+                await self.media.stop()
+            await self.albums.flush()
+            if self.update_state_task:
+                self.update_state_task.cancel()
+            if self.update_state:
+                await self.update_state.save()
+            await self.search_index.stop()
+            await self.timestamp_migration.stop()
+            await self.dead_letters.stop()
+            await self.write_queue.stop()
+            self.dead_letters.close()
+            if self.storage:
+                self.storage.close()
             logger.info("🔚 تم إغلاق البوت")
 
 # دالة التشغيل الرئيسية
@@ -6,16 +6,14 @@
 
 import asyncio
 import os
-import json
-import sqlite3
 import logging
 import sys
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from datetime import datetime, timezone
+from typing import List, Dict
 from pathlib import Path
 
 try:
-    from telethon import TelegramClient, events
+    from telethon import events
     from telethon.sessions import StringSession
     from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
     from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
@@ -26,6 +24,22 @@ except ImportError as e:
     print("🔧 قم بتشغيل: python run.py --setup")
     sys.exit(1)
 
+from utils.storage_executor import StorageExecutor
+from utils.write_queue import ArchiveWriteQueue
+from utils.rate_governor import RateGovernor, GovernedTelegramClient
+from utils.json_segments import append_messages, seal_closed_days, day_path
+from utils.channels import ChannelIngestion, parse_channels
+from utils.message_rows import build_row, json_record
+from utils.coverage import IdCoverage, init_schema as init_coverage_schema
+from utils.dead_letters import DeadLetterQueue
+from utils.search import SearchIndex, init_schema as init_search_schema
+from utils.timestamps import TimestampMigration, init_schema as init_timestamp_schema, set_archive_timezone, local_today, row_local_date
+from utils.daily_counts import init_schema as init_daily_counts_schema, count_messages
+from utils.media_store import MediaStore, init_schema as init_media_schema
+from utils.catch_up import UpdateCatchUp, update_pts, init_schema as init_update_state_schema
+from utils.revisions import apply_edit, apply_deletes, init_schema as init_revision_schema
+from utils.albums import AlbumAggregator, init_schema as init_album_schema
+
 # إعداد نظام السجلات
 logger = logging.getLogger(__name__)
 
@@ -45,9 +59,66 @@ class TelegramArchiveBot:
         # إعداد قاعدة البيانات
         self.init_database()
         
+        # حاكم معدل طلبات Telethon
+        self.rate_governor = RateGovernor(
+            default_rate=self.api_rate_limit,
+            global_rate=self.api_global_rate_limit
+        )
+        
+        # خريطة المعرفات المؤرشفة لكل قناة
+        self.coverage = IdCoverage(self.storage)
+        self.coverage.load(self.conn)
+        
+        # فهرس البحث النصي الكامل
+        self.search_index = SearchIndex(self.storage)
+        
+        # ترحيل تواريخ الرسائل المؤرشفة قبل إضافة date_ts وlocal_date
+        self.timestamp_migration = TimestampMigration(self.storage)
+        
+        # العمليات الفاشلة وإعادة محاولتها
+        self.dead_letters = DeadLetterQueue(
+            self.storage,
+            base_delay=self.dead_letter_base_delay,
+            max_attempts=self.dead_letter_max_attempts
+        )
+        
+        # آخر يوم (بتوقيت الأرشيف) أُغلقت قبله مقاطع JSONL
+        self.sealed_before = None
+        
+        # طابور الكتابة المؤجلة
+        self.write_queue = ArchiveWriteQueue(
+            self.storage,
+            max_batch=self.write_batch_size,
+            max_latency=self.write_max_latency_ms / 1000,
+            on_flush=self.mirror_batch_to_json,
+            coverage=self.coverage,
+            dead_letters=self.dead_letters,
+            max_pending=self.write_queue_max,
+            overflow=self.backpressure_policy,
+            lag_alert=self.lag_alert_seconds
+        )
+        
+        # تجميع أجزاء الألبومات قبل الكتابة
+        self.albums = AlbumAggregator(self.write_queue.enqueue_group, window=self.album_window_ms / 1000)
+        
+        # دوال إعادة تنفيذ كل نوع من العمليات الفاشلة
+        self.dead_letters.register('rows', lambda row: self.write_queue.write_rows([row], keep_existing=True))
+        self.dead_letters.register('json', self.write_json_records)
+        self.dead_letters.register('edit', lambda payload: self.apply_edit_row(payload['row'], payload['edited_at']))
+        self.dead_letters.register('delete', lambda payload: self.apply_deletion(
+            payload['channel_id'], payload['message_ids'], payload['deleted_at']
+        ))
+        
+        # عمال الأرشفة لكل قناة مصدر
+        self.ingestion = ChannelIngestion(self.archive_message)
+        self.ingestion.set_channels(self.source_channels)
+        
         # متغيرات العملاء
         self.userbot = None
         self.bot_app = None
+        self.update_state = None
+        self.update_state_task = None
+        self.media = None
         self.is_running = False
         self.debug = debug
         
@@ -70,11 +141,46 @@ class TelegramArchiveBot:
         # إعدادات Bot Token
         self.bot_token = os.getenv('BOT_TOKEN')
         
-        # إعدادات القناة والمدراء
-        self.source_channel = os.getenv('SOURCE_CHANNEL')
+        # إعدادات القنوات والمدراء (SOURCE_CHANNELS لعدة قنوات مفصولة بفواصل)
+        self.source_channels = parse_channels(os.getenv('SOURCE_CHANNELS') or os.getenv('SOURCE_CHANNEL'))
+        self.source_channel = self.source_channels[0] if self.source_channels else None
         admin_ids_str = os.getenv('ADMIN_IDS', '')
         self.admin_ids = [int(x.strip()) for x in admin_ids_str.split(',') if x.strip().isdigit()]
         
+        # إعدادات طابور الكتابة
+        self.write_batch_size = int(os.getenv('WRITE_BATCH_SIZE', '500'))
+        self.write_max_latency_ms = int(os.getenv('WRITE_MAX_LATENCY_MS', '200'))
+        # حد الرسائل غير المحفوظة في الذاكرة وسياسة الامتلاء (block أو spill أو shed_backfill)
+        self.write_queue_max = int(os.getenv('WRITE_QUEUE_MAX', '10000'))
+        self.backpressure_policy = os.getenv('BACKPRESSURE_POLICY', 'block').strip().lower()
+        # تسجيل تحذير عند تأخر أرشفة الرسائل المباشرة عن نشرها (بالثواني، 0 لإيقافه)
+        self.lag_alert_seconds = float(os.getenv('LAG_ALERT_SECONDS', '60'))
+        self.db_readers = int(os.getenv('DB_READER_THREADS', '2'))
+        self.album_window_ms = int(os.getenv('ALBUM_WINDOW_MS', '500'))
+        self.update_state_interval = float(os.getenv('UPDATE_STATE_INTERVAL', '10'))
+        
+        # إعادة محاولة عمليات الأرشفة الفاشلة (تأخير أسي يبدأ من DEAD_LETTER_BASE_DELAY ثانية)
+        self.dead_letter_base_delay = float(os.getenv('DEAD_LETTER_BASE_DELAY', '5'))
+        self.dead_letter_max_attempts = int(os.getenv('DEAD_LETTER_MAX_ATTEMPTS', '10'))
+        
+        # تنزيل الوسائط (اختياري) مع حدود الحجم وميزانية القرص
+        self.media_download = os.getenv('MEDIA_DOWNLOAD', 'false').lower() == 'true'
+        self.media_dir = os.getenv('MEDIA_DIR', 'media')
+        self.media_concurrency = int(os.getenv('MEDIA_CONCURRENCY', '3'))
+        self.media_per_dc = int(os.getenv('MEDIA_PER_DC', '2'))
+        self.media_max_file_mb = float(os.getenv('MEDIA_MAX_FILE_MB', '50'))
+        self.media_budget_mb = float(os.getenv('MEDIA_BUDGET_MB', '2048'))
+        # full: تنزيل الملفات كاملة، thumbnail: الصور المصغرة فقط وتنزيل الملف عند طلبه
+        self.media_mode = os.getenv('MEDIA_MODE', 'full').strip().lower()
+        
+        # توقيت الأرشيف لأيام الرسائل المحلية (اسم مثل Asia/Riyadh أو إزاحة مثل +03:00)
+        self.archive_timezone = os.getenv('ARCHIVE_TIMEZONE', 'UTC')
+        set_archive_timezone(self.archive_timezone)
+        
+        # حدود معدل طلبات Telegram (طلب/ثانية)
+        self.api_rate_limit = float(os.getenv('API_RATE_LIMIT', '20'))
+        self.api_global_rate_limit = float(os.getenv('API_GLOBAL_RATE_LIMIT', '30'))
+        
         # التحقق من المتغيرات المطلوبة
         self.validate_environment()
 
@@ -135,7 +241,7 @@ ENVIRONMENT=development
 
     def create_directories(self):
         """إنشاء المجلدات المطلوبة"""
-        directories = ['archive', 'exports', 'backups', 'logs', 'config', 'sessions']
+        directories = ['archive', 'exports', 'backups', 'logs', 'config', 'sessions', 'spill']
         
         for directory in directories:
             Path(directory).mkdir(exist_ok=True)
@@ -145,7 +251,9 @@ ENVIRONMENT=development
     def init_database(self):
         """إنشاء قاعدة البيانات وجداولها"""
         try:
-            self.conn = sqlite3.connect('archive.db', check_same_thread=False)
+            # طبقة التخزين: إنشاء الجداول يتم عبر اتصال الكتابة قبل بدء الخيوط
+            self.storage = StorageExecutor('archive.db', readers=self.db_readers)
+            self.conn = self.storage.conn
             cursor = self.conn.cursor()
             
             # جدول الرسائل المؤرشفة
@@ -162,6 +270,19 @@ ENVIRONMENT=development
                     media_type TEXT,
                     file_id TEXT,
                     file_name TEXT,
+                    grouped_id INTEGER,
+                    edited_at TEXT,
+                    deleted_at TEXT,
+                    content_hash TEXT,
+                    media_size INTEGER,
+                    mime_type TEXT,
+                    duration REAL,
+                    width INTEGER,
+                    height INTEGER,
+                    dc_id INTEGER,
+                    url TEXT,
+                    title TEXT,
+                    search_text TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE(message_id, channel_id)
                 )
@@ -188,8 +309,32 @@ ENVIRONMENT=development
             
             # إنشاء فهارس للبحث السريع
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_date ON archived_messages(date)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_content ON archived_messages(content)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_year_month_day ON archived_messages(year, month, day)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_channel_message ON archived_messages(channel_id, message_id)')
+            
+            # جدول الألبومات وعمود grouped_id
+            init_album_schema(self.conn)
+            
+            # جدول نسخ الرسائل المعدلة وعلامات الحذف
+            init_revision_schema(self.conn)
+            
+            # خريطة تغطية معرفات الرسائل لكل قناة
+            init_coverage_schema(self.conn)
+            
+            # آخر pts تمت أرشفته لكل قناة
+            init_update_state_schema(self.conn)
+            
+            # جداول ملفات الوسائط المنزلة
+            init_media_schema(self.conn)
+            
+            # فهرس البحث النصي الكامل (FTS5) والـ triggers التي تحدّثه
+            init_search_schema(self.conn)
+            
+            # عمودا date_ts وlocal_date للاستعلام عن الفترات (الأرشيف الموجود يُرحّل في الخلفية)
+            init_timestamp_schema(self.conn)
+            
+            # عدادات الرسائل اليومية للإحصائيات (تحدّثها الـ triggers)
+            init_daily_counts_schema(self.conn)
             
             self.conn.commit()
             logger.info("✅ تم إعداد قاعدة البيانات بنجاح")
@@ -213,7 +358,10 @@ ENVIRONMENT=development
                 logger.info("📱 استخدام رقم الهاتف للاتصال...")
                 session = 'sessions/userbot'
             
-            self.userbot = TelegramClient(session, self.api_id, self.api_hash)
+            self.userbot = GovernedTelegramClient(
+                session, self.api_id, self.api_hash,
+                governor=self.rate_governor
+            )
             
             # بدء الاتصال
             if self.string_session and self.string_session != 'your_string_session_here':
@@ -225,14 +373,30 @@ ENVIRONMENT=development
             me = await self.userbot.get_me()
             logger.info(f"✅ تم تشغيل Userbot بنجاح - {me.first_name}")
             
+            # تنزيل الوسائط وتخزينها حسب بصمة محتواها
+            if self.media_download:
+                self.media = MediaStore(
+                    self.userbot, self.storage,
+                    root=self.media_dir,
+                    concurrency=self.media_concurrency,
+                    per_dc=self.media_per_dc,
+                    max_file_size=int(self.media_max_file_mb * 1024 ** 2),
+                    budget=int(self.media_budget_mb * 1024 ** 2),
+                    mode=self.media_mode
+                )
+                await self.media.start()
+            
+            # حالة التحديثات لكل قناة لاستكمال ما فات بعد إعادة التشغيل أو انقطاع الاتصال
+            self.update_state = UpdateCatchUp(
+                self.userbot, self.storage, self.ingestion,
+                self.archive_edit, self.archive_deletion, self.wait_archived
+            )
+            await self.update_state.load()
+            self.userbot.on_reconnect = self.update_state.catch_up_all
+            self.update_state_task = asyncio.create_task(self.update_state.run_saver(self.update_state_interval))
+            
             # إعداد مراقب الرسائل الجديدة
-            if self.source_channel:
-                @self.userbot.on(events.NewMessage(chats=self.source_channel))
-                async def handle_new_message(event):
-                    await self.archive_message(event.message)
-                    logger.info(f"📥 تم أرشفة رسالة جديدة: {event.message.id}")
-                
-                logger.info(f"👀 بدء مراقبة القناة: {self.source_channel}")
+            await self.watch_channels()
             
             return True
             
@@ -242,6 +406,40 @@ ENVIRONMENT=development
                 logger.error("💡 نصيحة: تشغيل python run.py --session لإنشاء String Session جديد")
             return False
 
+    async def watch_channels(self):
+        """تسجيل مراقب الرسائل الجديدة لجميع القنوات المصدر (يعاد استدعاؤها عند تغيير القنوات)"""
+        for handler in (self.handle_new_message, self.handle_message_edited, self.handle_message_deleted):
+            self.userbot.remove_event_handler(handler)
+        self.ingestion.set_channels(self.source_channels)
+        
+        if not self.source_channels:
+            return
+        
+        await self.ingestion.resolve(self.userbot)
+        self.ingestion.start()
+        self.userbot.add_event_handler(self.handle_new_message, events.NewMessage(chats=self.source_channels))
+        self.userbot.add_event_handler(self.handle_message_edited, events.MessageEdited(chats=self.source_channels))
+        self.userbot.add_event_handler(self.handle_message_deleted, events.MessageDeleted(chats=self.source_channels))
+        logger.info(f"👀 بدء مراقبة القنوات: {', '.join(self.source_channels)}")
+        
+        # استكمال ما فات منذ آخر تشغيل قبل معالجة الأحداث المباشرة
+        if self.update_state:
+            await self.update_state.catch_up_all()
+
+    async def handle_new_message(self, event):
+        """توجيه الرسالة الجديدة إلى عامل قناتها"""
+        self.ingestion.submit(event.chat_id, event.message, pts=update_pts(event))
+        logger.info(f"📥 تمت إضافة رسالة جديدة لطابور الأرشفة: {event.message.id}")
+
+    async def handle_message_edited(self, event):
+        """توجيه التعديل إلى عامل القناة (بعد أي رسائل سابقة منها)"""
+        self.ingestion.submit(event.chat_id, event.message, self.archive_edit, pts=update_pts(event))
+
+    async def handle_message_deleted(self, event):
+        """توجيه الحذف إلى عامل القناة"""
+        if event.chat_id is not None:
+            self.ingestion.submit(event.chat_id, event, self.archive_deletion, pts=update_pts(event))
+
     async def start_bot(self):
         """بدء تشغيل Bot"""
         if not self.bot_token:
@@ -285,96 +483,137 @@ ENVIRONMENT=development
     async def archive_message(self, message):
         """أرشفة رسالة واحدة"""
         try:
-            msg_date = message.date
-            year = msg_date.year
-            month = msg_date.month
-            day = msg_date.day
-            
-            # تحضير بيانات الرسالة
-            content = message.text or message.caption or ""
-            media_type = None
-            file_id = None
-            file_name = None
-            
-            # معالجة الوسائط
-            if message.media:
-                if message.photo:
-                    media_type = "photo"
-                    file_id = str(message.photo.id)
-                elif message.video:
-                    media_type = "video"
-                    file_id = str(message.video.id)
-                    file_name = getattr(message.video, 'file_name', None)
-                elif message.document:
-                    media_type = "document"
-                    file_id = str(message.document.id)
-                    file_name = getattr(message.document, 'file_name', None)
-                elif message.audio:
-                    media_type = "audio"
-                    file_id = str(message.audio.id)
-                    file_name = getattr(message.audio, 'file_name', None)
-            
-            # حفظ في قاعدة البيانات
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO archived_messages 
-                (message_id, channel_id, date, year, month, day, content, media_type, file_id, file_name)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                message.id,
-                message.chat_id,
-                msg_date.isoformat(),
-                year, month, day,
-                content,
-                media_type,
-                file_id,
-                file_name
-            ))
-            self.conn.commit()
+            # إضافة إلى طابور الكتابة (يتم الحفظ على دفعات، وأجزاء الألبوم معاً)
+            await self.albums.add(build_row(message))
             
-            # حفظ في ملف JSON
-            await self.save_to_json_file(year, month, day, {
-                'message_id': message.id,
-                'date': msg_date.isoformat(),
-                'content': content,
-                'media_type': media_type,
-                'file_id': file_id,
-                'file_name': file_name
-            })
+            if self.media:
+                await self.media.submit(message)
             
         except Exception as e:
             logger.error(f"❌ خطأ في أرشفة الرسالة {message.id}: {e}")
 
-    async def save_to_json_file(self, year: int, month: int, day: int, message_data: dict):
-        """حفظ الرسالة في ملف JSON"""
+    async def archive_edit(self, message):
+        """تطبيق تعديل رسالة على الأرشيف مع حفظ النسخة السابقة"""
         try:
-            # إنشاء مسار الملف
-            year_dir = Path('archive') / str(year)
-            month_dir = year_dir / f"{month:02d}"
-            month_dir.mkdir(parents=True, exist_ok=True)
+            # التعديل يُطبق بعد حفظ الرسالة الأصلية إن كانت ما زالت في الطابور
+            await self.wait_archived()
             
-            file_path = month_dir / f"{day:02d}.json"
-            
-            # قراءة البيانات الموجودة
-            messages = []
-            if file_path.exists():
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read().strip()
-                        if content:
-                            messages = json.loads(content)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    messages = []
-            
-            # إضافة الرسالة الجديدة
-            messages.append(message_data)
-            
-            # حفظ الملف
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(messages, f, ensure_ascii=False, indent=2)
-                
+            edited_at = (message.edit_date or datetime.now(timezone.utc)).isoformat()
+            row = build_row(message)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تحديث الرسالة المعدلة {message.id}: {e}")
+            return
+        
+        try:
+            await self.apply_edit_row(row, edited_at)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تحديث الرسالة المعدلة {message.id}: {e}")
+            await self.dead_letters.add('edit', {
+                'channel_id': row['channel_id'], 'message_id': row['message_id'],
+                'row': row, 'edited_at': edited_at
+            }, e)
+
+    async def apply_edit_row(self, row: Dict, edited_at: str):
+        """حفظ التعديل في قاعدة البيانات وملفات JSON (يرفع الخطأ عند الفشل)"""
+        updated = await self.storage.write(apply_edit, row, edited_at, self.coverage)
+        if updated:
+            await self.mirror_batch_to_json([updated])
+            logger.info(f"✏️ تم تحديث الرسالة المعدلة: {row['message_id']}")
+
+    async def archive_deletion(self, event):
+        """وضع علامة حذف على الرسائل المحذوفة من القناة"""
+        if event.chat_id is None:
+            return
+        
+        await self.wait_archived()
+        
+        deleted_at = datetime.now(timezone.utc).isoformat()
+        message_ids = list(event.deleted_ids)
+        try:
+            await self.apply_deletion(event.chat_id, message_ids, deleted_at)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تسجيل حذف الرسائل {message_ids}: {e}")
+            await self.dead_letters.add('delete', {
+                'channel_id': event.chat_id, 'message_ids': message_ids, 'deleted_at': deleted_at
+            }, e)
+
+    async def apply_deletion(self, channel_id: int, message_ids: List[int], deleted_at: str):
+        """حفظ علامات الحذف في قاعدة البيانات وملفات JSON (يرفع الخطأ عند الفشل)"""
+        rows = await self.storage.write(apply_deletes, channel_id, message_ids, deleted_at)
+        if rows:
+            await self.mirror_batch_to_json(rows)
+            logger.info(f"🗑️ تم تعليم {len(rows)} رسالة كمحذوفة")
+
+    async def wait_archived(self):
+        """انتظار حفظ كل ما أُرسل للأرشفة"""
+        await self.albums.flush()
+        await self.write_queue.wait_committed()
+
+    async def mirror_batch_to_json(self, batch: List[Dict]):
+        """نسخ دفعة محفوظة إلى ملفات JSON اليومية"""
+        days: Dict[tuple, List[Dict]] = {}
+        for row in batch:
+            # مقطع اليوم بتوقيت الأرشيف (نفس أيام التصفح والتصدير)، وread_day يعيد آخر سجل لكل رسالة
+            days.setdefault(row_local_date(row), []).append(json_record(row))
+        
+        await self.seal_closed_segments()
+        for day, messages_data in days.items():
+            await self.save_to_json_file(day.year, day.month, day.day, messages_data)
+
+    async def seal_closed_segments(self):
+        """إغلاق مقاطع الأيام المنتهية بفهرس مع أول دفعة في كل يوم جديد"""
+        today = local_today()
+        if self.sealed_before == today:
+            return
+        self.sealed_before = today
+        try:
+            await self.storage.run_io(seal_closed_days, 'archive', today)
+        except Exception as e:
+            logger.error(f"❌ خطأ في إغلاق مقاطع JSON: {e}")
+
+    async def save_to_json_file(self, year: int, month: int, day: int, messages_data: List[Dict]):
+        """إلحاق مجموعة رسائل بمقطع JSONL اليومي"""
+        payload = {'year': year, 'month': month, 'day': day, 'records': messages_data}
+        try:
+            await self.write_json_records(payload)
         except Exception as e:
             logger.error(f"❌ خطأ في حفظ ملف JSON: {e}")
+            await self.dead_letters.add('json', payload, e)
+
+    async def write_json_records(self, payload: Dict):
+        """إلحاق سجلات يوم بمقطعه (يرفع الخطأ عند الفشل)"""
+        path = day_path('archive', payload['year'], payload['month'], payload['day'])
+        await self.storage.run_io(append_messages, path, payload['records'])
+
+    def format_channel_status(self) -> str:
+        """ملخص عمال القنوات للعرض في الإحصائيات"""
+        channels = self.ingestion.stats()
+        if not channels:
+            return ""
+        
+        requests = self.rate_governor.channel_requests()
+        text = "\n📡 **القنوات:**\n"
+        for stats in channels:
+            text += (
+                f"• {stats['channel']}: `{stats['archived']:,}` مؤرشفة، "
+                f"`{stats['pending']}` بالانتظار، `{stats['errors']}` أخطاء، "
+                f"`{requests.get(stats['channel'], 0):,}` طلب\n"
+            )
+        return text
+
+    def format_rate_status(self) -> str:
+        """ملخص حاكم معدل الطلبات للعرض في الإحصائيات"""
+        snapshot = self.rate_governor.snapshot()
+        if not snapshot:
+            return ""
+        
+        text = "\n⏱️ **معدل الطلبات:**\n"
+        for method, stats in snapshot.items():
+            text += (
+                f"• {method}: `{stats['rate']:.1f}/ث` "
+                f"(انتظار `{stats['wait']:.1f}ث`، FloodWait: `{stats['flood_waits']}`)\n"
+            )
+        return text
 
     # معالجات الأوامر
     async def cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -438,7 +677,7 @@ ENVIRONMENT=development
 • `/search كلمة البحث` - البحث في المحتوى
 
 **⚙️ الإدارة:**
-• `/set_channel @channel` - تحديد القناة المصدر
+• `/set_channel @channel [@channel2 ...]` - تحديد القنوات المصدر
 • `/export YYYY-MM-DD` - تصدير أرشيف يوم
 • `/diagnostics` - تشخيص البوت
 • `/test_channel` - اختبار القناة
@@ -460,28 +699,14 @@ ENVIRONMENT=development
         if not self.is_admin(update.effective_user.id):
             return
         
-        try:
-            cursor = self.conn.cursor()
+        def collect_stats(conn):
+            cursor = conn.cursor()
             
-            # إجمالي الرسائل
-            cursor.execute("SELECT COUNT(*) FROM archived_messages")
-            total_messages = cursor.fetchone()[0]
-            
-            # رسائل اليوم
-            today = datetime.now().date()
-            cursor.execute(
-                "SELECT COUNT(*) FROM archived_messages WHERE date LIKE ?",
-                (f"{today}%",)
-            )
-            today_messages = cursor.fetchone()[0]
-            
-            # رسائل هذا الشهر
-            this_month = today.strftime("%Y-%m")
-            cursor.execute(
-                "SELECT COUNT(*) FROM archived_messages WHERE date LIKE ?",
-                (f"{this_month}%",)
-            )
-            month_messages = cursor.fetchone()[0]
+            # إجمالي الرسائل ورسائل اليوم والشهر بتوقيت الأرشيف (من العدادات اليومية)
+            today = local_today()
+            total_messages = count_messages(conn)
+            today_messages = count_messages(conn, today.year, today.month, today.day)
+            month_messages = count_messages(conn, today.year, today.month)
             
             # أحدث رسالة
             cursor.execute(
@@ -493,6 +718,12 @@ ENVIRONMENT=development
             # حجم قاعدة البيانات
             db_size = Path('archive.db').stat().st_size / (1024 * 1024)  # MB
             
+            return total_messages, today_messages, month_messages, latest_date, db_size
+        
+        try:
+            total_messages, today_messages, month_messages, latest_date, db_size = \
+                await self.storage.read(collect_stats)
+            
             status_text = f"""
 📊 **إحصائيات الأرشيف:**
 
@@ -506,11 +737,13 @@ ENVIRONMENT=development
 • وقت التحديث: `{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`
 
 ⚙️ **النظام:**
-• القناة المصدر: `{self.source_channel or 'غير محددة'}`
+• القنوات المصدر: `{', '.join(self.source_channels) or 'غير محددة'}`
 • حجم قاعدة البيانات: `{db_size:.2f} MB`
 • Userbot: {'🟢 متصل' if self.userbot and self.userbot.is_connected() else '🔴 غير متصل'}
 • Bot: {'🟢 يعمل' if self.is_running else '🔴 متوقف'}
             """
+            status_text += self.format_channel_status()
+            status_text += self.format_rate_status()
             
             await update.message.reply_text(status_text, parse_mode='Markdown')
             
@@ -712,28 +945,37 @@ ENVIRONMENT=development
         if not self.is_admin(update.effective_user.id):
             return
         
-        if not context.args:
+        # وسائط مثل "," فقط لا تحتوي على أي قناة
+        channels = parse_channels(' '.join(context.args or []))
+        if not channels:
             await update.message.reply_text(
                 "📢 **استخدم:** `/set_channel @channel_username`\n"
                 "**أو:** `/set_channel channel_id`\n"
+                "**لعدة قنوات:** `/set_channel @channel1 @channel2`\n"
                 "**مثال:** `/set_channel @my_channel`",
                 parse_mode='Markdown'
             )
             return
         
-        channel = context.args[0]
-        self.source_channel = channel
+        self.source_channels = channels
+        self.source_channel = channels[0]
         
         # حفظ في قاعدة البيانات
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-                ("source_channel", channel)
-            )
-            self.conn.commit()
+            def save_channels(conn):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [("source_channel", channels[0]), ("source_channels", ','.join(channels))]
+                )
+                conn.commit()
             
-            await update.message.reply_text(f"✅ تم تحديد القناة المصدر: **{channel}**", parse_mode='Markdown')
+            await self.storage.write(save_channels)
+            
+            await update.message.reply_text(f"✅ تم تحديد القنوات المصدر: **{', '.join(channels)}**", parse_mode='Markdown')
+            
+            # إعادة تشغيل مراقب الرسائل
+            if self.userbot and self.userbot.is_connected():
+                await self.watch_channels()
             
         except Exception as e:
             await update.message.reply_text(f"❌ خطأ في حفظ الإعدادات: {e}")
@@ -768,6 +1010,12 @@ ENVIRONMENT=development
         self.is_running = True
         
         try:
+            # بدء طابور الكتابة وإعادة محاولة العمليات الفاشلة
+            await self.write_queue.start()
+            self.dead_letters.start()
+            self.search_index.start()
+            self.timestamp_migration.start()
+            
             # بدء Userbot
             logger.info("🔄 بدء تشغيل Userbot...")
             userbot_success = await self.start_userbot()
@@ -816,50 +1064,68 @@ ENVIRONMENT=development
             except Exception as e:
                 logger.error(f"❌ خطأ في تشغيل المهام: {e}")
         
-    except KeyboardInterrupt:
-        logger.info("⏹️ تم إيقاف البوت بواسطة المستخدم")
-    except Exception as e:
-        logger.error(f"❌ خطأ في تشغيل البوت: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        await self.cleanup()
+        except KeyboardInterrupt:
+            logger.info("⏹️ تم إيقاف البوت بواسطة المستخدم")
+        except Exception as e:
+            logger.error(f"❌ خطأ في تشغيل البوت: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            await self.cleanup()
     
-    return True
+        return True
 
-async def cleanup(self):
-    """تنظيف الموارد"""
-    logger.info("🧹 جاري تنظيف الموارد...")
+    async def cleanup(self):
+        """تنظيف الموارد"""
+        logger.info("🧹 جاري تنظيف الموارد...")
     
-    self.is_running = False
+        self.is_running = False
     
-    try:
-        # إيقاف Bot
-        if self.bot_app:
-            try:
-                await self.bot_app.stop()
-                await self.bot_app.shutdown()
-                logger.info("✅ تم إيقاف Bot")
-            except Exception as e:
-                logger.warning(f"⚠️ خطأ في إيقاف Bot: {e}")
+        try:
+            # إيقاف Bot
+            if self.bot_app:
+                try:
+                    await self.bot_app.stop()
+                    await self.bot_app.shutdown()
+                    logger.info("✅ تم إيقاف Bot")
+                except Exception as e:
+                    logger.warning(f"⚠️ خطأ في إيقاف Bot: {e}")
         
-        # إيقاف Userbot
-        if self.userbot:
-            try:
-                await self.userbot.disconnect()
-                logger.info("✅ تم قطع اتصال Userbot")
-            except Exception as e:
-                logger.warning(f"⚠️ خطأ في قطع اتصال Userbot: {e}")
+            # إيقاف Userbot
+            if self.userbot:
+                try:
+                    await self.userbot.disconnect()
+                    logger.info("✅ تم قطع اتصال Userbot")
+                except Exception as e:
+                    logger.warning(f"⚠️ خطأ في قطع اتصال Userbot: {e}")
         
-        # إغلاق قاعدة البيانات
-        if self.conn:
+            # حفظ ما تبقى في طابور الكتابة
             try:
-                self.conn.close()
-                logger.info("✅ تم إغلاق قاعدة البيانات")
+                await self.ingestion.stop()
+                if self.media:
+                    await self.media.stop()
+                await self.albums.flush()
+                if self.update_state_task:
+                    self.update_state_task.cancel()
+                if self.update_state:
+                    await self.update_state.save()
+                await self.search_index.stop()
+                await self.timestamp_migration.stop()
+                await self.dead_letters.stop()
+                await self.write_queue.stop()
+                self.dead_letters.close()
             except Exception as e:
-                logger.warning(f"⚠️ خطأ في إغلاق قاعدة البيانات: {e}")
+                logger.warning(f"⚠️ خطأ في إيقاف طابور الكتابة: {e}")
+        
+            # إغلاق قاعدة البيانات
+            if self.storage:
+                try:
+                    self.storage.close()
+                    logger.info("✅ تم إغلاق قاعدة البيانات")
+                except Exception as e:
+                    logger.warning(f"⚠️ خطأ في إغلاق قاعدة البيانات: {e}")
                 
-    except Exception as e:
-        logger.error(f"❌ خطأ في التنظيف: {e}")
+        except Exception as e:
+            logger.error(f"❌ خطأ في التنظيف: {e}")
     
-    logger.info("🔚 تم تنظيف جميع الموارد")
+        logger.info("🔚 تم تنظيف جميع الموارد")
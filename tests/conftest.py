@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""إعداد مشترك للاختبارات: جذر المشروع في مسار الاستيراد وقاعدة بيانات مؤقتة بالمخطط الكامل"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+@pytest.fixture
+def archive_db(tmp_path):
+    """مسار قاعدة بيانات مؤقتة أُنشئت من database_schema.sql"""
+    path = tmp_path / 'archive.db'
+    conn = sqlite3.connect(path)
+    conn.executescript((ROOT / 'database_schema.sql').read_text(encoding='utf-8'))
+    conn.close()
+    return str(path)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""اختبارات توحيد النص العربي وتجذيعه: الفهرسة والبحث يتطابقان بنفس الصيغ"""
+
+from utils.arabic_text import normalize, stem, word_forms, index_text, query_words, matches
+
+def test_normalize_removes_diacritics_and_tatweel():
+    assert normalize('قَالَ الوَزِيرُ') == 'قال الوزير'
+    assert normalize('الصـــحفي') == 'الصحفي'
+
+def test_normalize_unifies_letters_and_digits():
+    assert normalize('أإآٱ') == 'اااا'
+    assert normalize('مستشفى شاطئ مؤتمر مدرسة') == 'مستشفي شاطي موتمر مدرسه'
+    assert normalize('٢٠٢٥ ۱۴') == '2025 14'
+    assert normalize('Telegram ARCHIVE') == 'telegram archive'
+
+def test_stem_prefixes():
+    assert stem('والوزير') == 'وزير'
+    assert stem('بالمدرسه') == 'مدرسه'
+    assert stem('للطلاب') == 'طلاب'
+    assert stem('الوزير') == 'وزير'
+
+def test_stem_keeps_short_words():
+    # ما يتبقى بعد السابقة يجب ألا يقل عن حرفين
+    assert stem('ال') == 'ال'
+    assert stem('الي') == 'الي'
+    assert stem('ولد') == 'ولد'
+
+def test_word_forms():
+    assert word_forms('كتاب') == ('كتاب',)
+    assert word_forms('الوزير') == ('الوزير', 'وزير')
+    # كلمة تبدأ بحرف من السوابق تشترك مع صيغتها المعرفة في صيغة واحدة على الأقل
+    assert set(word_forms('وزير')) & set(word_forms('الوزير'))
+
+def test_index_text_includes_stems():
+    assert index_text('وَالوَزِيرُ قال', None, 'اليوم') == 'والوزير وزير قال اليوم يوم'
+    assert index_text(None) == ''
+
+def test_query_words_and_matches():
+    terms = query_words('الوزير مدرس*')
+    assert terms == [(('الوزير', 'وزير'), False), (('مدرس',), True)]
+    assert matches('وَزِيرُ،', terms)
+    assert matches('«والمدرسة»', terms)
+    assert not matches('وزارة', terms)
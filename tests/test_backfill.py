@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""اختبارات الأرشفة الرجعية المتوازية: حد التزامن المشترك وعدّ المعرفات المتخطاة"""
+
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from utils import backfill
+from utils.backfill import BackfillEngine, split_id_range
+from utils.coverage import IdCoverage
+from utils.storage_executor import StorageExecutor
+
+class FakeClient:
+    """عميل وهمي يتتبع عدد المؤشرات المفتوحة في نفس الوقت"""
+
+    def __init__(self, flood_at=()):
+        self.flood_at = set(flood_at)
+        self.active = 0
+        self.peak = 0
+
+    async def get_peer_id(self, channel):
+        return -1000 - len(str(channel))
+
+    async def iter_messages(self, channel, min_id=0, max_id=0, reverse=True):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            for message_id in range(min_id + 1, max_id):
+                await asyncio.sleep(0)
+                if message_id in self.flood_at:
+                    self.flood_at.discard(message_id)
+                    raise backfill.FloodWaitError(request=None, capture=0)
+                yield SimpleNamespace(id=message_id, date=datetime(2025, 1, 1, tzinfo=timezone.utc))
+        finally:
+            self.active -= 1
+
+def test_split_id_range():
+    assert split_id_range(0, 5, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert split_id_range(5, 5, 2) == []
+
+def test_concurrency_is_shared_across_channels():
+    client = FakeClient()
+    archived = []
+
+    async def archive(message):
+        archived.append(message.id)
+
+    async def run():
+        engine = BackfillEngine(client, archive, shard_size=10, concurrency=2)
+        await asyncio.gather(
+            engine.archive_id_range('first', 0, 50),
+            engine.archive_id_range('second_channel', 0, 50)
+        )
+
+    asyncio.run(run())
+    assert client.peak == 2
+    assert len(archived) == 100
+
+@pytest.mark.skipif(backfill.FloodWaitError is None, reason='telethon غير متوفرة')
+def test_skipped_counted_once_per_shard(archive_db):
+    client = FakeClient(flood_at=[15])
+    archived = []
+
+    async def archive(message):
+        archived.append(message.id)
+
+    async def run():
+        storage = StorageExecutor(archive_db)
+        coverage = IdCoverage(storage)
+        engine = BackfillEngine(client, archive, shard_size=1000, coverage=coverage)
+        channel_id = await client.get_peer_id('channel')
+        await coverage.mark_scanned(channel_id, 21, 400)
+        total = await engine.archive_id_range('channel', 0, 500)
+        storage.close()
+        return engine, total
+
+    engine, total = asyncio.run(run())
+    # FloodWait بثانية صفر يعيد حساب النطاقات المتبقية دون إعادة عدّ المتخطى
+    assert engine.skipped == 380
+    assert total == 120 and sorted(archived) == [*range(1, 21), *range(401, 501)]
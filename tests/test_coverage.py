@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""اختبارات خريطة تغطية المعرفات: دمج النطاقات وتطابق الذاكرة مع الجدول بعد commit أو إلغائه"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from utils.coverage import IdCoverage, IdRanges, compress_ids
+from utils.storage_executor import StorageExecutor
+from utils.write_queue import ArchiveWriteQueue
+
+CHANNEL = -1001
+
+@pytest.fixture
+def conn(archive_db):
+    conn = sqlite3.connect(archive_db)
+    yield conn
+    conn.close()
+
+def stored(conn, channel_id=CHANNEL):
+    return conn.execute(
+        'SELECT start_id, end_id FROM id_coverage WHERE channel_id = ? ORDER BY start_id', (channel_id,)
+    ).fetchall()
+
+def in_memory(coverage, channel_id=CHANNEL):
+    ranges = coverage.channels.get(channel_id, IdRanges())
+    return list(zip(ranges.starts, ranges.ends))
+
+def rows(*ids):
+    return [{'channel_id': CHANNEL, 'message_id': message_id} for message_id in ids]
+
+def test_compress_ids():
+    assert compress_ids([5, 3, 4, 9, 1, 1]) == [(1, 1), (3, 5), (9, 9)]
+
+def test_id_ranges_merge_adjacent_and_overlapping():
+    ranges = IdRanges()
+    assert ranges.add(10, 20)
+    assert ranges.add(30, 40)
+    assert not ranges.add(12, 18)
+    assert ranges.add(21, 29)
+    assert list(zip(ranges.starts, ranges.ends)) == [(10, 40)]
+    assert ranges.total == 31
+
+    assert ranges.add(1, 5)
+    assert ranges.add(3, 100)
+    assert list(zip(ranges.starts, ranges.ends)) == [(1, 100)]
+    assert ranges.total == 100
+
+def test_id_ranges_missing_and_covers():
+    ranges = IdRanges()
+    ranges.add(5, 10)
+    ranges.add(20, 25)
+    assert list(ranges.missing(1, 30)) == [(1, 4), (11, 19), (26, 30)]
+    assert list(ranges.missing(6, 9)) == []
+    assert ranges.covers(20, 25) and not ranges.covers(9, 11)
+    assert 7 in ranges and 15 not in ranges
+
+def test_memory_updated_only_after_apply(conn):
+    coverage = IdCoverage(storage=None)
+    changes = coverage.record_rows(conn, rows(1, 2, 3, 7))
+    # قبل commit: الجدول يحوي النطاقات داخل العملية والذاكرة لم تتغير
+    assert stored(conn) == [(1, 3), (7, 7)]
+    assert in_memory(coverage) == []
+
+    conn.commit()
+    coverage.apply(changes)
+    assert in_memory(coverage) == stored(conn) == [(1, 3), (7, 7)]
+
+def test_rollback_leaves_memory_and_table_unchanged(conn):
+    coverage = IdCoverage(storage=None)
+    coverage.apply(coverage.record_rows(conn, rows(5, 6)))
+    conn.commit()
+
+    coverage.record_rows(conn, rows(4, 7, 8))
+    conn.rollback()
+    assert stored(conn) == in_memory(coverage) == [(5, 6)]
+    assert coverage.missing(CHANNEL, 1, 10) == [(1, 4), (7, 10)]
+
+def test_batch_merges_with_uncommitted_ranges(conn):
+    coverage = IdCoverage(storage=None)
+    coverage.apply(coverage.record_rows(conn, rows(5, 6, 7)))
+    conn.commit()
+
+    # نطاقان من نفس العملية يلتصقان بنفس النطاق المحفوظ من جهتيه
+    changes = coverage.record_rows(conn, rows(3, 4, 8, 9))
+    changes += coverage.record_rows(conn, rows(1))
+    conn.commit()
+    coverage.apply(changes)
+    assert stored(conn) == [(1, 1), (3, 9)]
+    assert in_memory(coverage) == stored(conn)
+
+def test_load_and_record_range(archive_db):
+    storage = StorageExecutor(archive_db)
+    coverage = IdCoverage(storage)
+    try:
+        asyncio.run(coverage.mark_scanned(CHANNEL, 10, 19))
+        asyncio.run(coverage.mark_scanned(CHANNEL, 20, 29))
+        reloaded = IdCoverage(storage)
+        conn = sqlite3.connect(archive_db)
+        reloaded.load(conn)
+        conn.close()
+        assert in_memory(reloaded) == in_memory(coverage) == [(10, 29)]
+        assert reloaded.gaps(CHANNEL)['covered'] == 20
+    finally:
+        storage.close()
+
+def test_write_queue_fallback_records_only_saved_rows(archive_db):
+    """فشل الدفعة يُلغيها ويعيد المحاولة رسالة برسالة: التغطية تشمل المحفوظة فقط"""
+    good = [
+        {
+            'message_id': message_id, 'channel_id': CHANNEL, 'date': '2025-01-01T00:00:00+00:00',
+            'year': 2025, 'month': 1, 'day': 1, 'content': 'x',
+            'media_type': None, 'file_id': None, 'file_name': None
+        }
+        for message_id in (1, 2, 4)
+    ]
+    # تاريخ فارغ يخالف قيد NOT NULL فيفشل حفظ الدفعة كاملة
+    bad = dict(good[0], message_id=3, date=None, date_ts=None, local_date=None)
+
+    async def run():
+        storage = StorageExecutor(archive_db)
+        coverage = IdCoverage(storage)
+        queue = ArchiveWriteQueue(storage, max_latency=0.01, coverage=coverage)
+        await queue.start()
+        await queue.enqueue_group(good[:2] + [bad] + good[2:])
+        await queue.flush()
+        await queue.stop()
+        storage.close()
+        return coverage
+
+    coverage = asyncio.run(run())
+    conn = sqlite3.connect(archive_db)
+    assert stored(conn) == in_memory(coverage) == [(1, 2), (4, 4)]
+    conn.close()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""اختبارات عدادات الرسائل اليومية: الـ triggers تطابق عدّ صفوف الأرشيف بعد كل تغيير"""
+
+import sqlite3
+
+import pytest
+
+from utils import daily_counts, timestamps
+from utils.albums import ITEM_KEY_SQL
+
+INSERT_SQL = '''INSERT INTO archived_messages
+    (message_id, channel_id, date, year, month, day, content, media_type, grouped_id, date_ts, local_date)
+    VALUES (?, ?, ?, ?, ?, ?, 'x', ?, ?, ?, ?)'''
+
+@pytest.fixture
+def conn(archive_db):
+    conn = sqlite3.connect(archive_db)
+    timestamps.init_schema(conn)
+    daily_counts.init_schema(conn)
+    yield conn
+    conn.close()
+
+@pytest.fixture(autouse=True)
+def utc_archive():
+    timestamps.set_archive_timezone('UTC')
+    yield
+    timestamps.set_archive_timezone('UTC')
+
+def insert(conn, message_id, when, media_type=None, grouped_id=None, channel_id=-1001, migrated=True):
+    ts, local_date = timestamps.row_timestamps(when)
+    utc = timestamps.parse_date(when)
+    conn.execute(INSERT_SQL, (
+        message_id, channel_id, when, utc.year, utc.month, utc.day, media_type, grouped_id,
+        ts if migrated else None, local_date if migrated else None
+    ))
+
+def actual_items(conn):
+    """عدد العناصر لكل يوم محسوباً من الأرشيف نفسه"""
+    return conn.execute(
+        f'''SELECT local_date, COUNT(DISTINCT {ITEM_KEY_SQL}) FROM archived_messages
+            WHERE local_date IS NOT NULL GROUP BY local_date ORDER BY local_date'''
+    ).fetchall()
+
+def counted_items(conn):
+    return conn.execute(
+        '''SELECT local_date, SUM(item_count) FROM daily_counts
+           GROUP BY local_date HAVING SUM(item_count) > 0 ORDER BY local_date'''
+    ).fetchall()
+
+def actual_messages(conn):
+    return conn.execute(
+        '''SELECT COALESCE(media_type, 'text'), COUNT(*) FROM archived_messages
+           WHERE local_date IS NOT NULL GROUP BY 1 ORDER BY 1'''
+    ).fetchall()
+
+def counted_messages(conn):
+    return conn.execute(
+        f'''SELECT media_type, SUM(message_count) FROM daily_counts WHERE media_type != '{daily_counts.ALBUM_BUCKET}'
+            GROUP BY media_type HAVING SUM(message_count) > 0 ORDER BY media_type'''
+    ).fetchall()
+
+def assert_consistent(conn):
+    assert counted_items(conn) == actual_items(conn)
+    assert counted_messages(conn) == actual_messages(conn)
+
+def test_album_counts_as_one_item(conn):
+    insert(conn, 1, '2025-01-01T10:00:00+00:00')
+    for message_id in (2, 3, 4):
+        insert(conn, message_id, '2025-01-01T11:00:00+00:00', 'photo', grouped_id=77)
+
+    assert daily_counts.count_days(conn, 2025, 1) == [(1, 2)]
+    assert daily_counts.count_messages(conn, 2025, 1, 1) == 4
+    assert_consistent(conn)
+
+def test_updates_and_deletes_move_counts(conn):
+    for message_id in range(1, 11):
+        insert(conn, message_id, f'2025-01-{message_id:02d}T12:00:00+00:00',
+               'video' if message_id % 2 else None, grouped_id=5 if message_id < 4 else None)
+    # إعادة أرشفة بنفس القيم لا تغير العدادات
+    conn.execute("UPDATE archived_messages SET content = 'y' WHERE message_id = 5")
+    conn.execute("UPDATE archived_messages SET local_date = '2025-02-01' WHERE message_id IN (2, 6)")
+    conn.execute("UPDATE archived_messages SET media_type = 'document' WHERE message_id = 7")
+    conn.execute("UPDATE archived_messages SET grouped_id = NULL WHERE message_id = 1")
+    conn.execute("DELETE FROM archived_messages WHERE message_id IN (3, 9)")
+
+    assert_consistent(conn)
+    assert daily_counts.count_months(conn, 2025) == [(1, 6), (2, 2)]
+    assert daily_counts.count_messages(conn) == 8
+
+def test_days_follow_archive_timezone(conn):
+    timestamps.set_archive_timezone('+03:00')
+    # 22:30 بتوقيت UTC هي اليوم التالي بتوقيت الأرشيف
+    insert(conn, 1, '2024-12-31T22:30:00+00:00')
+    insert(conn, 2, '2024-12-31T20:00:00+00:00')
+
+    assert daily_counts.count_years(conn) == [(2025, 1), (2024, 1)]
+    assert daily_counts.count_days(conn, 2025, 1) == [(1, 1)]
+    assert daily_counts.count_messages(conn, 2024, 12, 31) == 1
+
+def test_rows_counted_when_migrated(conn):
+    insert(conn, 1, '2025-03-01T08:00:00+00:00', migrated=False)
+    insert(conn, 2, '2025-03-01T09:00:00+00:00', 'photo', grouped_id=9, migrated=False)
+    insert(conn, 3, '2025-03-01T09:00:01+00:00', 'photo', grouped_id=9, migrated=False)
+    conn.execute('UPDATE timestamp_state SET migrated_upto = 0')
+    assert daily_counts.count_messages(conn) == 0
+
+    timestamps.migrate_batch(conn)
+    assert daily_counts.count_days(conn, 2025, 3) == [(1, 2)]
+    assert_consistent(conn)
+
+def test_timezone_change_recounts_days(conn):
+    insert(conn, 1, '2025-01-01T23:30:00+00:00')
+    insert(conn, 2, '2025-01-01T23:40:00+00:00', 'photo', grouped_id=4)
+    insert(conn, 3, '2025-01-02T00:10:00+00:00', 'photo', grouped_id=4)
+    assert daily_counts.count_days(conn, 2025, 1) == [(1, 2), (2, 1)]
+
+    timestamps.set_archive_timezone('+02:00')
+    timestamps.init_schema(conn)
+    timestamps.migrate_batch(conn)
+
+    assert daily_counts.count_days(conn, 2025, 1) == [(2, 2)]
+    assert_consistent(conn)
+
+def test_backfill_replaces_utc_day_table(archive_db):
+    conn = sqlite3.connect(archive_db)
+    for trigger in daily_counts.TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.execute('DROP TABLE daily_counts')
+    conn.execute('''CREATE TABLE daily_counts (
+        year INTEGER, month INTEGER, day INTEGER, channel_id INTEGER, media_type TEXT,
+        message_count INTEGER, item_count INTEGER, PRIMARY KEY (year, month, day, channel_id, media_type))''')
+    timestamps.init_schema(conn)
+    insert(conn, 1, '2025-05-05T05:00:00+00:00')
+    insert(conn, 2, '2025-05-06T05:00:00+00:00', 'photo', grouped_id=1)
+    insert(conn, 3, '2025-05-06T05:00:01+00:00', 'photo', grouped_id=1)
+
+    daily_counts.init_schema(conn)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(daily_counts)')}
+    assert 'local_date' in columns and 'year' not in columns
+    assert daily_counts.count_days(conn, 2025, 5) == [(5, 1), (6, 1)]
+    assert_consistent(conn)
+    conn.close()
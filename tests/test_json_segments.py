@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""اختبارات مقاطع JSONL اليومية: الإلحاق بعد انقطاع والفهرس في نهاية المقطع"""
+
+import json
+from datetime import date
+
+from utils.json_segments import (
+    append_messages, seal_segment, seal_closed_days, read_index, iter_segment, read_day, day_path, record_key, LEGACY_SUFFIX
+)
+
+def messages(*ids, channel_id=-1001):
+    return [{'message_id': i, 'channel_id': channel_id, 'content': f'رسالة {i}'} for i in ids]
+
+def test_day_path(tmp_path):
+    assert day_path(tmp_path, 2025, 1, 2) == tmp_path / '2025' / '01' / '02.jsonl'
+
+def test_append_and_read(tmp_path):
+    path = day_path(tmp_path, 2025, 1, 1)
+    append_messages(path, messages(1, 2))
+    append_messages(path, [])
+    append_messages(path, messages(3))
+    assert [record['message_id'] for record in iter_segment(path)] == [1, 2, 3]
+    assert read_index(path) is None
+
+def test_append_after_torn_line_starts_new_line(tmp_path):
+    path = day_path(tmp_path, 2025, 1, 1)
+    append_messages(path, messages(1))
+    with open(path, 'ab') as f:
+        f.write(b'{"message_id": 2, "chann')
+
+    append_messages(path, messages(3, 4))
+    assert [record['message_id'] for record in iter_segment(path)] == [1, 3, 4]
+    with open(path, 'rb') as f:
+        assert f.read().endswith(b'\n')
+
+def test_seal_writes_footer_index(tmp_path):
+    path = day_path(tmp_path, 2025, 1, 1)
+    append_messages(path, messages(1, 2))
+    append_messages(path, messages(1, channel_id=-1002))
+    index = seal_segment(path)
+
+    assert index == read_index(path)
+    assert index['count'] == 3
+    with open(path, 'rb') as f:
+        for record in messages(1, 2) + messages(1, channel_id=-1002):
+            f.seek(index['offsets'][record_key(record)])
+            assert json.loads(f.readline()) == record
+
+    # الفهرس لا يظهر كرسالة، والمقطع المغلق لا يُغلق مرة أخرى
+    assert len(list(iter_segment(path))) == 3
+    assert seal_segment(path) is None
+
+def test_append_after_seal_needs_new_index(tmp_path):
+    path = day_path(tmp_path, 2025, 1, 1)
+    append_messages(path, messages(1))
+    seal_segment(path)
+    append_messages(path, messages(2))
+    assert read_index(path) is None
+
+    index = seal_segment(path)
+    assert index['count'] == 2
+    assert read_index(path) == index
+
+def test_seal_after_torn_line(tmp_path):
+    path = day_path(tmp_path, 2025, 1, 1)
+    append_messages(path, messages(1))
+    with open(path, 'ab') as f:
+        f.write(b'{"message_id": 2')
+
+    index = seal_segment(path)
+    assert index['count'] == 1
+    assert read_index(path) == index
+
+def write_legacy(base_dir, records):
+    path = day_path(base_dir, 2025, 1, 1, LEGACY_SUFFIX)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding='utf-8')
+
+def test_read_day_legacy_only(tmp_path):
+    # ملفات الإصدارات القديمة: مصفوفة JSON بلا channel_id
+    write_legacy(tmp_path, [
+        {'message_id': 2, 'date': '2025-01-01T10:00:00+00:00', 'content': 'ب'},
+        {'message_id': 1, 'date': '2025-01-01T09:00:00+00:00', 'content': 'أ'},
+    ])
+    assert [record['content'] for record in read_day(tmp_path, 2025, 1, 1)] == ['أ', 'ب']
+
+def test_read_day_merges_formats_latest_wins(tmp_path):
+    write_legacy(tmp_path, [
+        {'message_id': 1, 'date': '2025-01-01T09:00:00+00:00', 'content': 'قديم'},
+        {'message_id': 2, 'date': '2025-01-01T10:00:00+00:00', 'content': 'باقٍ'},
+    ])
+    path = day_path(tmp_path, 2025, 1, 1)
+    append_messages(path, [
+        {'message_id': 1, 'channel_id': -1001, 'date': '2025-01-01T09:00:00+00:00', 'content': 'جديد'},
+        {'message_id': 3, 'channel_id': -1001, 'date': '2025-01-01T11:00:00+00:00', 'content': 'أول'},
+    ])
+    seal_segment(path)
+    append_messages(path, [
+        {'message_id': 3, 'channel_id': -1001, 'date': '2025-01-01T11:00:00+00:00', 'content': 'معدل',
+         'edited_at': '2025-01-01T12:00:00+00:00'},
+    ])
+
+    records = read_day(tmp_path, 2025, 1, 1)
+    assert [(record['message_id'], record['content']) for record in records] == [(1, 'جديد'), (2, 'باقٍ'), (3, 'معدل')]
+
+def test_read_day_corrupt_legacy_and_missing(tmp_path):
+    assert read_day(tmp_path, 2025, 1, 1) == []
+    path = day_path(tmp_path, 2025, 1, 1, LEGACY_SUFFIX)
+    path.parent.mkdir(parents=True)
+    path.write_text('[{"message_id": 1', encoding='utf-8')
+    append_messages(day_path(tmp_path, 2025, 1, 1), messages(5))
+    assert [record['message_id'] for record in read_day(tmp_path, 2025, 1, 1)] == [5]
+
+def test_seal_closed_days(tmp_path):
+    for day in (1, 2, 3):
+        append_messages(day_path(tmp_path, 2025, 1, day), messages(day))
+    (tmp_path / 'notes.jsonl').write_text('{}\n', encoding='utf-8')
+
+    assert seal_closed_days(tmp_path, date(2025, 1, 3)) == 2
+    assert read_index(day_path(tmp_path, 2025, 1, 2)) is not None
+    # اليوم الحالي يبقى مفتوحاً للإلحاق
+    assert read_index(day_path(tmp_path, 2025, 1, 3)) is None
+
+    # تعديل متأخر بعد الإغلاق يُغلق مرة أخرى، والمقاطع المغلقة لا تتغير
+    append_messages(day_path(tmp_path, 2025, 1, 1), messages(9))
+    assert seal_closed_days(tmp_path, date(2025, 1, 3)) == 1
+    assert read_index(day_path(tmp_path, 2025, 1, 1))['count'] == 2
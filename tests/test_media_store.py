@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""اختبارات التنزيل المجزأ: حفظ الموضع دورياً والاستئناف منه"""
+
+import asyncio
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from utils import media_store
+from utils.media_store import MediaStore, CHUNK_SIZE
+from utils.storage_executor import StorageExecutor
+
+class ChunkClient:
+    """عميل وهمي يُرجع الملف على أجزاء ويفشل عند مواضع محددة"""
+
+    def __init__(self, data, fail_at=(), error=ConnectionError):
+        self.data = data
+        self.fail_at = set(fail_at)
+        self.error = error
+        self.offsets = []
+
+    async def iter_download(self, document, offset=0, request_size=CHUNK_SIZE, file_size=None):
+        self.offsets.append(offset)
+        while offset < len(self.data):
+            if offset in self.fail_at:
+                self.fail_at.discard(offset)
+                raise self.error('disconnected')
+            yield self.data[offset:offset + request_size]
+            offset += request_size
+
+def document_message(data):
+    return SimpleNamespace(id=1, chat_id=-1001, document=SimpleNamespace(id=42, size=len(data), dc_id=2))
+
+@pytest.fixture
+def storage(archive_db):
+    storage = StorageExecutor(archive_db)
+    yield storage
+    storage.close()
+
+def download(storage, root, client, data):
+    async def run():
+        store = MediaStore(client, storage, root=str(root))
+        await storage.run_io(os.makedirs, store.tmp_dir, exist_ok=True)
+        return await store._download_chunked(document_message(data))
+    return asyncio.run(run())
+
+def test_resumes_after_disconnect(storage, tmp_path, monkeypatch):
+    # بلا انتظار قبل الاستئناف
+    sleep = asyncio.sleep
+    monkeypatch.setattr(media_store.asyncio, 'sleep', lambda delay: sleep(0))
+    data = os.urandom(6 * CHUNK_SIZE + 100)
+    client = ChunkClient(data, fail_at=[2 * CHUNK_SIZE, 5 * CHUNK_SIZE])
+    sha256, size, path = download(storage, tmp_path, client, data)
+
+    assert client.offsets == [0, 2 * CHUNK_SIZE, 5 * CHUNK_SIZE]
+    assert (sha256, size) == (hashlib.sha256(data).hexdigest(), len(data))
+    assert not os.path.exists(f"{path}.json")
+
+def test_checkpoint_survives_crash(storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_store, 'CHECKPOINT_BYTES', 2 * CHUNK_SIZE)
+    data = os.urandom(7 * CHUNK_SIZE)
+
+    # خطأ غير قابل للاستئناف في منتصف التنزيل يترك ملف .part وآخر موضع محفوظ
+    crashing = ChunkClient(data, fail_at=[5 * CHUNK_SIZE], error=RuntimeError)
+    with pytest.raises(RuntimeError):
+        download(storage, tmp_path, crashing, data)
+    part_path = tmp_path / '.tmp' / '42.part'
+    with open(f"{part_path}.json", encoding='utf-8') as f:
+        assert json.load(f)['offset'] == 4 * CHUNK_SIZE
+    assert os.path.getsize(part_path) >= 4 * CHUNK_SIZE
+
+    client = ChunkClient(data)
+    sha256, size, _ = download(storage, tmp_path, client, data)
+    assert client.offsets == [4 * CHUNK_SIZE]
+    assert sha256 == hashlib.sha256(data).hexdigest()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""اختبارات تعديل الرسائل وحذفها: قاعدة البيانات ومرآة JSON تعرضان النسخة الأخيرة فقط"""
+
+import sqlite3
+
+import pytest
+
+from utils import timestamps
+from utils.json_segments import append_messages, read_day, day_path
+from utils.message_rows import json_record
+from utils.revisions import apply_edit, apply_deletes, get_revisions, init_schema
+from utils.write_queue import INSERT_MESSAGE_SQL, row_params
+
+CHANNEL = -1001
+
+@pytest.fixture
+def conn(archive_db):
+    timestamps.set_archive_timezone('UTC')
+    conn = sqlite3.connect(archive_db)
+    init_schema(conn)
+    yield conn
+    conn.close()
+
+def message_row(message_id, content, **fields):
+    row = {
+        'message_id': message_id, 'channel_id': CHANNEL, 'date': '2025-01-01T10:00:00+00:00',
+        'year': 2025, 'month': 1, 'day': 1, 'content': content,
+        'media_type': None, 'file_id': None, 'file_name': None
+    }
+    row.update(fields)
+    return row
+
+def mirror(base_dir, rows):
+    append_messages(day_path(base_dir, 2025, 1, 1), [json_record(row) for row in rows])
+
+def test_edit_then_delete_reads_back_as_one_record(conn, tmp_path):
+    original = message_row(1, 'النص الأصلي', media_type='document', file_id='f1', file_name='a.pdf', media_size=2048)
+    conn.execute(INSERT_MESSAGE_SQL, row_params(original))
+    conn.commit()
+    mirror(tmp_path, [original, message_row(2, 'رسالة أخرى')])
+
+    edited = apply_edit(conn, dict(original, content='النص المعدل'), '2025-01-01T11:00:00+00:00')
+    mirror(tmp_path, [edited])
+    mirror(tmp_path, apply_deletes(conn, CHANNEL, [1, 99], '2025-01-01T12:00:00+00:00'))
+
+    records = [record for record in read_day(tmp_path, 2025, 1, 1) if record['message_id'] == 1]
+    assert len(records) == 1
+    assert records[0]['content'] == 'النص المعدل'
+    assert records[0]['edited_at'] == '2025-01-01T11:00:00+00:00'
+    assert records[0]['deleted_at'] == '2025-01-01T12:00:00+00:00'
+    # بيانات الوسائط تبقى في السجل الأخير
+    assert records[0]['media_size'] == 2048
+    assert [revision['content'] for revision in get_revisions(conn, CHANNEL, 1)] == ['النص الأصلي']
+
+def test_unchanged_edit_and_repeated_delete_add_nothing(conn):
+    row = message_row(1, 'نص')
+    conn.execute(INSERT_MESSAGE_SQL, row_params(row))
+    conn.commit()
+
+    assert apply_edit(conn, dict(row), '2025-01-01T11:00:00+00:00') is None
+    assert len(apply_deletes(conn, CHANNEL, [1], '2025-01-01T12:00:00+00:00')) == 1
+    assert apply_deletes(conn, CHANNEL, [1], '2025-01-01T13:00:00+00:00') == []
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""اختبارات ملفات الفائض واستعادتها بعد انقطاع أثناء الكتابة"""
+
+import asyncio
+import json
+import sqlite3
+
+from utils.spill import SpillFile
+from utils.storage_executor import StorageExecutor
+from utils.write_queue import ArchiveWriteQueue, OVERFLOW_SPILL
+from utils.fair_scheduler import PRIORITY_BACKFILL
+
+def make_rows(start, count):
+    return [
+        {
+            'message_id': i, 'channel_id': -1001, 'date': '2025-01-01T00:00:00+00:00',
+            'year': 2025, 'month': 1, 'day': 1, 'content': f'msg {i}',
+            'media_type': None, 'file_id': None, 'file_name': None
+        }
+        for i in range(start, start + count)
+    ]
+
+def tear(spill):
+    """محاكاة انقطاع أثناء الإضافة: سطر أخير بلا نهاية"""
+    with open(spill.path, 'ab') as f:
+        f.write(b'[1700000000.0, [{"message_id": 9')
+
+def test_recover_truncates_torn_tail(tmp_path):
+    spill = SpillFile(str(tmp_path / 'live.jsonl'))
+    spill.append(make_rows(1, 2))
+    spill.append(make_rows(3, 3))
+    tear(spill)
+
+    recovered = SpillFile(spill.path)
+    assert recovered.recover() == [2, 3]
+    with open(spill.path, 'rb') as f:
+        assert f.read().endswith(b'\n')
+
+    # الإضافة التالية تبدأ سطراً جديداً فلا تتلف
+    recovered.append(make_rows(6, 1))
+    assert [len(rows) for _, rows, _ in recovered.read(100)] == [2, 3, 1]
+
+def test_append_repairs_tail_left_by_failed_append(tmp_path):
+    spill = SpillFile(str(tmp_path / 'live.jsonl'))
+    spill.append(make_rows(1, 1))
+    tear(spill)
+    spill.append(make_rows(2, 1))
+
+    with open(spill.path, 'rb') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2
+    assert all(json.loads(line) for line in lines)
+
+def test_read_skips_incomplete_and_corrupt_lines(tmp_path):
+    spill = SpillFile(str(tmp_path / 'live.jsonl'))
+    spill.append(make_rows(1, 1))
+    with open(spill.path, 'ab') as f:
+        f.write(b'not json\n')
+    spill.append(make_rows(2, 1))
+    tear(spill)
+
+    assert SpillFile(spill.path).recover() == [1, 1]
+    items = spill.read(100)
+    assert [rows[0]['message_id'] for _, rows, _ in items] == [1, 2]
+
+def test_offset_persisted_only_after_commit(tmp_path):
+    spill = SpillFile(str(tmp_path / 'live.jsonl'))
+    spill.append(make_rows(1, 2))
+    spill.append(make_rows(3, 2))
+
+    first = spill.read(2)
+    assert len(first) == 1
+
+    # انقطاع قبل تأكيد الحفظ: الدفعة المقروءة تُستعاد
+    assert SpillFile(spill.path).recover() == [2, 2]
+
+    spill.commit(first[0][2])
+    assert SpillFile(spill.path).recover() == [2]
+
+    second = spill.read(10)
+    spill.commit(second[-1][2])
+    assert SpillFile(spill.path).recover() == []
+
+def test_read_respects_max_rows(tmp_path):
+    spill = SpillFile(str(tmp_path / 'live.jsonl'))
+    for start in (1, 4, 7):
+        spill.append(make_rows(start, 3))
+    assert len(spill.read(1)) == 1
+    assert len(spill.read(6)) == 2
+    assert spill.read(6) == []
+
+def test_queue_replays_valid_records_after_torn_spill(tmp_path, archive_db):
+    spill_dir = tmp_path / 'spill'
+    spill = SpillFile(str(spill_dir / 'backfill.jsonl'))
+    spill.append(make_rows(1, 3))
+    spill.append(make_rows(4, 2))
+    tear(spill)
+
+    async def run():
+        storage = StorageExecutor(archive_db)
+        queue = ArchiveWriteQueue(
+            storage, max_batch=2, max_latency=0.01, max_pending=2,
+            overflow=OVERFLOW_SPILL, spill_dir=str(spill_dir)
+        )
+        await queue.start()
+        assert queue.spilled(PRIORITY_BACKFILL) == 5
+        await queue.enqueue_group(make_rows(6, 2), PRIORITY_BACKFILL)
+        await queue.flush()
+        await queue.stop()
+        storage.close()
+
+    asyncio.run(run())
+
+    conn = sqlite3.connect(archive_db)
+    ids = [row[0] for row in conn.execute('SELECT message_id FROM archived_messages ORDER BY message_id')]
+    conn.close()
+    assert ids == [1, 2, 3, 4, 5, 6, 7]
+    assert not (spill_dir / 'backfill.jsonl').exists()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""اختبارات التواريخ الرقمية والأيام المحلية: الحدود نصف المفتوحة والتوقيت والترحيل"""
+
+import sqlite3
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from utils import timestamps
+from utils.backfill import BackfillEngine
+from utils.date_resolver import day_start
+
+@pytest.fixture(autouse=True)
+def utc_archive():
+    timestamps.set_archive_timezone('UTC')
+    yield
+    timestamps.set_archive_timezone('UTC')
+
+@pytest.fixture
+def conn(archive_db):
+    conn = sqlite3.connect(archive_db)
+    timestamps.init_schema(conn)
+    yield conn
+    conn.close()
+
+def ts(value):
+    return int(datetime.fromisoformat(value).timestamp())
+
+def test_parse_timezone():
+    assert timestamps.parse_timezone('') is timezone.utc
+    assert timestamps.parse_timezone('+03:00').utcoffset(None).total_seconds() == 3 * 3600
+    assert timestamps.parse_timezone('UTC-0530').utcoffset(None).total_seconds() == -(5 * 3600 + 30 * 60)
+    assert timestamps.parse_timezone('Not/AZone') is None
+
+def test_unknown_timezone_falls_back_to_utc():
+    timestamps.set_archive_timezone('Not/AZone')
+    assert timestamps.archive_timezone() is timezone.utc
+    assert timestamps.archive_timezone_name() == 'UTC'
+
+def test_row_timestamps_use_archive_day():
+    timestamps.set_archive_timezone('+03:00')
+    assert timestamps.row_timestamps('2024-12-31T22:30:00+00:00') == (ts('2024-12-31T22:30:00+00:00'), '2025-01-01')
+    # التواريخ بلا منطقة زمنية من إصدارات قديمة تُعامل كـ UTC
+    assert timestamps.row_timestamps('2024-12-31T20:00:00')[1] == '2024-12-31'
+    assert timestamps.row_local_date({'date': '2024-12-31T22:30:00+00:00'}) == date(2025, 1, 1)
+    assert timestamps.row_local_date({'date': 'ignored', 'local_date': '2024-06-01'}) == date(2024, 6, 1)
+
+def test_day_bounds_are_half_open_local_days():
+    timestamps.set_archive_timezone('+03:00')
+    start, end = timestamps.day_bounds(date(2025, 1, 1))
+    assert (start, end) == (ts('2024-12-31T21:00:00+00:00'), ts('2025-01-01T21:00:00+00:00'))
+    assert timestamps.day_bounds(date(2025, 1, 1), date(2025, 1, 3))[1] == ts('2025-01-03T21:00:00+00:00')
+    assert day_start(date(2025, 1, 1)) == datetime(2024, 12, 31, 21, tzinfo=timezone.utc)
+
+def test_day_bounds_across_dst_change():
+    zone = timestamps.parse_timezone('Europe/Berlin')
+    if zone is None:
+        pytest.skip('tzdata غير متوفرة')
+    start, end = timestamps.day_bounds(date(2025, 3, 30), tz=zone)
+    assert end - start == 23 * 3600
+
+def test_period_bounds():
+    assert timestamps.period_bounds(2024) == ('2024-01-01', '2025-01-01')
+    assert timestamps.period_bounds(2024, 12) == ('2024-12-01', '2025-01-01')
+    assert timestamps.period_bounds(2024, 2, 29) == ('2024-02-29', '2024-03-01')
+
+def test_range_filter_includes_unmigrated_rows(conn):
+    conn.executemany(
+        'INSERT INTO archived_messages (message_id, channel_id, date, year, month, day) VALUES (?, -1, ?, 2025, 1, 1)',
+        [(1, '2025-01-01T23:59:59+00:00'), (2, '2025-01-02T00:00:00+00:00'), (3, '2025-01-01T00:00:00')]
+    )
+    conn.execute('UPDATE timestamp_state SET migrated_upto = 0')
+
+    def day_ids():
+        where, params = timestamps.range_filter(conn, *timestamps.day_bounds(date(2025, 1, 1)))
+        return [row[0] for row in conn.execute(
+            f'SELECT message_id FROM archived_messages WHERE {where} ORDER BY message_id', params
+        )]
+
+    assert day_ids() == [1, 3]
+    timestamps.migrate_batch(conn, batch=2)
+    assert day_ids() == [1, 3]
+    timestamps.migrate_batch(conn, batch=2)
+    assert conn.execute(f'SELECT {timestamps.MIGRATED_UPTO_SQL}').fetchone()[0] == timestamps.MIGRATED_ALL
+    assert day_ids() == [1, 3]
+
+def test_timezone_change_restarts_migration(conn):
+    conn.execute(
+        "INSERT INTO archived_messages (message_id, channel_id, date, year, month, day) VALUES (1, -1, '2025-01-01T22:00:00+00:00', 2025, 1, 1)"
+    )
+    timestamps.migrate_batch(conn)
+    timestamps.set_archive_timezone('+03:00')
+    timestamps.init_schema(conn)
+    assert conn.execute(f'SELECT {timestamps.MIGRATED_UPTO_SQL}').fetchone()[0] == 0
+
+    timestamps.migrate_batch(conn)
+    assert conn.execute('SELECT local_date FROM archived_messages').fetchone()[0] == '2025-01-02'
+
+def test_backfill_filters_by_archive_day():
+    timestamps.set_archive_timezone('+03:00')
+    message = SimpleNamespace(date=datetime(2024, 12, 31, 22, 30, tzinfo=timezone.utc))
+    assert BackfillEngine._in_dates(message, date(2025, 1, 1), date(2025, 1, 1))
+    assert not BackfillEngine._in_dates(message, date(2024, 12, 31), date(2024, 12, 31))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""اختبارات طابور الكتابة: مقاييس التأخر والرجوع للإدراج الفردي"""
+
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.coverage import IdCoverage
+from utils.fair_scheduler import PRIORITY_LIVE, current_replay
+from utils.storage_executor import StorageExecutor
+from utils.write_queue import ArchiveWriteQueue
+
+def make_row(message_id, published):
+    return {
+        'message_id': message_id, 'channel_id': -1001, 'date': published,
+        'year': 2025, 'month': 1, 'day': 1, 'content': f'msg {message_id}',
+        'media_type': None, 'file_id': None, 'file_name': None
+    }
+
+def run_queue(archive_db, scenario):
+    async def run():
+        storage = StorageExecutor(archive_db)
+        queue = ArchiveWriteQueue(storage, max_latency=0.01, lag_alert=0)
+        await queue.start()
+        await scenario(queue)
+        await queue.flush()
+        await queue.stop()
+        storage.close()
+        return queue
+    return asyncio.run(run())
+
+def test_catch_up_replay_excluded_from_end_to_end_lag(archive_db):
+    old = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+    recent = datetime.now(timezone.utc).isoformat()
+
+    async def scenario(queue):
+        token = current_replay.set(True)
+        try:
+            await queue.enqueue(make_row(1, old), PRIORITY_LIVE)
+        finally:
+            current_replay.reset(token)
+        await queue.enqueue_group([make_row(2, old)], PRIORITY_LIVE, replay=True)
+        await queue.enqueue(make_row(3, recent), PRIORITY_LIVE)
+
+    queue = run_queue(archive_db, scenario)
+    assert queue.total_written == 3
+    assert len(queue.end_to_end) == 1
+    assert queue.max_end_to_end_lag < 60
+
+def test_unparseable_date_does_not_break_lag(archive_db):
+    async def scenario(queue):
+        row = make_row(1, datetime.now(timezone.utc).isoformat())
+        await queue.enqueue(row, PRIORITY_LIVE)
+        await queue.flush()
+        # صف تالف في ملف فائض قديم لا يوقف عامل الكتابة
+        queue._record_lag([(0, PRIORITY_LIVE, 0.0, [{'date': 'not a date'}, {}])], 0.0)
+
+    queue = run_queue(archive_db, scenario)
+    assert queue.total_written == 1
+    assert len(queue.end_to_end) == 1
+
+def test_fallback_commit_failure_rolls_back(archive_db):
+    """فشل commit بعد الإدراج الفردي لا يترك صفوفاً معلقة على اتصال الكتابة"""
+    published = '2025-01-01T00:00:00+00:00'
+    # تاريخ فارغ يخالف قيد NOT NULL فيفشل حفظ الدفعة كاملة
+    bad = dict(make_row(3, published), date=None, date_ts=None, local_date=None)
+    queue = ArchiveWriteQueue(storage=None, coverage=IdCoverage(storage=None))
+
+    def broken_record_rows(conn, rows):
+        raise sqlite3.OperationalError('disk I/O error')
+    queue.coverage.record_rows = broken_record_rows
+
+    conn = sqlite3.connect(archive_db)
+    with pytest.raises(sqlite3.OperationalError):
+        queue._commit_rows(conn, [make_row(1, published), bad, make_row(2, published)])
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM archived_messages').fetchone()[0] == 0
+    conn.close()
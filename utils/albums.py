@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تجميع الألبومات (grouped_id)
+أجزاء الألبوم تصل كرسائل منفصلة، فتُجمع لفترة قصيرة ثم تُحفظ كوحدة واحدة في نفس العملية
+"""
+
+import asyncio
+import logging
+import sqlite3
+from typing import List, Dict, Set, Tuple, Callable, Awaitable
+
+from utils.fair_scheduler import current_priority, current_replay
+from utils.storage_executor import ensure_columns
+
+logger = logging.getLogger(__name__)
+
+# أقصى عدد أجزاء في ألبوم تليغرام
+ALBUM_MAX_PARTS = 10
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS message_groups (
+        channel_id INTEGER NOT NULL,
+        grouped_id INTEGER NOT NULL,
+        first_message_id INTEGER NOT NULL,
+        part_count INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (channel_id, grouped_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_grouped ON archived_messages(channel_id, grouped_id)'
+]
+
+# إعادة حساب سجل الألبوم من أجزائه المحفوظة (داخل نفس عملية حفظ الأجزاء)
+UPSERT_GROUP_SQL = '''
+    INSERT OR REPLACE INTO message_groups (channel_id, grouped_id, first_message_id, part_count, date)
+    SELECT channel_id, grouped_id, MIN(message_id), COUNT(*), MIN(date)
+    FROM archived_messages
+    WHERE channel_id = ? AND grouped_id = ?
+    GROUP BY channel_id, grouped_id
+'''
+
+# مفتاح العنصر في التصفح والتصدير: الألبوم عنصر واحد، وكل رسالة أخرى عنصر مستقل
+ITEM_KEY_SQL = "COALESCE('g' || channel_id || ':' || grouped_id, 'm' || id)"
+
+def init_schema(conn: sqlite3.Connection):
+    """إضافة عمود grouped_id (لقواعد البيانات القديمة) وإنشاء جدول الألبومات"""
+    ensure_columns(conn, 'archived_messages', {'grouped_id': 'INTEGER'})
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+def group_keys(rows: List[Dict]) -> Set[Tuple[int, int]]:
+    """الألبومات التي تنتمي إليها مجموعة من الرسائل"""
+    return {(row['channel_id'], row['grouped_id']) for row in rows if row.get('grouped_id')}
+
+def group_items(messages: List[Dict]) -> List[Dict]:
+    """دمج رسائل الألبوم الواحد في عنصر واحد مع الحفاظ على الترتيب"""
+    items = []
+    albums: Dict[Tuple, Dict] = {}
+    for message in messages:
+        grouped_id = message.get('grouped_id')
+        if not grouped_id:
+            items.append(message)
+            continue
+
+        key = (message.get('channel_id'), grouped_id)
+        album = albums.get(key)
+        if album is None:
+            album = albums[key] = {
+                'album': True,
+                'grouped_id': grouped_id,
+                'channel_id': message.get('channel_id'),
+                'date': message.get('date'),
+                'content': '',
+                'parts': []
+            }
+            items.append(album)
+        album['parts'].append(message)
+        if not album['content'] and message.get('content'):
+            album['content'] = message['content']
+    return items
+
+class AlbumAggregator:
+    """تجميع أجزاء الألبوم لفترة قصيرة وإرسالها إلى طابور الكتابة كوحدة واحدة"""
+
+    def __init__(self, enqueue_group: Callable[..., Awaitable[int]],
+                 window: float = 0.5, max_parts: int = ALBUM_MAX_PARTS):
+        self.enqueue_group = enqueue_group
+        self.window = window
+        self.max_parts = max_parts
+
+        # (channel_id, grouped_id) -> الأجزاء المجمعة وأولويتها ومؤقت الإرسال
+        self._albums: Dict[Tuple[int, int], Dict] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        # إحصائيات
+        self.albums = 0
+        self.parts = 0
+
+    def pending(self) -> int:
+        """عدد الأجزاء المنتظرة في الألبومات المفتوحة"""
+        return sum(len(album['rows']) for album in self._albums.values())
+
+    async def add(self, row: Dict):
+        """إضافة رسالة: الرسائل العادية تذهب مباشرة، وأجزاء الألبوم تنتظر بقية الألبوم"""
+        grouped_id = row.get('grouped_id')
+        if not grouped_id:
+            await self.enqueue_group([row])
+            return
+
+        key = (row['channel_id'], grouped_id)
+        album = self._albums.get(key)
+        if album is None:
+            # الأولوية وعلامة الاستكمال تُحفظان مع الألبوم لأن الإرسال قد يتم من مؤقت خارج سياق المهمة
+            album = self._albums[key] = {
+                'rows': {}, 'priority': current_priority.get(), 'replay': current_replay.get(), 'timer': None
+            }
+
+        album['rows'][row['message_id']] = row
+        if album['timer']:
+            album['timer'].cancel()
+
+        if len(album['rows']) >= self.max_parts:
+            await self._flush(key)
+            return
+
+        album['timer'] = asyncio.get_running_loop().call_later(self.window, self._schedule_flush, key)
+
+    async def flush(self):
+        """إرسال جميع الألبومات المفتوحة فوراً"""
+        for key in list(self._albums):
+            await self._flush(key)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def _schedule_flush(self, key: Tuple[int, int]):
+        task = asyncio.ensure_future(self._flush(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key: Tuple[int, int]):
+        album = self._albums.pop(key, None)
+        if album is None:
+            return
+        if album['timer']:
+            album['timer'].cancel()
+
+        rows = sorted(album['rows'].values(), key=lambda row: row['message_id'])
+        self.albums += 1
+        self.parts += len(rows)
+        try:
+            await self.enqueue_group(rows, album['priority'], album['replay'])
+        except Exception as e:
+            logger.error(f"❌ خطأ في حفظ الألبوم {key[1]} ({len(rows)} جزء): {e}")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+توحيد النص العربي للبحث
+يُطبق نفس التوحيد عند الفهرسة وعند البحث: حذف التشكيل والتطويل، توحيد الألف والهمزات والتاء المربوطة والياء،
+وتجذيع خفيف لسوابق مثل "ال" و"و" (الكلمة تُفهرس بصيغتها الموحدة وبدون سابقتها)
+قياس السرعة: python -m utils.arabic_text
+"""
+
+import re
+import time
+from functools import lru_cache
+from itertools import chain
+from typing import List, Optional
+
+# التشكيل (الفتحة حتى السكون، والألف الخنجرية) والتطويل تُحذف
+_REMOVED = re.compile('[\u064B-\u0652\u0670\u0640]')
+
+# توحيد أشكال الألف والهمزات والتاء المربوطة، والأرقام الهندية والفارسية إلى أرقام لاتينية
+REPLACEMENTS = (
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'),
+    ('ى', 'ي'), ('ئ', 'ي'),
+    ('ؤ', 'و'),
+    ('ة', 'ه'),
+    *((chr(0x0660 + i), str(i)) for i in range(10)),
+    *((chr(0x06F0 + i), str(i)) for i in range(10)),
+)
+
+# واو العطف تُحذف أولاً ثم إحدى سوابق التعريف (من الأطول إلى الأقصر)، مع أقل طول يبقى من الكلمة
+CONJUNCTION = 'و'
+PREFIXES = ('بال', 'كال', 'فال', 'لل', 'ال')
+MIN_STEM = 2
+
+# عدد الكلمات المحفوظة صيغها (مفردات الأرشيف تتكرر كثيراً)
+FORMS_CACHE = 100000
+
+_WORD = re.compile(r'\w+')
+
+def normalize(text: str) -> str:
+    """حذف التشكيل وتوحيد الحروف المتشابهة وحالة الأحرف اللاتينية"""
+    # str.replace لكل حرف أسرع بكثير من str.translate بجدول للأحرف غير اللاتينية
+    text = _REMOVED.sub('', text)
+    for old, new in REPLACEMENTS:
+        if old in text:
+            text = text.replace(old, new)
+    return text.casefold()
+
+def stem(word: str) -> str:
+    """حذف واو العطف وسابقة التعريف من كلمة موحدة (تجذيع خفيف دون قواعد صرفية)"""
+    if word.startswith(CONJUNCTION) and len(word) - 1 > MIN_STEM:
+        word = word[1:]
+    for prefix in PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= MIN_STEM:
+            return word[len(prefix):]
+    return word
+
+@lru_cache(maxsize=FORMS_CACHE)
+def word_forms(word: str) -> tuple:
+    """صيغ الكلمة الموحدة في الفهرس: الكلمة نفسها، وجذعها إن اختلف
+
+    كلمة تبدأ بحرف من السوابق (مثل "وزير") وصيغتها المعرفة ("الوزير") تشتركان في صيغة واحدة على الأقل.
+    """
+    stemmed = stem(word)
+    return (word,) if stemmed == word else (word, stemmed)
+
+def index_text(*texts: Optional[str]) -> str:
+    """نص الفهرسة الموحد (كل كلمة بصيغها) لمجموعة نصوص الرسالة"""
+    words = _WORD.findall(normalize(' '.join(text for text in texts if text)))
+    return ' '.join(chain.from_iterable(map(word_forms, words)))
+
+def query_words(text: str) -> List[tuple]:
+    """(صيغ الكلمة، بحث بالبادئة) لكل كلمة في نص البحث"""
+    words = []
+    for token in text.split():
+        prefix = token.endswith('*')
+        for word in _WORD.findall(normalize(token)):
+            words.append((word_forms(word), prefix))
+    return words
+
+def matches(word: str, terms: List[tuple]) -> bool:
+    """هل تطابق كلمة من النص الأصلي (مع علامات الترقيم الملاصقة لها) إحدى كلمات البحث"""
+    forms = [form for piece in _WORD.findall(normalize(word)) for form in word_forms(piece)]
+    for term_forms, prefix in terms:
+        for form in forms:
+            if any(form.startswith(term) if prefix else form == term for term in term_forms):
+                return True
+    return False
+
+def benchmark(messages: int = 20000):
+    """قياس سرعة توحيد النصوص مقارنة بمعدل الأرشفة"""
+    sample = (
+        "قَالَ الوَزِيرُ إِنَّ الحُكُومَةَ سَتُعْلِنُ عَنْ خُطَّةٍ جَدِيدَةٍ لِلتَّعْلِيمِ وَالصِّحَّةِ فِي المُؤْتَمَرِ "
+        "الصـــحفي اليوم ٢٠٢٥ بالإضافة إلى مشاريع البنية التحتية والطاقة المتجددة https://example.com "
+    ) * 3
+    start = time.perf_counter()
+    for _ in range(messages):
+        index_text(sample, None)
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ {messages:,} رسالة ({len(sample)} حرف): {elapsed:.2f} ثانية")
+    print(f"📈 {messages / elapsed:,.0f} رسالة/ثانية، {elapsed / messages * 1e6:,.1f} ميكروثانية لكل رسالة")
+
+if __name__ == "__main__":
+    benchmark()
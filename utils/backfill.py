@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+محرك الأرشفة الرجعية المتوازي
+يقسم نطاق معرفات الرسائل إلى أجزاء ويجلبها بعدة مؤشرات iter_messages متزامنة
+"""
+
+import asyncio
+import logging
+import time
+from datetime import date
+from typing import Optional, List, Dict, Tuple, Callable, Awaitable
+
+from utils.checkpoints import BackfillCheckpoints, make_job_id
+from utils.coverage import IdCoverage
+from utils.date_resolver import DateIdResolver
+from utils.fair_scheduler import current_channel, current_priority, PRIORITY_BACKFILL
+from utils.timestamps import archive_timezone
+
+try:
+    from telethon.errors import FloodWaitError
+except ImportError:
+    FloodWaitError = None
+
+logger = logging.getLogger(__name__)
+
+# الفجوات المؤرشفة الأقصر من صفحة iter_messages تُجلب مع ما حولها بدلاً من طلب منفصل
+FETCH_SPAN = 100
+
+def split_id_range(min_id: int, max_id: int, shard_size: int) -> List[Tuple[int, int]]:
+    """تقسيم النطاق (min_id, max_id] إلى أجزاء متتالية بحجم shard_size"""
+    shards = []
+    low = min_id
+    while low < max_id:
+        high = min(low + shard_size, max_id)
+        shards.append((low, high))
+        low = high
+    return shards
+
+class BackfillEngine:
+    """جلب نطاق من الرسائل بعدة مؤشرات متوازية ضمن حد تزامن عام وميزانية FloodWait"""
+
+    def __init__(self, client, archive_fn: Callable[..., Awaitable[None]],
+                 shard_size: int = 2000, concurrency: int = 4, max_flood_wait: int = 300,
+                 checkpoints: Optional[BackfillCheckpoints] = None,
+                 wait_committed: Optional[Callable[[], Awaitable[None]]] = None,
+                 checkpoint_every: int = 500,
+                 resolver: Optional[DateIdResolver] = None,
+                 coverage: Optional[IdCoverage] = None):
+        self.client = client
+        self.archive_fn = archive_fn
+        self.shard_size = shard_size
+        self.concurrency = max(1, concurrency)
+        self.max_flood_wait = max_flood_wait
+        self.checkpoints = checkpoints
+        self.wait_committed = wait_committed
+        self.checkpoint_every = checkpoint_every
+        self.resolver = resolver or DateIdResolver(client)
+        self.coverage = coverage
+
+        # حد تزامن مشترك بين جميع المهام والقنوات حتى لا تتضاعف المؤشرات مع عدد القنوات
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._peer_ids: Dict[str, int] = {}
+        self._resume_at = 0.0
+        self.archived = 0
+        self.skipped = 0
+
+    async def resolve_date_bounds(self, channel, start_date: date, end_date: date) -> Tuple[int, int]:
+        """تحديد نطاق المعرفات (min_id, max_id] للفترة بالبحث الثنائي"""
+        token = current_priority.set(PRIORITY_BACKFILL)
+        try:
+            return await self.resolver.day_range(channel, start_date, end_date)
+        finally:
+            current_priority.reset(token)
+
+    async def archive_date_range(self, channel, start_date: date, end_date: date) -> int:
+        """أرشفة جميع رسائل الفترة [start_date, end_date] مع الاستئناف من نقطة التوقف إن وجدت"""
+        job_id = make_job_id(channel, start_date, end_date)
+
+        job = await self.checkpoints.get_job(job_id) if self.checkpoints else None
+        if job and job['status'] != 'done':
+            logger.info(f"↩️ استئناف مهمة الأرشفة {job_id}")
+            return await self.resume_job(job)
+
+        min_id, max_id = await self.resolve_date_bounds(channel, start_date, end_date)
+        if max_id <= min_id:
+            return 0
+
+        return await self.archive_id_range(channel, min_id, max_id, start_date, end_date, job_id=job_id)
+
+    async def archive_id_range(self, channel, min_id: int, max_id: int,
+                               start_date: Optional[date] = None, end_date: Optional[date] = None,
+                               job_id: Optional[str] = None) -> int:
+        """أرشفة الرسائل ذات المعرفات في (min_id, max_id] بأجزاء متوازية"""
+        shards = split_id_range(min_id, max_id, self.shard_size)
+
+        if self.checkpoints:
+            job_id = job_id or make_job_id(channel, min_id=min_id, max_id=max_id)
+            await self.checkpoints.start_job(job_id, channel, start_date, end_date, min_id, max_id, shards)
+
+        states = [{'low': low, 'high': high, 'last_id': low, 'done': False} for low, high in shards]
+        logger.info(f"🧩 أرشفة المعرفات {min_id + 1}..{max_id} على {len(shards)} جزء (تزامن: {self.concurrency})")
+        return await self._run_job(channel, job_id, states, start_date, end_date)
+
+    async def resume_job(self, job: Dict) -> int:
+        """استئناف مهمة محفوظة من آخر نقطة لكل جزء"""
+        start_date = date.fromisoformat(job['start_date']) if job['start_date'] else None
+        end_date = date.fromisoformat(job['end_date']) if job['end_date'] else None
+
+        await self.checkpoints.resume_job(job['job_id'])
+        states = await self.checkpoints.get_shards(job['job_id'])
+        pending = [state for state in states if not state['done']]
+        logger.info(f"↩️ متبقي {len(pending)} من {len(states)} جزء في المهمة {job['job_id']}")
+
+        return await self._run_job(job['channel'], job['job_id'], pending, start_date, end_date)
+
+    async def _run_job(self, channel, job_id: Optional[str], states: List[Dict],
+                       start_date: Optional[date], end_date: Optional[date]) -> int:
+        """تشغيل أجزاء المهمة بالتوازي"""
+        # الطلبات والكتابات الصادرة من أجزاء المهمة تُحسب على ميزانية القناة بأولوية منخفضة
+        channel_token = current_channel.set(str(channel))
+        priority_token = current_priority.set(PRIORITY_BACKFILL)
+        started = time.monotonic()
+        skipped = self.skipped
+        try:
+            channel_id = await self._peer_id(channel) if self.coverage else None
+            results = await asyncio.gather(*[
+                self._run_shard(channel, channel_id, job_id, state, start_date, end_date)
+                for state in states
+            ], return_exceptions=True)
+        finally:
+            current_priority.reset(priority_token)
+            current_channel.reset(channel_token)
+
+        total = 0
+        failed = 0
+        for state, result in zip(states, results):
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"❌ فشل الجزء {state['low'] + 1}..{state['high']}: {result}")
+            else:
+                total += result
+
+        if self.checkpoints and job_id:
+            await self.checkpoints.finish_job(job_id, 'interrupted' if failed else 'done')
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"✅ اكتملت الأرشفة الرجعية: {total:,} رسالة في {elapsed:.1f} ثانية "
+            f"(تخطي {self.skipped - skipped:,} معرف مؤرشف مسبقاً)"
+        )
+        return total
+
+    async def _run_shard(self, channel, channel_id: Optional[int], job_id: Optional[str], state: Dict,
+                         start_date: Optional[date], end_date: Optional[date]) -> int:
+        """جلب المعرفات غير المؤرشفة في جزء واحد مع الاستئناف من آخر رسالة بعد FloodWait"""
+        count = 0
+        unsaved = 0
+        low, high = state['low'], state['high']
+        last_id = state['last_id']
+        # النطاقات التي فُحصت بالكامل والرسائل المستبعدة بالتاريخ منها
+        scanned = []
+        filtered = set()
+        # المعرفات المؤرشفة مسبقاً تُحسب مرة واحدة للجزء وليس مع كل إعادة محاولة
+        skip_counted = False
+
+        async with self._semaphore:
+            while True:
+                await self._wait_for_flood()
+                try:
+                    pending = self._pending_ranges(channel_id, last_id, high)
+                    if not skip_counted:
+                        self.skipped += (high - last_id) - sum(end - start + 1 for start, end in pending)
+                        skip_counted = True
+                    for fetch_low, fetch_high in pending:
+                        # min_id و max_id غير شاملين في Telethon
+                        async for message in self.client.iter_messages(
+                            channel, min_id=max(last_id, fetch_low - 1), max_id=fetch_high + 1, reverse=True
+                        ):
+                            last_id = message.id
+                            if self._in_dates(message, start_date, end_date):
+                                await self.archive_fn(message)
+                                count += 1
+                                unsaved += 1
+                                self._report_progress()
+                            else:
+                                filtered.add(message.id)
+
+                            if unsaved >= self.checkpoint_every:
+                                await self._save_checkpoint(job_id, low, last_id, unsaved)
+                                unsaved = 0
+
+                        scanned.append((fetch_low, fetch_high))
+                        last_id = max(last_id, fetch_high)
+
+                    await self._mark_scanned(channel_id, scanned, filtered)
+                    await self._save_checkpoint(job_id, low, high, unsaved, done=True)
+                    return count
+
+                except Exception as e:
+                    if FloodWaitError is None or not isinstance(e, FloodWaitError):
+                        await self._save_checkpoint(job_id, low, last_id, unsaved)
+                        raise
+                    if e.seconds > self.max_flood_wait:
+                        logger.error(f"❌ FloodWait طويل ({e.seconds} ثانية) - إيقاف الجزء {low + 1}..{high}")
+                        await self._save_checkpoint(job_id, low, last_id, unsaved)
+                        raise
+                    logger.warning(f"⏳ FloodWait {e.seconds} ثانية - إيقاف جميع الأجزاء مؤقتاً")
+                    self._resume_at = max(self._resume_at, time.monotonic() + e.seconds)
+
+    def _pending_ranges(self, channel_id: Optional[int], last_id: int, high: int) -> List[Tuple[int, int]]:
+        """النطاقات [low, high] التي يجب جلبها بعد last_id (بدون المعرفات المؤرشفة مسبقاً)"""
+        if high <= last_id:
+            return []
+        if channel_id is None:
+            return [(last_id + 1, high)]
+
+        ranges: List[Tuple[int, int]] = []
+        for low, gap_high in self.coverage.missing(channel_id, last_id + 1, high):
+            if ranges and low - ranges[-1][1] <= FETCH_SPAN:
+                ranges[-1] = (ranges[-1][0], gap_high)
+            else:
+                ranges.append((low, gap_high))
+        return ranges
+
+    async def _mark_scanned(self, channel_id: Optional[int], scanned: List[Tuple[int, int]], filtered: set):
+        """تسجيل النطاقات المفحوصة في خريطة التغطية بعد حفظ رسائلها"""
+        if channel_id is None or not scanned:
+            return
+
+        if self.wait_committed:
+            await self.wait_committed()
+        for start, end in scanned:
+            # الرسائل المستبعدة بالتاريخ لم تُؤرشف فتبقى فجوات
+            for message_id in sorted(i for i in filtered if start <= i <= end):
+                await self.coverage.mark_scanned(channel_id, start, message_id - 1)
+                start = message_id + 1
+            await self.coverage.mark_scanned(channel_id, start, end)
+
+    async def _peer_id(self, channel) -> int:
+        """المعرف الرقمي للقناة كما يُحفظ في channel_id"""
+        key = str(channel)
+        if key not in self._peer_ids:
+            self._peer_ids[key] = await self.client.get_peer_id(channel)
+        return self._peer_ids[key]
+
+    async def _save_checkpoint(self, job_id: Optional[str], low: int, last_id: int,
+                               archived: int, done: bool = False):
+        """حفظ نقطة الاستئناف بعد التأكد من حفظ الرسائل في قاعدة البيانات"""
+        if not self.checkpoints or not job_id:
+            return
+
+        if self.wait_committed:
+            await self.wait_committed()
+        await self.checkpoints.save_progress(job_id, low, last_id, archived, done=done)
+
+    def _report_progress(self):
+        """تسجيل التقدم كل 1000 رسالة"""
+        self.archived += 1
+        if self.archived % 1000 == 0:
+            logger.info(f"📊 تم أرشفة {self.archived:,} رسالة...")
+
+    async def _wait_for_flood(self):
+        """انتظار انتهاء FloodWait المشترك بين الأجزاء"""
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _in_dates(message, start_date: Optional[date], end_date: Optional[date]) -> bool:
+        """التحقق من أن تاريخ الرسالة (بتوقيت الأرشيف) ضمن الفترة المطلوبة"""
+        if start_date is None and end_date is None:
+            return True
+        message_day = message.date.astimezone(archive_timezone()).date()
+        if start_date is not None and message_day < start_date:
+            return False
+        if end_date is not None and message_day > end_date:
+            return False
+        return True
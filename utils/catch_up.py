@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+استكمال التحديثات الفائتة بعد إعادة التشغيل أو انقطاع الاتصال
+يحفظ آخر pts تمت أرشفته لكل قناة ويجلب الفرق بـ updates.getChannelDifference عبر نفس مسار الأرشفة
+"""
+
+import asyncio
+import logging
+import sqlite3
+from itertools import chain
+from typing import Optional, Dict, Callable, Awaitable
+
+from utils.storage_executor import StorageExecutor
+from utils.channels import ChannelIngestion, ChannelWorker
+from utils.fair_scheduler import current_channel
+
+try:
+    from telethon import events, utils as telethon_utils
+    from telethon.tl import functions, types
+except ImportError:
+    events = telethon_utils = functions = types = None
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS channel_update_state (
+        channel_id INTEGER PRIMARY KEY,
+        pts INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )'''
+]
+
+# أقصى عدد رسائل في كل طلب getChannelDifference
+DIFFERENCE_LIMIT = 100
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء جدول حالة التحديثات"""
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+def update_pts(event) -> Optional[int]:
+    """pts التحديث الذي أنتج الحدث (إن وُجد)"""
+    return getattr(getattr(event, 'original_update', None), 'pts', None)
+
+class UpdateCatchUp:
+    """حفظ pts لكل قناة واستكمال ما فات قبل استئناف الأحداث المباشرة"""
+
+    def __init__(self, client, storage: StorageExecutor, ingestion: ChannelIngestion,
+                 edit_fn: Callable[..., Awaitable[None]],
+                 delete_fn: Callable[..., Awaitable[None]],
+                 wait_archived: Callable[[], Awaitable[None]],
+                 on_too_long: Optional[Callable[..., Awaitable[None]]] = None,
+                 limit: int = DIFFERENCE_LIMIT):
+        self.client = client
+        self.storage = storage
+        self.ingestion = ingestion
+        self.edit_fn = edit_fn
+        self.delete_fn = delete_fn
+        self.wait_archived = wait_archived
+        self.on_too_long = on_too_long
+        self.limit = limit
+
+        # آخر pts محفوظ في قاعدة البيانات لكل قناة
+        self.saved: Dict[int, int] = {}
+        self._lock = asyncio.Lock()
+
+        # إحصائيات
+        self.recovered = 0
+
+    async def load(self):
+        """قراءة الحالة المحفوظة"""
+        rows = await self.storage.fetchall('SELECT channel_id, pts FROM channel_update_state')
+        self.saved = {channel_id: pts for channel_id, pts in rows}
+
+    async def save(self):
+        """حفظ pts القنوات بعد التأكد من حفظ الرسائل التي سبقته"""
+        snapshot = {
+            worker.chat_id: worker.pts
+            for worker in self.ingestion.workers.values()
+            if worker.chat_id is not None and worker.pts is not None
+            and worker.pts != self.saved.get(worker.chat_id)
+        }
+        if not snapshot:
+            return
+
+        await self.wait_archived()
+        await self.storage.write(self._save_state, snapshot)
+        self.saved.update(snapshot)
+
+    @staticmethod
+    def _save_state(conn: sqlite3.Connection, snapshot: Dict[int, int]):
+        conn.executemany(
+            '''INSERT INTO channel_update_state (channel_id, pts) VALUES (?, ?)
+               ON CONFLICT(channel_id) DO UPDATE SET pts = excluded.pts, updated_at = CURRENT_TIMESTAMP''',
+            list(snapshot.items())
+        )
+        conn.commit()
+
+    async def run_saver(self, interval: float):
+        """حفظ الحالة دورياً"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"❌ خطأ في حفظ حالة التحديثات: {e}")
+
+    async def catch_up_all(self):
+        """استكمال ما فات لجميع القنوات؛ الأحداث المباشرة تُؤجل حتى ينتهي استكمال قناتها"""
+        workers = [worker for worker in self.ingestion.workers.values() if worker.chat_id is not None]
+        # الإيقاف يتم قبل أي انتظار حتى لا تسبق الأحداث المباشرة أحداث الاستكمال
+        for worker in workers:
+            worker.pause()
+
+        async with self._lock:
+            for worker in workers:
+                try:
+                    await self.catch_up(worker)
+                except Exception as e:
+                    logger.error(f"❌ خطأ في استكمال التحديثات الفائتة من {worker.channel}: {e}")
+                finally:
+                    worker.resume()
+
+    async def catch_up(self, worker: ChannelWorker) -> int:
+        """جلب الفرق منذ آخر pts محفوظ للقناة وتمريره إلى عاملها"""
+        pts = max(self.saved.get(worker.chat_id, 0), worker.pts or 0)
+        token = current_channel.set(worker.channel)
+        try:
+            if not pts:
+                # أول تشغيل للقناة: البدء من حالتها الحالية (ما قبلها تغطيه الأرشفة الرجعية)
+                full = await self.client(functions.channels.GetFullChannelRequest(worker.channel))
+                worker.advance(full.full_chat.pts)
+                await self.save()
+                logger.info(f"📌 بدء تتبع التحديثات للقناة {worker.channel} من pts={worker.pts}")
+                return 0
+
+            channel = await self.client.get_input_entity(worker.channel)
+            count = 0
+            while True:
+                difference = await self.client(functions.updates.GetChannelDifferenceRequest(
+                    channel=channel,
+                    filter=types.ChannelMessagesFilterEmpty(),
+                    pts=pts,
+                    limit=self.limit,
+                    force=True
+                ))
+
+                if isinstance(difference, types.updates.ChannelDifferenceEmpty):
+                    pts = difference.pts
+                    break
+
+                if isinstance(difference, types.updates.ChannelDifferenceTooLong):
+                    # الفرق أكبر من أن يُجلب بالتحديثات - تُكمله الأرشفة الرجعية حتى آخر رسالة
+                    pts = difference.dialog.pts
+                    logger.warning(f"⚠️ الفرق كبير جداً للقناة {worker.channel} - الاستكمال بالأرشفة الرجعية")
+                    if self.on_too_long:
+                        await self.on_too_long(worker.channel, worker.chat_id, difference.dialog.top_message)
+                    break
+
+                count += self._feed(worker, difference)
+                pts = difference.pts
+                # حفظ التقدم بعد كل صفحة حتى لا يُعاد جلبها بعد توقف مفاجئ
+                await worker.queue.join()
+                worker.advance(pts)
+                await self.save()
+                if difference.final:
+                    break
+
+            await worker.queue.join()
+            worker.advance(pts)
+            await self.save()
+        finally:
+            current_channel.reset(token)
+
+        if count:
+            self.recovered += count
+            logger.info(f"🔁 تم استكمال {count:,} تحديث فائت من {worker.channel}")
+        return count
+
+    def _feed(self, worker: ChannelWorker, difference) -> int:
+        """تمرير رسائل الفرق وتعديلاته وحذفه إلى طابور العامل بنفس الترتيب"""
+        entities = {
+            telethon_utils.get_peer_id(entity): entity
+            for entity in chain(difference.users, difference.chats)
+        }
+
+        count = 0
+        # رسائل الخدمة لا تُؤرشف في المسار المباشر أيضاً
+        for message in difference.new_messages:
+            if isinstance(message, types.Message):
+                message._finish_init(self.client, entities, None)
+                worker.submit(message, replay=True)
+                count += 1
+
+        for update in difference.other_updates:
+            if isinstance(update, types.UpdateEditChannelMessage) and isinstance(update.message, types.Message):
+                update.message._finish_init(self.client, entities, None)
+                worker.submit(update.message, self.edit_fn, replay=True)
+                count += 1
+            elif isinstance(update, types.UpdateDeleteChannelMessages):
+                event = events.MessageDeleted.Event(update.messages, types.PeerChannel(update.channel_id))
+                worker.submit(event, self.delete_fn, replay=True)
+                count += 1
+        return count
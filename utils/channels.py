@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+استقبال الرسائل من عدة قنوات مصدر
+عامل أرشفة مستقل وإحصائيات لكل قناة، مع تمرير القناة إلى حاكم الطلبات للجدولة العادلة
+وتتبع آخر pts تمت معالجته لاستكمال ما فات بعد الانقطاع
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional, List, Dict, Callable, Awaitable
+
+from utils.fair_scheduler import current_channel, current_replay
+
+logger = logging.getLogger(__name__)
+
+def parse_channels(value: Optional[str]) -> List[str]:
+    """تحويل قائمة القنوات المفصولة بفواصل أو مسافات إلى قائمة بدون تكرار"""
+    channels = []
+    for item in (value or '').replace(',', ' ').split():
+        if item and item not in channels:
+            channels.append(item)
+    return channels
+
+class ChannelWorker:
+    """عامل أرشفة خاص بقناة واحدة مع طابورها وإحصائياتها"""
+
+    def __init__(self, channel: str, archive_fn: Callable[..., Awaitable[None]]):
+        self.channel = channel
+        self.archive_fn = archive_fn
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.chat_id: Optional[int] = None
+
+        # آخر pts تمت معالجته، والأحداث المباشرة المؤجلة أثناء استكمال ما فات
+        self.pts: Optional[int] = None
+        self._held: Optional[list] = None
+
+        # إحصائيات القناة
+        self.received = 0
+        self.archived = 0
+        self.errors = 0
+        self.last_message_id: Optional[int] = None
+        self.last_archived_at: Optional[float] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """بدء عامل القناة"""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run(), name=f"channel-worker:{self.channel}")
+
+    def submit(self, message, handler: Optional[Callable[..., Awaitable[None]]] = None,
+               pts: Optional[int] = None, replay: bool = False):
+        """إضافة رسالة (أو حدث تعديل/حذف مع معالجه) إلى طابور القناة بترتيب الوصول
+
+        الأحداث المباشرة تُؤجل أثناء الإيقاف المؤقت، وأحداث الاستكمال (replay) تُضاف مباشرة.
+        """
+        self.received += 1
+        item = (handler or self.archive_fn, message, pts, replay)
+        if self._held is not None and not replay:
+            self._held.append(item)
+        else:
+            self.queue.put_nowait(item)
+
+    def pause(self):
+        """تأجيل الأحداث المباشرة حتى ينتهي استكمال ما فات"""
+        if self._held is None:
+            self._held = []
+
+    def resume(self):
+        """إضافة الأحداث المؤجلة إلى الطابور بعد أحداث الاستكمال"""
+        held, self._held = self._held or [], None
+        for item in held:
+            self.queue.put_nowait(item)
+
+    def advance(self, pts: Optional[int]):
+        """تحديث آخر pts تمت معالجته"""
+        if pts is not None and (self.pts is None or pts > self.pts):
+            self.pts = pts
+
+    async def stop(self):
+        """أرشفة ما تبقى ثم إيقاف العامل"""
+        self.resume()
+        if not self.is_running:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        # كل الطلبات الصادرة من هذا العامل تُحسب على ميزانية هذه القناة
+        current_channel.set(self.channel)
+        while True:
+            handler, message, pts, replay = await self.queue.get()
+            token = current_replay.set(replay)
+            try:
+                await handler(message)
+                self.advance(pts)
+                self.archived += 1
+                self.last_message_id = getattr(message, 'id', self.last_message_id)
+                self.last_archived_at = time.time()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ خطأ في أرشفة رسالة من {self.channel}: {e}")
+            finally:
+                current_replay.reset(token)
+                self.queue.task_done()
+
+    def stats(self) -> Dict:
+        """إحصائيات القناة"""
+        return {
+            'channel': self.channel,
+            'received': self.received,
+            'archived': self.archived,
+            'errors': self.errors,
+            'pending': self.queue.qsize() + len(self._held or []),
+            'last_message_id': self.last_message_id,
+            'last_archived_at': self.last_archived_at,
+        }
+
+class ChannelIngestion:
+    """إدارة عمال القنوات وتوجيه الرسائل الواردة إليهم"""
+
+    def __init__(self, archive_fn: Callable[..., Awaitable[None]]):
+        self.archive_fn = archive_fn
+        self.workers: Dict[str, ChannelWorker] = {}
+
+        # معرف المحادثة الرقمي (chat_id) -> اسم القناة كما أُدخل في الإعدادات
+        self.chat_ids: Dict[int, str] = {}
+
+    def set_channels(self, channels: List[str]):
+        """تحديث قائمة القنوات (إضافة عمال جدد وإزالة القديمة)"""
+        for channel in channels:
+            if channel not in self.workers:
+                self.workers[channel] = ChannelWorker(channel, self.archive_fn)
+        for channel in list(self.workers):
+            if channel not in channels:
+                asyncio.ensure_future(self.workers.pop(channel).stop())
+        self.chat_ids = {chat_id: name for chat_id, name in self.chat_ids.items() if name in self.workers}
+
+    async def resolve(self, client):
+        """ربط المعرفات الرقمية للقنوات بأسمائها لتوجيه الأحداث"""
+        for channel in self.workers:
+            try:
+                chat_id = await client.get_peer_id(channel)
+                self.chat_ids[chat_id] = channel
+                self.workers[channel].chat_id = chat_id
+            except Exception as e:
+                logger.error(f"❌ تعذر الوصول إلى القناة {channel}: {e}")
+
+    def start(self):
+        """بدء جميع العمال"""
+        for worker in self.workers.values():
+            worker.start()
+
+    async def stop(self):
+        """إيقاف جميع العمال بعد تفريغ طوابيرهم"""
+        for worker in list(self.workers.values()):
+            await worker.stop()
+
+    def channel_for(self, chat_id: int) -> str:
+        """اسم القناة لمعرف محادثة رقمي"""
+        return self.chat_ids.get(chat_id, str(chat_id))
+
+    def worker_for(self, chat_id: int) -> ChannelWorker:
+        """عامل القناة لمعرف محادثة رقمي (يُنشأ إن لم يوجد)"""
+        channel = self.channel_for(chat_id)
+        worker = self.workers.get(channel)
+        if worker is None:
+            worker = self.workers[channel] = ChannelWorker(channel, self.archive_fn)
+        worker.chat_id = chat_id
+        worker.start()
+        return worker
+
+    def submit(self, chat_id: int, message, handler: Optional[Callable[..., Awaitable[None]]] = None,
+               pts: Optional[int] = None, replay: bool = False):
+        """توجيه رسالة واردة (أو حدث تعديل/حذف) إلى عامل قناتها"""
+        self.worker_for(chat_id).submit(message, handler, pts, replay)
+
+    def stats(self) -> List[Dict]:
+        """إحصائيات جميع القنوات"""
+        return [worker.stats() for worker in self.workers.values()]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+نقاط الاستئناف لمهام الأرشفة الرجعية
+تحفظ حدود كل مهمة وآخر رسالة تمت معالجتها في كل جزء حتى يمكن الاستئناف بعد التوقف
+"""
+
+import logging
+import sqlite3
+from typing import Optional, List, Dict, Tuple
+
+from utils.storage_executor import StorageExecutor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS backfill_jobs (
+        job_id TEXT PRIMARY KEY,
+        channel TEXT NOT NULL,
+        start_date TEXT,
+        end_date TEXT,
+        min_id INTEGER NOT NULL,
+        max_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        archived_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    '''CREATE TABLE IF NOT EXISTS backfill_shards (
+        job_id TEXT NOT NULL,
+        low_id INTEGER NOT NULL,
+        high_id INTEGER NOT NULL,
+        last_id INTEGER NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (job_id, low_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_backfill_jobs_status ON backfill_jobs(status, channel)'
+]
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء جداول نقاط الاستئناف"""
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+def make_job_id(channel, start_date=None, end_date=None, min_id: int = 0, max_id: int = 0) -> str:
+    """معرف ثابت للمهمة حتى يعاد استخدامه عند تكرار نفس الطلب"""
+    if start_date is not None or end_date is not None:
+        return f"{channel}:{start_date}:{end_date}"
+    return f"{channel}:ids:{min_id}:{max_id}"
+
+class BackfillCheckpoints:
+    """حفظ وقراءة نقاط الاستئناف عبر خيط الكتابة"""
+
+    def __init__(self, storage: StorageExecutor):
+        self.storage = storage
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        """قراءة مهمة محفوظة"""
+        row = await self.storage.fetchone(
+            '''SELECT job_id, channel, start_date, end_date, min_id, max_id, status, archived_count
+               FROM backfill_jobs WHERE job_id = ?''',
+            (job_id,)
+        )
+        if not row:
+            return None
+        return dict(zip(
+            ('job_id', 'channel', 'start_date', 'end_date', 'min_id', 'max_id', 'status', 'archived_count'),
+            row
+        ))
+
+    async def start_job(self, job_id: str, channel, start_date, end_date,
+                        min_id: int, max_id: int, shards: List[Tuple[int, int]]):
+        """تسجيل مهمة جديدة مع أجزائها"""
+        def task(conn):
+            conn.execute(
+                '''INSERT OR REPLACE INTO backfill_jobs
+                   (job_id, channel, start_date, end_date, min_id, max_id, status, archived_count)
+                   VALUES (?, ?, ?, ?, ?, ?, 'running', 0)''',
+                (job_id, str(channel),
+                 str(start_date) if start_date else None,
+                 str(end_date) if end_date else None,
+                 min_id, max_id)
+            )
+            conn.execute('DELETE FROM backfill_shards WHERE job_id = ?', (job_id,))
+            conn.executemany(
+                'INSERT INTO backfill_shards (job_id, low_id, high_id, last_id) VALUES (?, ?, ?, ?)',
+                [(job_id, low, high, low) for low, high in shards]
+            )
+            conn.commit()
+        await self.storage.write(task)
+
+    async def resume_job(self, job_id: str):
+        """إعادة تفعيل مهمة متوقفة"""
+        await self.storage.execute(
+            "UPDATE backfill_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+            (job_id,)
+        )
+
+    async def get_shards(self, job_id: str) -> List[Dict]:
+        """أجزاء المهمة مع آخر معرف تمت معالجته"""
+        rows = await self.storage.fetchall(
+            'SELECT low_id, high_id, last_id, done FROM backfill_shards WHERE job_id = ? ORDER BY low_id',
+            (job_id,)
+        )
+        return [
+            {'low': low, 'high': high, 'last_id': last_id, 'done': bool(done)}
+            for low, high, last_id, done in rows
+        ]
+
+    async def save_progress(self, job_id: str, low: int, last_id: int, archived: int, done: bool = False):
+        """حفظ تقدم جزء (يُستدعى بعد التأكد من حفظ الرسائل فعلاً)"""
+        def task(conn):
+            conn.execute(
+                '''UPDATE backfill_shards SET last_id = ?, done = ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE job_id = ? AND low_id = ?''',
+                (last_id, int(done), job_id, low)
+            )
+            conn.execute(
+                '''UPDATE backfill_jobs SET archived_count = archived_count + ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE job_id = ?''',
+                (archived, job_id)
+            )
+            conn.commit()
+        await self.storage.write(task)
+
+    async def finish_job(self, job_id: str, status: str = 'done'):
+        """إنهاء المهمة (done أو interrupted)"""
+        await self.storage.execute(
+            "UPDATE backfill_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+            (status, job_id)
+        )
+
+    async def unfinished_jobs(self, channel=None) -> List[Dict]:
+        """المهام غير المكتملة (بعد انقطاع أو إعادة تشغيل)"""
+        query = '''SELECT job_id FROM backfill_jobs WHERE status != 'done' '''
+        params = ()
+        if channel is not None:
+            query += 'AND channel = ? '
+            params = (str(channel),)
+        query += 'ORDER BY created_at'
+
+        jobs = []
+        for (job_id,) in await self.storage.fetchall(query, params):
+            job = await self.get_job(job_id)
+            if job:
+                jobs.append(job)
+        return jobs
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+خريطة تغطية معرفات الرسائل لكل قناة
+المعرفات المؤرشفة (أو التي فُحصت ولم توجد) تُحفظ كنطاقات متصلة، فتُعرف الفجوات دون قراءة الأرشيف
+"""
+
+import logging
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional, List, Dict, Tuple, Iterator
+
+from utils.storage_executor import StorageExecutor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS id_coverage (
+        channel_id INTEGER NOT NULL,
+        start_id INTEGER NOT NULL,
+        end_id INTEGER NOT NULL,
+        PRIMARY KEY (channel_id, start_id)
+    ) WITHOUT ROWID'''
+]
+
+# بناء النطاقات من الرسائل المؤرشفة مسبقاً (المعرفات المتتالية لها نفس message_id - الترتيب)
+REBUILD_SQL = '''
+    INSERT INTO id_coverage (channel_id, start_id, end_id)
+    SELECT channel_id, MIN(message_id), MAX(message_id) FROM (
+        SELECT channel_id, message_id,
+               message_id - ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY message_id) AS run
+        FROM archived_messages WHERE channel_id IS NOT NULL
+    )
+    GROUP BY channel_id, run
+'''
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء جدول التغطية وبناؤه من الأرشيف الموجود عند إنشائه لأول مرة"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'id_coverage'"
+    ).fetchone()
+    for statement in SCHEMA:
+        conn.execute(statement)
+    if not exists:
+        conn.execute(REBUILD_SQL)
+
+def compress_ids(ids) -> List[Tuple[int, int]]:
+    """تحويل مجموعة معرفات إلى نطاقات متصلة [start, end]"""
+    runs: List[Tuple[int, int]] = []
+    for message_id in sorted(set(ids)):
+        if runs and message_id == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], message_id)
+        else:
+            runs.append((message_id, message_id))
+    return runs
+
+class IdRanges:
+    """مجموعة معرفات مخزنة كنطاقات متصلة مرتبة [start, end] (ترميز run-length)"""
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.total = 0
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __contains__(self, message_id: int) -> bool:
+        i = bisect_right(self.starts, message_id) - 1
+        return i >= 0 and self.ends[i] >= message_id
+
+    @property
+    def first(self) -> Optional[int]:
+        return self.starts[0] if self.starts else None
+
+    @property
+    def last(self) -> Optional[int]:
+        return self.ends[-1] if self.ends else None
+
+    def covers(self, start: int, end: int) -> bool:
+        """هل النطاق [start, end] مغطى بالكامل"""
+        i = bisect_right(self.starts, start) - 1
+        return i >= 0 and self.ends[i] >= end
+
+    def add(self, start: int, end: int) -> bool:
+        """إضافة النطاق [start, end] ودمجه مع النطاقات الملاصقة (False إذا كان مغطى بالفعل)"""
+        i = bisect_left(self.ends, start - 1)
+        j = bisect_right(self.starts, end + 1)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+            if j - i == 1 and self.starts[i] == start and self.ends[i] == end:
+                return False
+
+        self.total -= sum(self.ends[k] - self.starts[k] + 1 for k in range(i, j))
+        self.starts[i:j] = array('q', [start])
+        self.ends[i:j] = array('q', [end])
+        self.total += end - start + 1
+        return True
+
+    def missing(self, low: int, high: int) -> Iterator[Tuple[int, int]]:
+        """النطاقات غير المغطاة ضمن [low, high]"""
+        i = max(0, bisect_right(self.starts, low) - 1)
+        cursor = low
+        while cursor <= high:
+            if i < len(self.starts) and self.starts[i] <= cursor:
+                cursor = max(cursor, self.ends[i] + 1)
+                i += 1
+                continue
+            gap_end = min(high, self.starts[i] - 1) if i < len(self.starts) else high
+            yield cursor, gap_end
+            cursor = gap_end + 1
+
+class IdCoverage:
+    """تغطية المعرفات لجميع القنوات في الذاكرة مع حفظها في جدول id_coverage"""
+
+    def __init__(self, storage: StorageExecutor):
+        self.storage = storage
+        self.channels: Dict[int, IdRanges] = {}
+        # التحديث يتم في خيط الكتابة والقراءة من حلقة الأحداث
+        self._lock = threading.Lock()
+
+    def load(self, conn: sqlite3.Connection):
+        """تحميل النطاقات المحفوظة إلى الذاكرة"""
+        cursor = conn.execute('SELECT channel_id, start_id, end_id FROM id_coverage ORDER BY channel_id, start_id')
+        with self._lock:
+            self.channels.clear()
+            for channel_id, start, end in cursor:
+                ranges = self.channels.setdefault(channel_id, IdRanges())
+                ranges.starts.append(start)
+                ranges.ends.append(end)
+                ranges.total += end - start + 1
+        logger.info(f"🧮 تم تحميل تغطية المعرفات لـ {len(self.channels)} قناة")
+
+    def record_rows(self, conn: sqlite3.Connection, rows: List[Dict]) -> List[Tuple[int, int, int]]:
+        """تسجيل معرفات الرسائل المحفوظة في الجدول (في خيط الكتابة وضمن نفس العملية، دون commit)
+
+        يُرجع النطاقات (القناة، البداية، النهاية) لتطبيقها على الذاكرة بـ apply بعد نجاح commit.
+        """
+        by_channel: Dict[int, List[int]] = {}
+        for row in rows:
+            if row.get('channel_id') is not None:
+                by_channel.setdefault(row['channel_id'], []).append(row['message_id'])
+
+        changes = []
+        for channel_id, ids in by_channel.items():
+            for start, end in compress_ids(ids):
+                if self._add(conn, channel_id, start, end):
+                    changes.append((channel_id, start, end))
+        return changes
+
+    def apply(self, changes: List[Tuple[int, int, int]]):
+        """إضافة النطاقات المحفوظة إلى الذاكرة (بعد commit، فلا تظهر نطاقات عملية أُلغيت)"""
+        with self._lock:
+            for channel_id, start, end in changes:
+                self.channels.setdefault(channel_id, IdRanges()).add(start, end)
+
+    def record_range(self, conn: sqlite3.Connection, channel_id: int, start: int, end: int):
+        """تسجيل نطاق فُحص بالكامل (المعرفات غير الموجودة فيه محذوفة من القناة)"""
+        if end >= start and self._add(conn, channel_id, start, end):
+            conn.commit()
+            self.apply([(channel_id, start, end)])
+
+    async def mark_scanned(self, channel_id: int, start: int, end: int):
+        """تسجيل نطاق فُحص بالكامل عبر خيط الكتابة"""
+        await self.storage.write(self.record_range, channel_id, start, end)
+
+    def _add(self, conn: sqlite3.Connection, channel_id: int, start: int, end: int) -> bool:
+        """دمج النطاق مع النطاقات المتداخلة أو الملاصقة في الجدول (False إذا كان مغطى بالفعل)
+
+        الدمج يتم في الجدول لأنه يتضمن إضافات العملية الحالية التي لم تصل إلى الذاكرة بعد.
+        """
+        with self._lock:
+            ranges = self.channels.get(channel_id)
+            if ranges is not None and ranges.covers(start, end):
+                return False
+
+        merged = conn.execute(
+            '''SELECT start_id, end_id FROM id_coverage
+               WHERE channel_id = ? AND start_id BETWEEN ? AND ?''',
+            (channel_id, start, end + 1)
+        ).fetchall()
+        before = conn.execute(
+            '''SELECT start_id, end_id FROM id_coverage
+               WHERE channel_id = ? AND start_id < ? ORDER BY start_id DESC LIMIT 1''',
+            (channel_id, start)
+        ).fetchone()
+        if before and before[1] >= start - 1:
+            merged.append(before)
+
+        new_start = min([start] + [old_start for old_start, _ in merged])
+        new_end = max([end] + [old_end for _, old_end in merged])
+        if merged == [(new_start, new_end)]:
+            return False
+        conn.executemany(
+            'DELETE FROM id_coverage WHERE channel_id = ? AND start_id = ?',
+            [(channel_id, old_start) for old_start, _ in merged]
+        )
+        conn.execute(
+            'INSERT INTO id_coverage (channel_id, start_id, end_id) VALUES (?, ?, ?)',
+            (channel_id, new_start, new_end)
+        )
+        return True
+
+    def missing(self, channel_id: int, low: int, high: int) -> List[Tuple[int, int]]:
+        """النطاقات غير المؤرشفة ضمن [low, high]"""
+        with self._lock:
+            ranges = self.channels.get(channel_id)
+            if ranges is None:
+                return [(low, high)] if high >= low else []
+            return list(ranges.missing(low, high))
+
+    def gaps(self, channel_id: int, limit: int = 20) -> Dict:
+        """ملخص الفجوات بين أول وآخر معرف مؤرشف مع أول limit فجوة"""
+        with self._lock:
+            ranges = self.channels.get(channel_id)
+            if ranges is None or not len(ranges):
+                return {'first': None, 'last': None, 'covered': 0, 'missing': 0, 'gaps': 0, 'ranges': []}
+
+            listed = []
+            for i in range(1, min(len(ranges), limit + 1)):
+                listed.append((ranges.ends[i - 1] + 1, ranges.starts[i] - 1))
+            return {
+                'first': ranges.first,
+                'last': ranges.last,
+                'covered': ranges.total,
+                'missing': ranges.last - ranges.first + 1 - ranges.total,
+                'gaps': len(ranges) - 1,
+                'ranges': listed
+            }
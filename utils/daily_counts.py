@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+عدادات الرسائل اليومية المجمعة (daily_counts)
+عدد الرسائل لكل (يوم بتوقيت الأرشيف، قناة، نوع وسائط) تحدّثه الـ triggers مع كل إدراج أو تعديل أو حذف،
+فيقرأ التصفح والإحصائيات من جدول صغير بدل عدّ صفوف الأرشيف
+"""
+
+import logging
+import sqlite3
+from typing import List, Tuple
+
+from utils.timestamps import period_bounds
+
+logger = logging.getLogger(__name__)
+
+# الرسائل النصية (media_type فارغ) تُعد تحت هذا النوع
+TEXT_BUCKET = 'text'
+
+# الألبوم عنصر واحد في التصفح مهما اختلفت أنواع أجزائه: أجزاؤه تُعد رسائلَ في أنواعها،
+# ويُعد الألبوم نفسه عنصراً واحداً تحت هذا النوع لكل يوم فيه جزء منه
+ALBUM_BUCKET = 'album'
+
+BUCKET_SQL = f"COALESCE({{row}}.media_type, '{TEXT_BUCKET}')"
+
+# هل للألبوم أجزاء أخرى في نفس اليوم (غير الصف نفسه)
+OTHER_PARTS_SQL = '''EXISTS (
+    SELECT 1 FROM archived_messages
+    WHERE channel_id = {row}.channel_id AND grouped_id = {row}.grouped_id
+      AND local_date = {row}.local_date AND id != {row}.id
+)'''
+
+# الأيام بتوقيت الأرشيف (local_date)، والصفوف التي لم يُحسب يومها بعد تُعد عند ترحيلها
+def _add_row(row: str) -> str:
+    """عبارات إضافة صف إلى العدادات (row هو new في الـ trigger)"""
+    return f'''
+        INSERT INTO daily_counts (local_date, channel_id, media_type, message_count, item_count)
+        SELECT {row}.local_date, {row}.channel_id, {BUCKET_SQL.format(row=row)}, 1, {row}.grouped_id IS NULL
+        WHERE {row}.local_date IS NOT NULL
+        ON CONFLICT (local_date, channel_id, media_type) DO UPDATE SET
+            message_count = message_count + 1, item_count = item_count + excluded.item_count;
+        INSERT INTO daily_counts (local_date, channel_id, media_type, message_count, item_count)
+        SELECT {row}.local_date, {row}.channel_id, '{ALBUM_BUCKET}', 0, 1
+        WHERE {row}.local_date IS NOT NULL AND {row}.grouped_id IS NOT NULL AND NOT {OTHER_PARTS_SQL.format(row=row)}
+        ON CONFLICT (local_date, channel_id, media_type) DO UPDATE SET item_count = item_count + 1;'''
+
+def _remove_row(row: str) -> str:
+    """عبارات طرح صف من العدادات (row هو old في الـ trigger)"""
+    return f'''
+        UPDATE daily_counts SET message_count = message_count - 1, item_count = item_count - ({row}.grouped_id IS NULL)
+        WHERE local_date = {row}.local_date
+          AND channel_id = {row}.channel_id AND media_type = {BUCKET_SQL.format(row=row)};
+        UPDATE daily_counts SET item_count = item_count - 1
+        WHERE local_date = {row}.local_date
+          AND channel_id = {row}.channel_id AND media_type = '{ALBUM_BUCKET}'
+          AND {row}.grouped_id IS NOT NULL AND NOT {OTHER_PARTS_SQL.format(row=row)};'''
+
+# الأعمدة التي تحدد مكان الصف في العدادات
+BUCKET_COLUMNS = ('local_date', 'channel_id', 'media_type', 'grouped_id')
+
+TRIGGERS = ('daily_counts_insert', 'daily_counts_delete', 'daily_counts_update')
+
+SCHEMA = [
+    # المفتاح يبدأ بالتاريخ: قائمة أيام الشهر قراءة واحدة لنطاق متصل من الجدول
+    '''CREATE TABLE IF NOT EXISTS daily_counts (
+        local_date TEXT NOT NULL,
+        channel_id INTEGER NOT NULL,
+        media_type TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        item_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (local_date, channel_id, media_type)
+    ) WITHOUT ROWID''',
+    f'''CREATE TRIGGER IF NOT EXISTS daily_counts_insert AFTER INSERT ON archived_messages
+        BEGIN{_add_row('new')}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS daily_counts_delete AFTER DELETE ON archived_messages
+        BEGIN{_remove_row('old')}
+        END''',
+    # إعادة أرشفة رسالة بنفس قيمها (upsert) لا تغير العدادات، وترحيل local_date ينقل الصف إلى يومه
+    f'''CREATE TRIGGER IF NOT EXISTS daily_counts_update AFTER UPDATE OF {', '.join(BUCKET_COLUMNS)} ON archived_messages
+        WHEN {' OR '.join(f'old.{column} IS NOT new.{column}' for column in BUCKET_COLUMNS)}
+        BEGIN{_remove_row('old')}{_add_row('new')}
+        END'''
+]
+
+# حساب العدادات من الأرشيف الموجود (مرة واحدة عند إنشاء الجدول)
+BACKFILL_SQL = [
+    f'''INSERT INTO daily_counts (local_date, channel_id, media_type, message_count, item_count)
+        SELECT local_date, channel_id, COALESCE(media_type, '{TEXT_BUCKET}'), COUNT(*), SUM(grouped_id IS NULL)
+        FROM archived_messages
+        WHERE local_date IS NOT NULL
+        GROUP BY local_date, channel_id, COALESCE(media_type, '{TEXT_BUCKET}')''',
+    f'''INSERT INTO daily_counts (local_date, channel_id, media_type, message_count, item_count)
+        SELECT local_date, channel_id, '{ALBUM_BUCKET}', 0, COUNT(DISTINCT grouped_id)
+        FROM archived_messages
+        WHERE local_date IS NOT NULL AND grouped_id IS NOT NULL
+        GROUP BY local_date, channel_id'''
+]
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء جدول العدادات والـ triggers، وحسابها للأرشيف الموجود عند إنشائها أول مرة
+
+    يُستدعى بعد إضافة عمود local_date (timestamps.init_schema).
+    """
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(daily_counts)')}
+    if columns and 'local_date' not in columns:
+        # إصدار سابق كان يعد الأيام بتوقيت UTC (year, month, day) - يُعاد حسابه بأيام الأرشيف
+        for trigger in TRIGGERS:
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute('DROP TABLE daily_counts')
+        logger.info("📊 إعادة حساب عدادات الرسائل بأيام توقيت الأرشيف...")
+        columns = set()
+
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    if not columns:
+        # في نفس المعاملة مع إنشاء الـ triggers، فلا يُعد صف مرتين ولا يفوت
+        for statement in BACKFILL_SQL:
+            conn.execute(statement)
+        days = conn.execute('SELECT COUNT(DISTINCT local_date) FROM daily_counts').fetchone()[0]
+        if days:
+            logger.info(f"📊 تم حساب عدادات الرسائل لـ {days:,} يوم من الأرشيف الموجود")
+
+# استعلامات التصفح: الألبوم عنصر واحد (item_count)، والأيام بلا عناصر لا تظهر
+def count_years(conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+    """عدد العناصر لكل سنة (الأحدث أولاً)"""
+    return conn.execute(
+        '''SELECT CAST(substr(local_date, 1, 4) AS INTEGER) AS year, SUM(item_count) FROM daily_counts
+           GROUP BY year HAVING SUM(item_count) > 0 ORDER BY year DESC'''
+    ).fetchall()
+
+def count_months(conn: sqlite3.Connection, year: int) -> List[Tuple[int, int]]:
+    """عدد العناصر لكل شهر في السنة"""
+    return conn.execute(
+        '''SELECT CAST(substr(local_date, 6, 2) AS INTEGER) AS month, SUM(item_count) FROM daily_counts
+           WHERE local_date >= ? AND local_date < ?
+           GROUP BY month HAVING SUM(item_count) > 0 ORDER BY month''',
+        period_bounds(year)
+    ).fetchall()
+
+def count_days(conn: sqlite3.Connection, year: int, month: int) -> List[Tuple[int, int]]:
+    """عدد العناصر لكل يوم في الشهر"""
+    return conn.execute(
+        '''SELECT CAST(substr(local_date, 9, 2) AS INTEGER) AS day, SUM(item_count) FROM daily_counts
+           WHERE local_date >= ? AND local_date < ?
+           GROUP BY local_date HAVING SUM(item_count) > 0 ORDER BY local_date''',
+        period_bounds(year, month)
+    ).fetchall()
+
+# استعلامات الإحصائيات: عدد الرسائل (كل جزء من الألبوم رسالة)
+def count_messages(conn: sqlite3.Connection, year: int = None, month: int = None, day: int = None) -> int:
+    """عدد الرسائل في الأرشيف كله، أو في سنة أو شهر أو يوم (بتوقيت الأرشيف)"""
+    sql = 'SELECT COALESCE(SUM(message_count), 0) FROM daily_counts'
+    if year is None:
+        return conn.execute(sql).fetchone()[0]
+    return conn.execute(sql + ' WHERE local_date >= ? AND local_date < ?', period_bounds(year, month, day)).fetchone()[0]
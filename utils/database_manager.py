@@ -2,10 +2,12 @@
 # -*- coding: utf-8 -*-
 """
 مدير قاعدة البيانات مع دعم أنواع مختلفة
+PostgreSQL وMySQL عبر مجمع اتصالات (كل استعلام يأخذ اتصالاً منه ويعيده)، فتعمل الاستعلامات المتزامنة بالتوازي
 """
 
 import asyncio
 import logging
+from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any
 from pathlib import Path
 
@@ -17,8 +19,11 @@ class DatabaseManager:
     def __init__(self, config):
         self.config = config
         self.db_type = config.database.db_type
+        self.pool_params = config.database.get_pool_params()
         self.connection = None
         self.cursor = None
+        # مجمع الاتصالات (PostgreSQL وMySQL)
+        self.pool = None
     
     async def connect(self):
         """الاتصال بقاعدة البيانات"""
@@ -55,25 +60,95 @@ class DatabaseManager:
         self.cursor = self.connection.cursor()
     
     async def _connect_postgresql(self):
-        """الاتصال بـ PostgreSQL"""
+        """إنشاء مجمع اتصالات PostgreSQL"""
         try:
             import asyncpg
         except ImportError:
             raise ImportError("يرجى تثبيت asyncpg: pip install asyncpg")
         
         conn_params = self.config.database.connection_string
-        self.connection = await asyncpg.connect(**conn_params)
+        self.pool = await asyncpg.create_pool(
+            **conn_params,
+            min_size=self.pool_params['pool_min_size'],
+            max_size=self.pool_params['pool_max_size'],
+            # الاتصال الخامل أطول من هذا يُغلق ويُفتح بدلاً منه عند الحاجة
+            max_inactive_connection_lifetime=self.pool_params['pool_recycle'],
+            timeout=self.pool_params['pool_timeout']
+        )
     
     async def _connect_mysql(self):
-        """الاتصال بـ MySQL"""
+        """إنشاء مجمع اتصالات MySQL"""
         try:
             import aiomysql
         except ImportError:
             raise ImportError("يرجى تثبيت aiomysql: pip install aiomysql")
         
         conn_params = self.config.database.connection_string
-        self.connection = await aiomysql.connect(**conn_params)
-        self.cursor = await self.connection.cursor()
+        self.pool = await aiomysql.create_pool(
+            **conn_params,
+            minsize=self.pool_params['pool_min_size'],
+            maxsize=self.pool_params['pool_max_size'],
+            # في aiomysql هو أقصى عمر للاتصال منذ فتحه (وليس مدة الخمول)، عدد صحيح (-1 لتعطيله)
+            pool_recycle=int(self.pool_params['pool_recycle']) or -1,
+            connect_timeout=self.pool_params['pool_timeout'],
+            charset='utf8mb4'
+        )
+    
+    @asynccontextmanager
+    async def acquire(self):
+        """أخذ اتصال من المجمع وإعادته بعد الاستخدام (مع مهلة انتظار وفحص الاتصال)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.pool_params['pool_timeout']
+        connection = await self._acquire_connection(deadline - loop.time())
+        
+        # بعد انقطاع الخادم قد تكون عدة اتصالات في المجمع منقطعة، فيُستبدل كل منها حتى انتهاء المهلة
+        while self.pool_params['health_check'] and not await self._is_alive(connection):
+            logger.warning("⚠️ اتصال منقطع في المجمع، سيتم استبداله")
+            await self._release(connection, broken=True)
+            connection = await self._acquire_connection(deadline - loop.time())
+        
+        try:
+            yield connection
+        finally:
+            await self._release(connection)
+    
+    async def _acquire_connection(self, remaining: float):
+        """انتظار اتصال متاح خلال ما تبقى من مهلة pool_timeout"""
+        timeout = self.pool_params['pool_timeout']
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            if self.db_type == 'postgresql':
+                return await self.pool.acquire(timeout=remaining)
+            # acquire في aiomysql لا يقبل مهلة
+            return await asyncio.wait_for(self.pool.acquire(), remaining)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"لا يوجد اتصال متاح بقاعدة البيانات خلال {timeout} ثانية "
+                f"(pool_max_size={self.pool_params['pool_max_size']})"
+            )
+    
+    async def _is_alive(self, connection) -> bool:
+        """فحص الاتصال قبل استخدامه"""
+        try:
+            if self.db_type == 'postgresql':
+                await connection.execute('SELECT 1')
+            else:
+                await connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+    
+    async def _release(self, connection, broken: bool = False):
+        """إعادة الاتصال إلى المجمع (المنقطع يُغلق فيفتح المجمع بدلاً منه)"""
+        if self.db_type == 'postgresql':
+            if broken:
+                connection.terminate()
+            await self.pool.release(connection)
+        else:
+            if broken:
+                connection.close()
+            self.pool.release(connection)
     
     async def _create_tables(self):
         """إنشاء الجداول المطلوبة"""
@@ -170,14 +245,15 @@ class DatabaseManager:
             'CREATE INDEX IF NOT EXISTS idx_year_month_day ON archived_messages(year, month, day)'
         ]
         
-        for table in tables:
-            await self.connection.execute(table)
-        
-        for index in indexes:
-            try:
-                await self.connection.execute(index)
-            except Exception as e:
-                logger.warning(f"تحذير في إنشاء الفهرس: {e}")
+        async with self.acquire() as connection:
+            for table in tables:
+                await connection.execute(table)
+            
+            for index in indexes:
+                try:
+                    await connection.execute(index)
+                except Exception as e:
+                    logger.warning(f"تحذير في إنشاء الفهرس: {e}")
     
     async def _create_mysql_tables(self):
         """إنشاء جداول MySQL"""
@@ -218,16 +294,18 @@ class DatabaseManager:
             'CREATE INDEX idx_year_month_day ON archived_messages(year, month, day)'
         ]
         
-        for table in tables:
-            await self.cursor.execute(table)
-        
-        for index in indexes:
-            try:
-                await self.cursor.execute(index)
-            except Exception as e:
-                logger.warning(f"تحذير في إنشاء الفهرس: {e}")
-        
-        await self.connection.commit()
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                for table in tables:
+                    await cursor.execute(table)
+                
+                for index in indexes:
+                    try:
+                        await cursor.execute(index)
+                    except Exception as e:
+                        logger.warning(f"تحذير في إنشاء الفهرس: {e}")
+            
+            await connection.commit()
     
     async def execute_query(self, query: str, params: tuple = None):
         """تنفيذ استعلام"""
@@ -241,18 +319,22 @@ class DatabaseManager:
                 return self.cursor.fetchall()
             
             elif self.db_type == 'postgresql':
-                if params:
-                    return await self.connection.fetch(query, *params)
-                else:
-                    return await self.connection.fetch(query)
+                async with self.acquire() as connection:
+                    if params:
+                        return await connection.fetch(query, *params)
+                    else:
+                        return await connection.fetch(query)
             
             elif self.db_type == 'mysql':
-                if params:
-                    await self.cursor.execute(query, params)
-                else:
-                    await self.cursor.execute(query)
-                await self.connection.commit()
-                return await self.cursor.fetchall()
+                # مؤشر لكل استعلام (المؤشر المشترك لا يصلح للاستعلامات المتزامنة)
+                async with self.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        if params:
+                            await cursor.execute(query, params)
+                        else:
+                            await cursor.execute(query)
+                        await connection.commit()
+                        return await cursor.fetchall()
                 
         except Exception as e:
             logger.error(f"❌ خطأ في تنفيذ الاستعلام: {e}")
@@ -305,10 +387,14 @@ class DatabaseManager:
         """قطع الاتصال"""
         try:
             if self.connection:
-                if self.db_type == 'sqlite':
-                    self.connection.close()
+                self.connection.close()
+            if self.pool:
+                if self.db_type == 'postgresql':
+                    await self.pool.close()
                 else:
-                    await self.connection.close()
+                    self.pool.close()
+                    await self.pool.wait_closed()
+                self.pool = None
             logger.info("✅ تم قطع الاتصال بقاعدة البيانات")
         except Exception as e:
             logger.error(f"❌ خطأ في قطع الاتصال: {e}")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تحويل التواريخ إلى حدود معرفات الرسائل
+بحث ثنائي (متعدد الفروع) باستخدام get_messages(ids=[...]) مع حفظ النتائج في جدول date_id_bounds
+"""
+
+import logging
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, List, Tuple
+
+from utils.storage_executor import StorageExecutor, ensure_columns
+from utils.timestamps import archive_timezone_name, day_bounds, local_today
+
+logger = logging.getLogger(__name__)
+
+# أقصى عدد معرفات يقبله طلب get_messages واحد
+PROBE_BATCH = 100
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS date_id_bounds (
+        channel TEXT NOT NULL,
+        day TEXT NOT NULL,
+        first_id INTEGER NOT NULL,
+        last_id INTEGER NOT NULL,
+        resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (channel, day)
+    )'''
+]
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء جدول حدود المعرفات"""
+    for statement in SCHEMA:
+        conn.execute(statement)
+    # الحدود محسوبة لأيام توقيت الأرشيف (المحفوظة قبل إضافة العمود محسوبة بتوقيت UTC)
+    ensure_columns(conn, 'date_id_bounds', {'timezone': "TEXT NOT NULL DEFAULT 'UTC'"})
+
+def day_start(day: date) -> datetime:
+    """بداية اليوم بتوقيت الأرشيف (نفس حدود local_date للرسائل المؤرشفة)"""
+    return datetime.fromtimestamp(day_bounds(day)[0], timezone.utc)
+
+def probe_ids(low: int, high: int, count: int = PROBE_BATCH) -> List[int]:
+    """اختيار معرفات موزعة بالتساوي داخل النطاق المفتوح (low, high)"""
+    span = high - low - 1
+    if span <= 0:
+        return []
+    if span <= count:
+        return list(range(low + 1, high))
+    step = span / (count + 1)
+    ids = sorted({low + 1 + int(step * (i + 1)) for i in range(count)})
+    return [i for i in ids if low < i < high]
+
+class DateIdResolver:
+    """إيجاد أول وآخر معرف رسالة ليوم معين دون المرور على السجل كاملاً"""
+
+    def __init__(self, client, storage: Optional[StorageExecutor] = None):
+        self.client = client
+        self.storage = storage
+        self.probes = 0
+
+    async def day_range(self, channel, start_date: date, end_date: date) -> Tuple[int, int]:
+        """نطاق المعرفات (min_id, max_id] الذي يغطي الفترة [start_date, end_date]"""
+        first = await self.day_bounds(channel, start_date)
+        last = first if end_date == start_date else await self.day_bounds(channel, end_date)
+        if first is None or last is None:
+            return 0, 0
+        return first[0] - 1, last[1]
+
+    async def day_bounds(self, channel, day: date) -> Optional[Tuple[int, int]]:
+        """(أول معرف، آخر معرف) لرسائل اليوم، مع استخدام الجدول المؤقت للأيام المنتهية"""
+        cached = await self._load(channel, day)
+        if cached:
+            return cached
+
+        top = await self.client.get_messages(channel, limit=1)
+        self.probes += 1
+        if not top:
+            return None
+        top_id = top[0].id
+
+        first_id = await self.first_id_at(channel, day_start(day), 0, top_id + 1)
+        next_id = await self.first_id_at(channel, day_start(day + timedelta(days=1)), first_id - 1, top_id + 1)
+        bounds = (first_id, next_id - 1)
+
+        # لا نحفظ اليوم الحالي لأن آخر معرف فيه ما زال يتغير
+        if day < local_today():
+            await self._save(channel, day, bounds)
+
+        return bounds
+
+    async def first_id_at(self, channel, moment: datetime, low: int, high: int) -> int:
+        """أصغر معرف تاريخه >= moment، بشرط أن low قبله و high بعده (أو خارج السجل)"""
+        while high - low > 1:
+            ids = probe_ids(low, high)
+            messages = await self.client.get_messages(channel, ids=ids)
+            self.probes += 1
+
+            exhaustive = len(ids) == high - low - 1
+            narrowed = False
+            for message in messages:
+                if message is None:
+                    continue
+                narrowed = True
+                if message.date < moment:
+                    low = message.id
+                else:
+                    high = message.id
+                    break
+
+            if exhaustive:
+                return high
+
+            if not narrowed:
+                # جميع المعرفات المختبرة محذوفة (نطاق متناثر) - حسم الحد بطلبين داخل النطاق
+                return await self._resolve_sparse(channel, moment, low, high)
+
+        return high
+
+    async def _resolve_sparse(self, channel, moment: datetime, low: int, high: int) -> int:
+        """حسم الحد داخل نطاق معظم رسائله محذوفة"""
+        # أحدث رسالة في النطاق قبل moment
+        before = await self.client.get_messages(
+            channel, limit=1, offset_date=moment, min_id=low, max_id=high
+        )
+        self.probes += 1
+        if before:
+            low = before[0].id
+
+        # أول رسالة موجودة بعد low هي المطلوبة
+        after = await self.client.get_messages(
+            channel, limit=1, min_id=low, max_id=high, reverse=True
+        )
+        self.probes += 1
+        return after[0].id if after else high
+
+    async def _load(self, channel, day: date) -> Optional[Tuple[int, int]]:
+        if not self.storage:
+            return None
+        row = await self.storage.fetchone(
+            'SELECT first_id, last_id FROM date_id_bounds WHERE channel = ? AND day = ? AND timezone = ?',
+            (str(channel), day.isoformat(), archive_timezone_name())
+        )
+        return tuple(row) if row else None
+
+    async def _save(self, channel, day: date, bounds: Tuple[int, int]):
+        if not self.storage:
+            return
+        await self.storage.execute(
+            '''INSERT OR REPLACE INTO date_id_bounds (channel, day, first_id, last_id, timezone)
+               VALUES (?, ?, ?, ?, ?)''',
+            (str(channel), day.isoformat(), bounds[0], bounds[1], archive_timezone_name())
+        )
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+طابور الرسائل الفاشلة (Dead Letter Queue)
+عمليات الأرشفة التي فشلت تُحفظ في ملف قاعدة بيانات منفصل ويُعاد تنفيذها بتأخير متزايد
+"""
+
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Dict, Tuple, Any, Callable, Awaitable
+
+from utils.storage_executor import StorageExecutor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS dead_letters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        channel_id INTEGER,
+        message_id INTEGER,
+        payload TEXT NOT NULL,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'pending',
+        next_attempt_at REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_dead_letters_due ON dead_letters(status, next_attempt_at)'
+]
+
+ENTRY_COLUMNS = ('id', 'kind', 'channel_id', 'message_id', 'payload', 'error', 'attempts', 'status', 'next_attempt_at', 'created_at')
+
+# أطول فترة انتظار بين فحص العناصر المستحقة، وأقصى عدد عناصر في كل فحص
+POLL_INTERVAL = 30.0
+DUE_BATCH = 100
+
+class DeadLetterQueue:
+    """حفظ العمليات الفاشلة وإعادة محاولتها بتأخير أسي حتى تنجح أو تُستنفد المحاولات"""
+
+    def __init__(self, storage: StorageExecutor, path: str = 'dead_letters.db',
+                 base_delay: float = 5.0, max_delay: float = 3600.0, max_attempts: int = 10):
+        self.storage = storage
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        # ملف منفصل حتى يمكن التسجيل حتى لو كانت قاعدة الأرشيف مقفلة
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+        # نوع العملية -> دالة إعادة التنفيذ (ترفع استثناء عند الفشل)
+        self.handlers: Dict[str, Callable[[Any], Awaitable[None]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # إحصائيات
+        self.added = 0
+        self.replayed = 0
+
+    def register(self, kind: str, handler: Callable[[Any], Awaitable[None]]):
+        """تسجيل دالة إعادة تنفيذ نوع من العمليات"""
+        self.handlers[kind] = handler
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """بدء عامل إعادة المحاولة"""
+        if not self.is_running:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="dead-letters")
+
+    async def stop(self):
+        """إيقاف عامل إعادة المحاولة"""
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    async def add(self, kind: str, payload: Any, error: Any):
+        """حفظ عملية فاشلة واحدة"""
+        await self.add_many(kind, [(payload, error)])
+
+    async def add_many(self, kind: str, items: List[Tuple[Any, Any]]):
+        """حفظ عدة عمليات فاشلة من نفس النوع"""
+        if not items:
+            return
+        try:
+            await self.storage.run_io(self._insert, kind, items, time.time() + self.base_delay)
+        except Exception as e:
+            # الملاذ الأخير: السجل يحتوي على البيانات كاملة لاستعادتها يدوياً
+            for payload, error in items:
+                logger.critical(f"💀 تعذر حفظ عملية فاشلة ({kind}: {error}): {e} - {json.dumps(payload, ensure_ascii=False)}")
+            return
+
+        self.added += len(items)
+        logger.warning(f"📮 تم حفظ {len(items)} عملية فاشلة ({kind}) لإعادة المحاولة: {items[0][1]}")
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _insert(self, kind: str, items: List[Tuple[Any, Any]], next_attempt_at: float):
+        rows = []
+        for payload, error in items:
+            ids = payload if isinstance(payload, dict) else {}
+            rows.append((
+                kind, ids.get('channel_id'), ids.get('message_id'),
+                json.dumps(payload, ensure_ascii=False), str(error), next_attempt_at
+            ))
+        with self._lock:
+            self._conn.executemany(
+                '''INSERT INTO dead_letters (kind, channel_id, message_id, payload, error, next_attempt_at)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                rows
+            )
+            self._conn.commit()
+
+    def _query(self, query: str, params: tuple = ()) -> List[Dict]:
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            return [dict(zip(ENTRY_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def _execute(self, query: str, params: tuple = ()) -> int:
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    async def counts(self) -> Dict[str, int]:
+        """عدد العناصر حسب الحالة"""
+        def task():
+            with self._lock:
+                return dict(self._conn.execute('SELECT status, COUNT(*) FROM dead_letters GROUP BY status').fetchall())
+        return await self.storage.run_io(task)
+
+    async def list(self, limit: int = 20) -> List[Dict]:
+        """أحدث العناصر"""
+        return await self.storage.run_io(
+            self._query, f'SELECT {", ".join(ENTRY_COLUMNS)} FROM dead_letters ORDER BY id DESC LIMIT ?', (limit,)
+        )
+
+    async def get(self, entry_id: int) -> Optional[Dict]:
+        """عنصر واحد بكامل بياناته"""
+        entries = await self.storage.run_io(
+            self._query, f'SELECT {", ".join(ENTRY_COLUMNS)} FROM dead_letters WHERE id = ?', (entry_id,)
+        )
+        return entries[0] if entries else None
+
+    async def drop(self, entry_id: int) -> bool:
+        """حذف عنصر دون إعادة تنفيذه"""
+        return bool(await self.storage.run_io(self._execute, 'DELETE FROM dead_letters WHERE id = ?', (entry_id,)))
+
+    async def replay(self, entry_id: Optional[int] = None) -> Tuple[int, int]:
+        """إعادة التنفيذ فوراً (عنصر واحد أو الكل بما فيها المستنفدة) وإرجاع (الناجحة، الفاشلة)"""
+        if entry_id is not None:
+            entry = await self.get(entry_id)
+            entries = [entry] if entry else []
+        else:
+            entries = await self.storage.run_io(
+                self._query, f'SELECT {", ".join(ENTRY_COLUMNS)} FROM dead_letters ORDER BY id'
+            )
+
+        results = [await self._attempt(entry) for entry in entries]
+        return results.count(True), results.count(False)
+
+    async def _run(self):
+        """حلقة إعادة المحاولة للعناصر المستحقة"""
+        while True:
+            try:
+                due = await self.storage.run_io(
+                    self._query,
+                    f'''SELECT {", ".join(ENTRY_COLUMNS)} FROM dead_letters
+                        WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?''',
+                    (time.time(), DUE_BATCH)
+                )
+                for entry in due:
+                    await self._attempt(entry)
+                if len(due) == DUE_BATCH:
+                    continue
+                delay = await self.storage.run_io(self._next_delay)
+            except Exception as e:
+                logger.error(f"❌ خطأ في عامل إعادة المحاولة: {e}")
+                delay = POLL_INTERVAL
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _next_delay(self) -> float:
+        """الوقت حتى أقرب عنصر مستحق (بحد أقصى POLL_INTERVAL)"""
+        with self._lock:
+            next_at = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM dead_letters WHERE status = 'pending'"
+            ).fetchone()[0]
+        if next_at is None:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, max(0.0, next_at - time.time()))
+
+    async def _attempt(self, entry: Dict) -> bool:
+        """إعادة تنفيذ عنصر واحد: حذفه عند النجاح أو جدولة المحاولة التالية عند الفشل"""
+        handler = self.handlers.get(entry['kind'])
+        try:
+            if handler is None:
+                raise RuntimeError(f"لا يوجد معالج للنوع {entry['kind']}")
+            await handler(json.loads(entry['payload']))
+        except Exception as e:
+            attempts = entry['attempts'] + 1
+            status = 'failed' if attempts >= self.max_attempts else 'pending'
+            delay = min(self.max_delay, self.base_delay * 2 ** attempts) * random.uniform(0.8, 1.2)
+            await self.storage.run_io(
+                self._execute,
+                '''UPDATE dead_letters SET attempts = ?, status = ?, error = ?, next_attempt_at = ?,
+                          updated_at = CURRENT_TIMESTAMP WHERE id = ?''',
+                (attempts, status, str(e), time.time() + delay, entry['id'])
+            )
+            if status == 'failed':
+                logger.error(f"❌ استنفدت محاولات العملية {entry['id']} ({entry['kind']}): {e}")
+            return False
+
+        await self.storage.run_io(self._execute, 'DELETE FROM dead_letters WHERE id = ?', (entry['id'],))
+        self.replayed += 1
+        logger.info(f"♻️ نجحت إعادة تنفيذ العملية {entry['id']} ({entry['kind']})")
+        return True
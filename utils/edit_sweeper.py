@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مراجعة الرسائل المؤرشفة للكشف عن التعديلات والحذف الفائتة
+إعادة جلب المعرفات المؤرشفة بطلبات get_messages(ids=[...]) من 100 معرف ومقارنة بصمة المحتوى
+"""
+
+import logging
+import time
+from datetime import date
+from typing import Optional, List, Dict, Tuple, Callable, Awaitable
+
+from utils.storage_executor import StorageExecutor
+from utils.message_rows import build_row, content_hash
+from utils.date_resolver import PROBE_BATCH
+from utils.timestamps import range_filter, day_bounds
+from utils.fair_scheduler import current_channel, current_priority, PRIORITY_BACKFILL
+
+logger = logging.getLogger(__name__)
+
+# عدد الصفوف المقروءة من قاعدة البيانات في كل صفحة
+PAGE_SIZE = 1000
+
+class EditSweeper:
+    """مقارنة الأرشيف بالقناة وتطبيق التعديلات والحذف على الصفوف المتغيرة فقط"""
+
+    def __init__(self, client, storage: StorageExecutor,
+                 on_changed: Callable[..., Awaitable[None]],
+                 on_deleted: Callable[..., Awaitable[None]],
+                 chunk_size: int = PROBE_BATCH):
+        self.client = client
+        self.storage = storage
+        self.on_changed = on_changed
+        self.on_deleted = on_deleted
+        self.chunk_size = min(chunk_size, PROBE_BATCH)
+
+    async def sweep(self, channel, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict:
+        """مراجعة رسائل القناة المؤرشفة (اختيارياً ضمن فترة) وإرجاع الإحصائيات"""
+        stats = {'checked': 0, 'changed': 0, 'deleted': 0, 'requests': 0}
+        started = time.monotonic()
+
+        channel_id = await self.client.get_peer_id(channel)
+        channel_token = current_channel.set(str(channel))
+        priority_token = current_priority.set(PRIORITY_BACKFILL)
+        try:
+            after_id = 0
+            while True:
+                rows = await self.storage.read(
+                    self._query_page, channel_id, after_id, start_date, end_date
+                )
+                if not rows:
+                    break
+                after_id = rows[-1][0]
+
+                for i in range(0, len(rows), self.chunk_size):
+                    await self._check_chunk(channel, channel_id, rows[i:i + self.chunk_size], stats)
+        finally:
+            current_priority.reset(priority_token)
+            current_channel.reset(channel_token)
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"🔍 مراجعة {channel}: {stats['checked']:,} رسالة بـ {stats['requests']:,} طلب في {elapsed:.1f} ثانية "
+            f"- {stats['changed']:,} معدلة، {stats['deleted']:,} محذوفة"
+        )
+        return stats
+
+    async def _check_chunk(self, channel, channel_id: int, rows: List[Tuple], stats: Dict):
+        """جلب دفعة معرفات ومقارنتها بالأرشيف"""
+        ids = [row[0] for row in rows]
+        messages = await self.client.get_messages(channel, ids=ids)
+        stats['requests'] += 1
+        stats['checked'] += len(ids)
+
+        deleted = []
+        for (message_id, stored_hash), message in zip(rows, messages):
+            if message is None:
+                deleted.append(message_id)
+                continue
+
+            row = build_row(message)
+            if row['content_hash'] != stored_hash:
+                stats['changed'] += 1
+                await self.on_changed(message)
+
+        if deleted:
+            stats['deleted'] += len(deleted)
+            await self.on_deleted(channel_id, deleted)
+
+    @staticmethod
+    def _query_page(conn, channel_id: int, after_id: int,
+                    start_date: Optional[date], end_date: Optional[date]) -> List[Tuple]:
+        """الصفحة التالية من (message_id, content_hash) للرسائل غير المحذوفة"""
+        query = '''SELECT message_id, content_hash, content, media_type, file_id, file_name
+                   FROM archived_messages
+                   WHERE channel_id = ? AND message_id > ? AND deleted_at IS NULL'''
+        params = [channel_id, after_id]
+        if start_date or end_date:
+            where, range_params = range_filter(
+                conn,
+                day_bounds(start_date)[0] if start_date else None,
+                day_bounds(end_date)[1] if end_date else None
+            )
+            query += f' AND {where}'
+            params.extend(range_params)
+        query += ' ORDER BY message_id LIMIT ?'
+        params.append(PAGE_SIZE)
+
+        page = []
+        for message_id, stored_hash, content, media_type, file_id, file_name in conn.execute(query, params):
+            if stored_hash is None:
+                # صفوف أُرشفت قبل إضافة عمود البصمة
+                stored_hash = content_hash({
+                    'content': content, 'media_type': media_type,
+                    'file_id': file_id, 'file_name': file_name
+                })
+            page.append((message_id, stored_hash))
+        return page
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+جدولة عادلة لميزانية الطلبات بين القنوات
+كل قناة تنتظر في طابورها الخاص، ويمنح الدور للقنوات بالتناوب (Round Robin)
+مع تقديم الرسائل المباشرة دائماً على الأرشفة الرجعية
+"""
+
+import asyncio
+import contextvars
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+# القناة التي يعمل لحسابها الطلب الحالي (تنتقل تلقائياً إلى المهام الفرعية)
+current_channel: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_channel', default=None)
+
+# أولوية العمل الحالي: الرسائل المباشرة قبل الأرشفة الرجعية
+PRIORITY_LIVE = 0
+PRIORITY_BACKFILL = 1
+PRIORITIES = (PRIORITY_LIVE, PRIORITY_BACKFILL)
+current_priority: contextvars.ContextVar[int] = contextvars.ContextVar('current_priority', default=PRIORITY_LIVE)
+
+# هل العمل الحالي إعادة لتحديثات فائتة (استكمال بعد انقطاع): رسائلها مباشرة لكن تواريخها قديمة
+current_replay: contextvars.ContextVar[bool] = contextvars.ContextVar('current_replay', default=False)
+
+class FairScheduler:
+    """منح عدد محدود من الأدوار المتزامنة بالتناوب بين المفاتيح (القنوات) حسب الأولوية"""
+
+    def __init__(self, concurrency: int = 1):
+        self.concurrency = max(1, concurrency)
+        self._active = 0
+        self._waiters: Dict[int, Dict[Optional[str], Deque[asyncio.Future]]] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+
+        # عدد الأدوار الممنوحة لكل قناة
+        self.granted: Dict[Optional[str], int] = {}
+
+    def pending(self) -> int:
+        """عدد المنتظرين في جميع الطوابير"""
+        return sum(
+            len(waiters)
+            for queues in self._waiters.values()
+            for waiters in queues.values()
+        )
+
+    async def acquire(self, key: Optional[str] = None, priority: Optional[int] = None):
+        """انتظار الدور للقناة المحددة (الأولوية الافتراضية من سياق المهمة الحالية)"""
+        if priority is None:
+            priority = current_priority.get()
+
+        if self._active < self.concurrency and not self.pending():
+            self._grant(key)
+            return
+
+        queues = self._waiters[priority]
+        future = asyncio.get_running_loop().create_future()
+        queues.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # منح الدور ثم أُلغي الانتظار - إعادته للقناة التالية
+                self.release()
+            else:
+                self._discard(queues, key, future)
+            raise
+
+    def release(self):
+        """إنهاء الدور ومنحه للقناة التالية بالتناوب"""
+        self._active -= 1
+        self._wake_next()
+
+    @asynccontextmanager
+    async def turn(self, key: Optional[str] = None, priority: Optional[int] = None):
+        """سياق لحجز دور القناة وإطلاقه بعد الانتهاء"""
+        await self.acquire(key, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _grant(self, key: Optional[str]):
+        self._active += 1
+        self.granted[key] = self.granted.get(key, 0) + 1
+
+    def _next_queues(self) -> Optional[Dict[Optional[str], Deque[asyncio.Future]]]:
+        """طوابير أعلى أولوية لديها منتظرون"""
+        for priority in PRIORITIES:
+            if self._waiters[priority]:
+                return self._waiters[priority]
+        return None
+
+    def _wake_next(self):
+        while self._active < self.concurrency:
+            queues = self._next_queues()
+            if queues is None:
+                return
+
+            # أول قناة في الترتيب تأخذ الدور ثم تنتقل إلى نهاية الترتيب
+            key, waiters = next(iter(queues.items()))
+            future = waiters.popleft()
+            del queues[key]
+            if waiters:
+                queues[key] = waiters
+
+            if future.done():
+                continue
+            self._grant(key)
+            future.set_result(None)
+
+    @staticmethod
+    def _discard(queues: Dict, key: Optional[str], future: asyncio.Future):
+        waiters = queues.get(key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del queues[key]
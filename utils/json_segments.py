@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مقاطع الأرشيف اليومية بصيغة JSONL (سطر JSON لكل رسالة)
+الكتابة إلحاق فقط، مع فهرس اختياري في نهاية الملف، وقارئ يدعم ملفات JSON القديمة
+"""
+
+import json
+import logging
+import os
+from datetime import date
+from pathlib import Path
+from typing import Optional, List, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.jsonl'
+LEGACY_SUFFIX = '.json'
+INDEX_KEY = '__index__'
+
+def day_path(base_dir, year: int, month: int, day: int, suffix: str = SEGMENT_SUFFIX) -> Path:
+    """مسار ملف اليوم داخل مجلد الأرشيف"""
+    return Path(base_dir) / str(year) / f"{month:02d}" / f"{day:02d}{suffix}"
+
+def append_messages(path: Path, messages: List[Dict]):
+    """إلحاق رسائل بمقطع اليوم بدون إعادة قراءة الملف"""
+    if not messages:
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    lines = ''.join(
+        json.dumps(message, ensure_ascii=False, separators=(',', ':')) + '\n'
+        for message in messages
+    )
+    _append(path, lines)
+
+def seal_segment(path: Path) -> Optional[Dict]:
+    """كتابة فهرس في نهاية المقطع (معرف الرسالة -> موضع السطر)"""
+    if not path.exists():
+        return None
+
+    offsets = {}
+    count = 0
+    last_is_index = False
+
+    with open(path, 'rb') as f:
+        offset = 0
+        for raw in f:
+            record = _parse_line(raw)
+            if record is None:
+                pass
+            elif INDEX_KEY in record:
+                last_is_index = True
+            else:
+                last_is_index = False
+                offsets[record_key(record)] = offset
+                count += 1
+            offset += len(raw)
+
+    if last_is_index:
+        # المقطع مغلق مسبقاً ولم تُضف إليه رسائل بعد الفهرس
+        return None
+
+    index = {INDEX_KEY: {'count': count, 'offsets': offsets}}
+    _append(path, json.dumps(index, separators=(',', ':')) + '\n')
+
+    return index[INDEX_KEY]
+
+def seal_closed_days(base_dir, before: date) -> int:
+    """إغلاق مقاطع الأيام السابقة لـ before التي لا تنتهي بفهرس (بما فيها ما أُلحق به بعد إغلاقه)"""
+    sealed = 0
+    for path in sorted(Path(base_dir).glob(f'*/*/*{SEGMENT_SUFFIX}')):
+        try:
+            segment_day = date(int(path.parent.parent.name), int(path.parent.name), int(path.stem))
+        except ValueError:
+            continue
+        if segment_day < before and read_index(path) is None and seal_segment(path) is not None:
+            sealed += 1
+    if sealed:
+        logger.info(f"🗂️ تم إغلاق {sealed} مقطع يومي بفهرس")
+    return sealed
+
+def read_index(path: Path) -> Optional[Dict]:
+    """قراءة الفهرس إذا كان آخر سطر في المقطع"""
+    last_line = _read_last_line(path)
+    if last_line is None:
+        return None
+
+    record = _parse_line(last_line)
+    if record and INDEX_KEY in record:
+        return record[INDEX_KEY]
+    return None
+
+def iter_segment(path: Path) -> Iterator[Dict]:
+    """قراءة رسائل المقطع سطراً بسطر مع تجاهل أسطر الفهرس والأسطر التالفة"""
+    with open(path, 'rb') as f:
+        for raw in f:
+            record = _parse_line(raw)
+            if record is not None and INDEX_KEY not in record:
+                yield record
+
+def record_key(record: Dict) -> str:
+    """مفتاح الرسالة داخل المقطع (القناة مع المعرف، لأن مقطع اليوم يجمع عدة قنوات)"""
+    return message_key(record.get('message_id'), record.get('channel_id'))
+
+def message_key(message_id, channel_id=None) -> str:
+    """مفتاح الفهرس لمعرف رسالة (السجلات القديمة بدون قناة تستخدم المعرف فقط)"""
+    if channel_id is None:
+        return str(message_id)
+    return f"{channel_id}:{message_id}"
+
+def read_day(base_dir, year: int, month: int, day: int) -> List[Dict]:
+    """قراءة رسائل يوم من ملف JSON القديم و/أو مقطع JSONL (آخر نسخة لكل رسالة)"""
+    messages: Dict = {}
+
+    legacy_path = day_path(base_dir, year, month, day, LEGACY_SUFFIX)
+    if legacy_path.exists():
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            for record in (json.loads(content) if content else []):
+                messages[record_key(record)] = record
+        except json.JSONDecodeError as e:
+            logger.warning(f"⚠️ ملف JSON تالف {legacy_path}: {e}")
+
+    segment_path = day_path(base_dir, year, month, day)
+    if segment_path.exists():
+        # التعديلات والحذف تُلحق كسجلات جديدة، فالسجل الأخير لكل رسالة هو الأحدث
+        for record in iter_segment(segment_path):
+            # سجلات الملفات القديمة بلا قناة (قناة واحدة) تُستبدل بسجل نفس المعرف
+            messages.pop(message_key(record.get('message_id')), None)
+            messages[record_key(record)] = record
+
+    return sorted(messages.values(), key=lambda m: (m.get('date') or '', m.get('message_id') or 0))
+
+def _append(path: Path, lines: str):
+    """إلحاق أسطر كاملة بالمقطع، مع بدء سطر جديد إذا انتهى الملف بسطر غير مكتمل"""
+    data = lines.encode('utf-8')
+    with open(path, 'a+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        if end:
+            f.seek(end - 1)
+            if f.read(1) != b'\n':
+                # انقطاع أثناء كتابة سابقة: السطر المقطوع يبقى سطراً تالفاً يتجاهله القارئ
+                logger.warning(f"⚠️ سطر غير مكتمل في نهاية المقطع {path} - الإلحاق في سطر جديد")
+                data = b'\n' + data
+        f.write(data)
+
+def _parse_line(raw) -> Optional[Dict]:
+    """تحليل سطر واحد من المقطع"""
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8', errors='replace')
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        # سطر غير مكتمل (مثلاً انقطاع أثناء الكتابة)
+        return None
+
+def _read_last_line(path: Path, block_size: int = 4096) -> Optional[bytes]:
+    """قراءة آخر سطر في الملف من النهاية دون قراءة الملف كاملاً"""
+    if not path.exists():
+        return None
+
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        end = f.tell()
+        if end == 0:
+            return None
+
+        chunks = []
+        position = end
+        skip_trailing = True
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+
+            # تجاهل السطر الجديد في نهاية الملف
+            if skip_trailing:
+                block = block.rstrip(b'\n')
+                if not block:
+                    continue
+                skip_trailing = False
+
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                chunks.append(block[newline + 1:])
+                break
+            chunks.append(block)
+
+        return b''.join(reversed(chunks)) or None
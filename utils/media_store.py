@@ -0,0 +1,612 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تنزيل وسائط الرسائل وتخزينها حسب بصمة محتواها
+الملف يُكتب على القرص أثناء التنزيل مع حساب SHA-256، فالملفات المعاد نشرها تُخزن مرة واحدة
+الملفات الكبيرة تُنزل على أجزاء ثابتة الحجم في ملف .part مع موضع محفوظ، فيُستأنف التنزيل بعد الانقطاع
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from typing import Optional, Dict, Tuple
+
+from utils.storage_executor import StorageExecutor, ensure_columns
+from utils.message_rows import media_info, media_metadata, photo_size_bytes
+from utils.fair_scheduler import current_priority, PRIORITY_LIVE
+
+try:
+    from telethon import utils as telethon_utils
+    from telethon.errors import FloodWaitError, FileReferenceExpiredError
+    from telethon.tl import types
+    # مقاسات الصور التي يمكن حفظها كصورة JPEG (دون مسارات الملصقات المتحركة)
+    THUMB_TYPES = (types.PhotoSize, types.PhotoSizeProgressive, types.PhotoCachedSize, types.PhotoStrippedSize)
+except ImportError:
+    telethon_utils = types = None
+    FloodWaitError = FileReferenceExpiredError = None
+    THUMB_TYPES = ()
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS media_files (
+        sha256 TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mime_type TEXT,
+        stored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_access REAL NOT NULL,
+        evicted_at TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS message_media (
+        channel_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        file_id TEXT,
+        sha256 TEXT,
+        thumb_sha256 TEXT,
+        PRIMARY KEY (channel_id, message_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_message_media_file ON message_media(file_id)',
+    'CREATE INDEX IF NOT EXISTS idx_media_files_lru ON media_files(evicted_at, last_access)'
+]
+
+# عدد الرسائل المنتظرة لكل عامل تنزيل، ونسبة الميزانية التي يُنزل إليها الحجم عند الإخلاء
+QUEUE_PER_WORKER = 50
+EVICT_TARGET = 0.9
+EVICT_BATCH = 500
+
+# حجم الجزء في التنزيل المجزأ (أقصى حجم لطلب upload.getFile)، وحجم القراءة عند إعادة حساب البصمة
+CHUNK_SIZE = 512 * 1024
+HASH_BLOCK = 1024 * 1024
+# حفظ موضع التنزيل المجزأ (بعد fsync) كل هذا القدر من البيانات - الانقطاع يعيد تنزيله فقط
+CHECKPOINT_BYTES = 8 * 1024 * 1024
+# محاولات استئناف التنزيل بعد انقطاع الاتصال، وعمر ملفات .part المتروكة قبل حذفها
+MAX_RESUMES = 5
+PART_MAX_AGE = 7 * 24 * 3600
+
+# تنزيل الملفات كاملة، أو الصور المصغرة فقط مع تنزيل الملف عند أول طلب
+MODE_FULL = 'full'
+MODE_THUMBNAIL = 'thumbnail'
+
+# أقصى حجم ملف يمكن لبوت Telegram إرساله
+BOT_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء جداول الوسائط"""
+    for statement in SCHEMA:
+        conn.execute(statement)
+    ensure_columns(conn, 'message_media', {'thumb_sha256': 'TEXT'})
+
+def smallest_thumb(message):
+    """أصغر صورة مصغرة للصور والفيديو (المضمنة في الرسالة إن لم يوجد غيرها)"""
+    if message.photo:
+        sizes = message.photo.sizes
+    elif message.video:
+        sizes = message.document.thumbs
+    else:
+        return None
+
+    sizes = [size for size in sizes or [] if isinstance(size, THUMB_TYPES)]
+    real = [size for size in sizes if not isinstance(size, types.PhotoStrippedSize)]
+    if real:
+        return min(real, key=photo_size_bytes)
+    return sizes[0] if sizes else None
+
+# أيقونة كل نوع وسائط في القوائم
+MEDIA_ICONS = {
+    "photo": "🖼️", "video": "🎥", "document": "📄", "audio": "🎵", "voice": "🎙️",
+    "video_note": "⏺️", "gif": "🎞️", "sticker": "🏷️", "poll": "📊", "webpage": "🔗"
+}
+
+def format_media_caption(media_type: str, file_name: Optional[str], metadata: Dict) -> str:
+    """وصف الوسائط من بياناتها المؤرشفة (دون تنزيلها)"""
+    parts = [f"{MEDIA_ICONS.get(media_type, '📎')} **{media_type}**"]
+    if file_name:
+        parts.append(f"`{file_name}`")
+    if metadata.get('media_size'):
+        parts.append(f"{metadata['media_size'] / 1024 ** 2:,.1f} MB")
+    if metadata.get('width') and metadata.get('height'):
+        parts.append(f"{metadata['width']}×{metadata['height']}")
+    if metadata.get('duration'):
+        minutes, seconds = divmod(int(metadata['duration']), 60)
+        parts.append(f"{minutes}:{seconds:02d}")
+    if metadata.get('mime_type'):
+        parts.append(metadata['mime_type'])
+    if metadata.get('title'):
+        parts.append(f"«{metadata['title']}»")
+    if metadata.get('url'):
+        parts.append(metadata['url'])
+    return " • ".join(parts)
+
+def media_dc(message) -> Optional[int]:
+    """مركز البيانات الذي يُخزن فيه الملف"""
+    media = message.document or message.photo
+    return getattr(media, 'dc_id', None)
+
+class HashingWriter:
+    """كائن ملف يكتب الأجزاء على القرص مباشرة ويحدّث بصمتها (الذاكرة ثابتة مهما كبر الملف)"""
+
+    def __init__(self, f):
+        self.f = f
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.hasher.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self):
+        self.f.flush()
+
+class MediaStore:
+    """طابور تنزيل بعدد محدود من العمال ومتوازي محدود لكل DC، مع ميزانية للقرص وإخلاء الأقدم استخداماً"""
+
+    def __init__(self, client, storage: StorageExecutor, root: str = 'media',
+                 concurrency: int = 3, per_dc: int = 2,
+                 max_file_size: int = 50 * 1024 * 1024, budget: int = 2 * 1024 ** 3,
+                 mode: str = MODE_FULL):
+        self.client = client
+        self.storage = storage
+        self.root = root
+        if mode not in (MODE_FULL, MODE_THUMBNAIL):
+            logger.warning(f"⚠️ وضع وسائط غير معروف '{mode}' - استخدام {MODE_FULL}")
+            mode = MODE_FULL
+        self.mode = mode
+        self.concurrency = max(1, concurrency)
+        self.per_dc = max(1, per_dc)
+        self.max_file_size = max_file_size
+        self.budget = budget
+
+        self.tmp_dir = os.path.join(root, '.tmp')
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * QUEUE_PER_WORKER)
+        # Telethon يعيد استخدام اتصال واحد لكل DC ما دام مستعاراً؛ الحد لكل DC يوزع العمال عليها
+        self._dc_limits: Dict[Optional[int], asyncio.Semaphore] = {}
+        self._workers = []
+        self._evicting = asyncio.Lock()
+        # الملفات قيد التنزيل: معرف الملف -> [القفل، عدد المنتظرين]
+        self._inflight: Dict[str, list] = {}
+
+        # مجموع أحجام الملفات المخزنة حالياً
+        self.total_bytes = 0
+
+        # إحصائيات
+        self.downloaded = 0
+        self.downloaded_bytes = 0
+        self.deduplicated = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self.evicted = 0
+        self.resumed = 0
+
+    @property
+    def is_running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    async def start(self, eager: bool = True):
+        """تحميل حجم المخزن وبدء عمال التنزيل (دونهم تُنزل الملفات عند طلبها فقط)"""
+        if self.is_running:
+            return
+
+        await self.storage.run_io(self._clean_tmp)
+        row = await self.storage.fetchone('SELECT COALESCE(SUM(size), 0) FROM media_files WHERE evicted_at IS NULL')
+        self.total_bytes = row[0]
+
+        if not eager:
+            return
+        self._workers = [
+            asyncio.create_task(self._run(), name=f"media-{i}") for i in range(self.concurrency)
+        ]
+        logger.info(
+            f"🖼️ بدء تنزيل الوسائط - {self.mode} ({self.concurrency} عمال، {self.per_dc} لكل DC، "
+            f"المخزن: {self.total_bytes / 1024 ** 2:,.0f}/{self.budget / 1024 ** 2:,.0f} MB)"
+        )
+
+    async def stop(self):
+        """إيقاف عمال التنزيل (الرسائل المنتظرة تُهمل ويمكن تنزيلها لاحقاً)"""
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+    async def submit(self, message):
+        """إضافة وسائط رسالة إلى طابور التنزيل"""
+        if not self.is_running or media_info(message)[1] is None:
+            return
+
+        if current_priority.get() == PRIORITY_LIVE:
+            # الأرشفة المباشرة لا تنتظر التنزيل أبداً
+            try:
+                self.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logger.warning(f"⚠️ طابور الوسائط ممتلئ - تخطي وسائط الرسالة {message.id}")
+        else:
+            # الأرشفة الرجعية تتباطأ حتى يلحق بها التنزيل
+            await self.queue.put(message)
+
+    def stats(self) -> Dict:
+        return {
+            'pending': self.queue.qsize(),
+            'downloaded': self.downloaded,
+            'downloaded_bytes': self.downloaded_bytes,
+            'deduplicated': self.deduplicated,
+            'skipped': self.skipped,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'evicted': self.evicted,
+            'resumed': self.resumed,
+            'total_bytes': self.total_bytes,
+            'budget': self.budget,
+            'mode': self.mode if self.is_running else None,
+        }
+
+    async def _run(self):
+        """حلقة عامل التنزيل"""
+        while True:
+            message = await self.queue.get()
+            try:
+                if self.mode == MODE_THUMBNAIL:
+                    await self.store_thumbnail(message)
+                else:
+                    await self.store(message)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ خطأ في تنزيل وسائط الرسالة {message.id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def store(self, message) -> Optional[str]:
+        """تنزيل وسائط رسالة (إن لم تكن مخزنة) وإرجاع بصمتها"""
+        _, file_id, _ = media_info(message)
+        if file_id is None:
+            return None
+
+        size = media_metadata(message)['media_size']
+        if size and size > self.max_file_size:
+            self.skipped += 1
+            logger.debug(f"⏭️ تخطي وسائط الرسالة {message.id} ({size / 1024 ** 2:,.1f} MB أكبر من الحد)")
+            return None
+
+        return await self._store_once(message, file_id, 'sha256')
+
+    async def store_thumbnail(self, message) -> Optional[str]:
+        """تنزيل أصغر صورة مصغرة للصور والفيديو فقط وإرجاع بصمتها"""
+        thumb = smallest_thumb(message)
+        if thumb is None:
+            return None
+        return await self._store_once(message, media_info(message)[1], 'thumb_sha256', thumb)
+
+    async def fetch(self, message) -> Optional[str]:
+        """مسار الملف الكامل لرسالة مع تنزيله عند أول طلب"""
+        sha256 = await self.store(message)
+        if sha256 is None:
+            return None
+        row = await self.storage.fetchone('SELECT path FROM media_files WHERE sha256 = ?', (sha256,))
+        return row[0] if row else None
+
+    async def cached(self, channel_id: int, message_id: int) -> Dict:
+        """الملف الكامل والصورة المصغرة المخزنة لرسالة (دون تنزيل)"""
+        return (await self.cached_many([(channel_id, message_id)])).get(
+            (channel_id, message_id), {'path': None, 'thumb_path': None}
+        )
+
+    async def cached_many(self, keys) -> Dict[Tuple[int, int], Dict]:
+        """مسارات الملفات المخزنة لعدة رسائل مع تحديث وقت آخر استخدام لها"""
+        found = await self.storage.read(self._query_cached, list(keys))
+        used = {sha256 for paths in found.values() for sha256 in paths.pop('used')}
+        if used:
+            await self.storage.write(self._touch, list(used))
+        return found
+
+    @staticmethod
+    def _query_cached(conn: sqlite3.Connection, keys) -> Dict[Tuple[int, int], Dict]:
+        found = {}
+        for channel_id, message_id in keys:
+            row = conn.execute(
+                '''SELECT f.sha256, f.path, t.sha256, t.path FROM message_media m
+                   LEFT JOIN media_files f ON f.sha256 = m.sha256 AND f.evicted_at IS NULL
+                   LEFT JOIN media_files t ON t.sha256 = m.thumb_sha256 AND t.evicted_at IS NULL
+                   WHERE m.channel_id = ? AND m.message_id = ?''',
+                (channel_id, message_id)
+            ).fetchone()
+            if not row:
+                continue
+            full_sha, full_path, thumb_sha, thumb_path = row
+            # الملف قد يُحذف يدوياً من القرص
+            full_path = full_path if full_path and os.path.exists(full_path) else None
+            thumb_path = thumb_path if thumb_path and os.path.exists(thumb_path) else None
+            found[(channel_id, message_id)] = {
+                'path': full_path,
+                'thumb_path': thumb_path,
+                'used': [sha for sha, path in ((full_sha, full_path), (thumb_sha, thumb_path)) if path]
+            }
+        return found
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection, hashes):
+        now = time.time()
+        conn.executemany('UPDATE media_files SET last_access = ? WHERE sha256 = ?', [(now, sha) for sha in hashes])
+        conn.commit()
+
+    async def _store_once(self, message, file_id: str, column: str, thumb=None) -> str:
+        """تخزين الملف (أو صورته المصغرة) مرة واحدة حتى لو طلبته عدة رسائل في نفس الوقت"""
+        # رسالتان بنفس الملف لا تنزلانه معاً (ولا تكتبان في نفس ملف .part)
+        key = f"{column}:{file_id}"
+        entry = self._inflight.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._store(message, file_id, column, thumb)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._inflight[key]
+
+    async def _store(self, message, file_id: str, column: str, thumb=None) -> str:
+        # نفس الملف في Telegram (رسالة معاد توجيهها) لا يُنزل مرة أخرى
+        row = await self.storage.fetchone(
+            f'''SELECT f.sha256 FROM message_media m JOIN media_files f ON f.sha256 = m.{column}
+                WHERE m.file_id = ? AND f.evicted_at IS NULL LIMIT 1''',
+            (file_id,)
+        )
+        if row:
+            await self.storage.write(self._link, message.chat_id, message.id, file_id, column, row[0])
+            self.deduplicated += 1
+            return row[0]
+
+        sha256, size, tmp_path = await self._download(message, thumb)
+        if thumb is None:
+            path = self.path_for(sha256, message)
+            mime_type = media_metadata(message)['mime_type']
+        else:
+            path = os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}.jpg")
+            mime_type = 'image/jpeg'
+        added = await self.storage.run_io(self._place, tmp_path, path)
+        await self.storage.write(
+            self._record, message.chat_id, message.id, file_id, column, sha256, path, size, mime_type
+        )
+
+        self.downloaded += 1
+        self.downloaded_bytes += size
+        if added:
+            self.total_bytes += size
+            if self.total_bytes > self.budget:
+                await self.evict()
+        else:
+            self.deduplicated += 1
+        return sha256
+
+    def path_for(self, sha256: str, message) -> str:
+        """مسار الملف حسب بصمته (مجلدان فرعيان حتى لا يكبر مجلد واحد)"""
+        extension = telethon_utils.get_extension(message.media) if telethon_utils else ''
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+    async def _download(self, message, thumb=None) -> Tuple[str, int, str]:
+        """تنزيل الملف (أو صورته المصغرة) إلى ملف مؤقت مع حساب بصمته"""
+        dc_id = media_dc(message)
+        limit = self._dc_limits.setdefault(dc_id, asyncio.Semaphore(self.per_dc))
+
+        async with limit:
+            if message.document and thumb is None:
+                return await self._download_chunked(message)
+
+            tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+            while True:
+                try:
+                    with open(tmp_path, 'wb') as f:
+                        writer = HashingWriter(f)
+                        await self.client.download_media(message, file=writer, thumb=thumb)
+                    return writer.hasher.hexdigest(), writer.size, tmp_path
+                except Exception as e:
+                    if FloodWaitError is None or not isinstance(e, FloodWaitError):
+                        await self.storage.run_io(self._remove, tmp_path)
+                        raise
+                    logger.warning(f"⏳ FloodWait {e.seconds} ثانية أثناء تنزيل الوسائط")
+                    await asyncio.sleep(e.seconds)
+
+    async def _download_chunked(self, message) -> Tuple[str, int, str]:
+        """تنزيل مستند على أجزاء في ملف .part مع حفظ الموضع دورياً والاستئناف منه عند الانقطاع"""
+        document = message.document
+        part_path = os.path.join(self.tmp_dir, f"{document.id}.part")
+        offset, hasher = await self.storage.run_io(self._resume_part, part_path)
+        if offset:
+            self.resumed += 1
+            logger.info(f"⏯️ استئناف تنزيل الملف {document.id} من {offset / 1024 ** 2:,.1f} MB")
+
+        resumes = 0
+        while offset < document.size:
+            # فتح الملف والكتابة فيه وحفظ الموضع في خيوط الإدخال/الإخراج حتى لا تتوقف حلقة الأحداث
+            f = await self.storage.run_io(self._open_part, part_path, offset)
+            try:
+                saved = offset
+                async for chunk in self.client.iter_download(
+                    document, offset=offset, request_size=CHUNK_SIZE, file_size=document.size
+                ):
+                    await self.storage.run_io(self._write_chunk, f, hasher, chunk)
+                    offset += len(chunk)
+                    if offset - saved >= CHECKPOINT_BYTES:
+                        # الموضع يُحفظ بعد fsync للأجزاء قبله، فلا يشير إلى بيانات لم تصل إلى القرص
+                        await self.storage.run_io(self._checkpoint, f, part_path, offset)
+                        saved = offset
+                break
+            except Exception as e:
+                if FloodWaitError is not None and isinstance(e, FloodWaitError):
+                    logger.warning(f"⏳ FloodWait {e.seconds} ثانية أثناء تنزيل الوسائط")
+                    await asyncio.sleep(e.seconds)
+                    continue
+                if FileReferenceExpiredError is not None and isinstance(e, FileReferenceExpiredError):
+                    # مرجع الملف ينتهي بعد مدة - إعادة جلب الرسالة للحصول على مرجع جديد
+                    message = await self.client.get_messages(message.chat_id, ids=message.id)
+                    if message is None or message.document is None:
+                        raise
+                    document = message.document
+                    continue
+                if not isinstance(e, (ConnectionError, OSError, asyncio.TimeoutError)) or resumes >= MAX_RESUMES:
+                    raise
+                resumes += 1
+                logger.warning(f"🔌 انقطع تنزيل الملف {document.id} عند {offset:,} بايت ({e}) - استئناف")
+                await asyncio.sleep(2 ** resumes)
+            finally:
+                await self.storage.run_io(f.close)
+
+        # التحقق من اكتمال الملف قبل نقله إلى المخزن
+        size = await self.storage.run_io(os.path.getsize, part_path)
+        if size != document.size or offset != document.size:
+            await self.storage.run_io(self._discard_part, part_path)
+            raise ValueError(f"حجم الملف {document.id} غير مطابق ({size:,} بدلاً من {document.size:,})")
+
+        await self.storage.run_io(self._remove, f"{part_path}.json")
+        return hasher.hexdigest(), size, part_path
+
+    @staticmethod
+    def _resume_part(part_path: str):
+        """الموضع المحفوظ لملف .part وبصمة ما نُزل منه (بقراءة الملف على أجزاء)"""
+        hasher = hashlib.sha256()
+        try:
+            with open(f"{part_path}.json", 'r', encoding='utf-8') as f:
+                offset = int(json.load(f)['offset'])
+            # الملف قد يكون أقصر من الموضع بعد انقطاع الكهرباء - الاستئناف من آخر جزء كامل
+            offset = min(offset, os.path.getsize(part_path))
+            offset -= offset % CHUNK_SIZE
+        except (OSError, ValueError, KeyError):
+            return 0, hasher
+
+        remaining = offset
+        with open(part_path, 'rb') as f:
+            while remaining:
+                block = f.read(min(HASH_BLOCK, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return offset - remaining, hasher
+
+    @staticmethod
+    def _open_part(part_path: str, offset: int):
+        """فتح ملف .part للكتابة من الموضع (وحذف ما بعده من جزء لم يكتمل)"""
+        f = open(part_path, 'r+b' if offset else 'wb')
+        f.seek(offset)
+        f.truncate()
+        return f
+
+    @staticmethod
+    def _write_chunk(f, hasher, chunk: bytes):
+        f.write(chunk)
+        hasher.update(chunk)
+
+    @classmethod
+    def _checkpoint(cls, f, part_path: str, offset: int):
+        """حفظ الموضع بعد وصول البيانات قبله إلى القرص"""
+        f.flush()
+        os.fsync(f.fileno())
+        cls._save_offset(part_path, offset)
+
+    @staticmethod
+    def _save_offset(part_path: str, offset: int):
+        with open(f"{part_path}.json", 'w', encoding='utf-8') as f:
+            json.dump({'offset': offset}, f)
+
+    @classmethod
+    def _discard_part(cls, part_path: str):
+        cls._remove(part_path)
+        cls._remove(f"{part_path}.json")
+
+    def _clean_tmp(self):
+        """حذف الملفات المؤقتة لتنزيلات الصور غير المكتملة وملفات .part المتروكة منذ مدة طويلة"""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        now = time.time()
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if name.endswith('.part') or name.endswith('.part.json'):
+                if now - os.path.getmtime(path) < PART_MAX_AGE:
+                    continue
+            self._remove(path)
+
+    @staticmethod
+    def _place(tmp_path: str, path: str) -> bool:
+        """نقل الملف المؤقت إلى مساره النهائي، أو حذفه إذا كان نفس المحتوى مخزناً (يُرجع True للملف الجديد)"""
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return True
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _link(conn: sqlite3.Connection, channel_id, message_id: int, file_id: str, column: str, sha256: str):
+        """ربط رسالة بملف (column هو sha256 للملف الكامل أو thumb_sha256 للصورة المصغرة)"""
+        conn.execute(
+            f'''INSERT INTO message_media (channel_id, message_id, file_id, {column}) VALUES (?, ?, ?, ?)
+                ON CONFLICT(channel_id, message_id) DO UPDATE SET file_id = excluded.file_id,
+                                                                {column} = excluded.{column}''',
+            (channel_id, message_id, file_id, sha256)
+        )
+        conn.execute('UPDATE media_files SET last_access = ? WHERE sha256 = ?', (time.time(), sha256))
+        conn.commit()
+
+    @classmethod
+    def _record(cls, conn: sqlite3.Connection, channel_id, message_id: int, file_id: str, column: str,
+                sha256: str, path: str, size: int, mime_type: Optional[str]):
+        conn.execute(
+            '''INSERT INTO media_files (sha256, path, size, mime_type, last_access) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(sha256) DO UPDATE SET path = excluded.path, last_access = excluded.last_access,
+                                                 evicted_at = NULL''',
+            (sha256, path, size, mime_type, time.time())
+        )
+        cls._link(conn, channel_id, message_id, file_id, column, sha256)
+
+    async def evict(self):
+        """حذف الملفات الأقدم استخداماً حتى ينزل حجم المخزن إلى EVICT_TARGET من الميزانية"""
+        async with self._evicting:
+            target = int(self.budget * EVICT_TARGET)
+            if self.total_bytes <= target:
+                return
+            freed, count = await self.storage.write(self._evict, self.total_bytes - target)
+            self.total_bytes -= freed
+            self.evicted += count
+            logger.info(f"🧹 إخلاء {count:,} ملف وسائط ({freed / 1024 ** 2:,.1f} MB) للبقاء ضمن الميزانية")
+
+    @staticmethod
+    def _evict(conn: sqlite3.Connection, needed: int) -> Tuple[int, int]:
+        freed = 0
+        evicted = []
+        while freed < needed:
+            rows = conn.execute(
+                '''SELECT sha256, path, size FROM media_files WHERE evicted_at IS NULL
+                   ORDER BY last_access LIMIT ?''',
+                (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for sha256, path, size in rows:
+                if freed >= needed:
+                    break
+                MediaStore._remove(path)
+                freed += size
+                batch.append((sha256,))
+            conn.executemany('UPDATE media_files SET evicted_at = CURRENT_TIMESTAMP WHERE sha256 = ?', batch)
+            evicted.extend(batch)
+        conn.commit()
+        return freed, len(evicted)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تحويل رسائل Telethon إلى صفوف الأرشيف
+مشترك بين الأرشفة المباشرة والرجعية ومعالجة التعديلات
+"""
+
+import hashlib
+from typing import Dict, Optional
+
+from utils.arabic_text import index_text
+from utils.timestamps import archive_timezone
+
+# الحقول المؤرشفة من محتوى الرسالة (تغيّرها يعني أن الرسالة عُدلت)
+CONTENT_FIELDS = ('content', 'media_type', 'file_id', 'file_name')
+
+# بيانات الملف الكامل التي تُعرف من الرسالة دون تنزيله
+MEDIA_COLUMNS = {
+    'media_size': 'INTEGER',
+    'mime_type': 'TEXT',
+    'duration': 'REAL',
+    'width': 'INTEGER',
+    'height': 'INTEGER',
+    'dc_id': 'INTEGER',
+    # رابط معاينة الصفحة، والعنوان (عنوان الصفحة أو سؤال الاستطلاع أو اسم المقطع الصوتي)
+    'url': 'TEXT',
+    'title': 'TEXT',
+}
+
+# فهرس استعلامات الملفات حسب نوع MIME (فهرس النوع والشهر على local_date في timestamps)
+MEDIA_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_messages_mime_size ON archived_messages(mime_type, media_size)'
+]
+
+# أنواع المستندات حسب خصائص Telethon (الملصق والصورة المتحركة قد تحمل خاصية الفيديو فتُفحص قبله)
+DOCUMENT_KINDS = ('sticker', 'gif', 'voice', 'video_note', 'video', 'audio')
+
+def content_hash(row: Dict) -> str:
+    """بصمة قصيرة لمحتوى الرسالة للمقارنة دون قراءة النص كاملاً"""
+    payload = '\x1f'.join(str(row.get(field) or '') for field in CONTENT_FIELDS)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+def document_file_name(document) -> Optional[str]:
+    """اسم الملف الأصلي للمستند (إن أُرسل باسم)"""
+    for attribute in document.attributes or []:
+        if getattr(attribute, 'file_name', None):
+            return attribute.file_name
+    return None
+
+def media_info(message) -> tuple:
+    """(نوع الوسائط، معرف الملف، اسم الملف) للرسالة (الاستطلاع ومعاينة الصفحة بلا ملف)"""
+    if not message.media:
+        return None, None, None
+
+    if message.poll:
+        return "poll", None, None
+    if message.photo:
+        return "photo", str(message.photo.id), None
+    if message.document:
+        kind = next((kind for kind in DOCUMENT_KINDS if getattr(message, kind)), "document")
+        return kind, str(message.document.id), document_file_name(message.document)
+    if message.web_preview:
+        return "webpage", None, None
+    return None, None, None
+
+def photo_size_bytes(size) -> int:
+    """حجم أحد مقاسات الصورة بالبايت (المقاسات التدريجية تحمل قائمة أحجام)"""
+    if getattr(size, 'size', None):
+        return size.size
+    if getattr(size, 'sizes', None):
+        return max(size.sizes)
+    return len(getattr(size, 'bytes', b'') or b'')
+
+def media_metadata(message) -> Dict:
+    """الحجم ونوع MIME والمدة والأبعاد للملف الكامل"""
+    metadata = dict.fromkeys(MEDIA_COLUMNS)
+    if not message.media:
+        return metadata
+
+    if message.document:
+        document = message.document
+        metadata['media_size'] = document.size
+        metadata['mime_type'] = document.mime_type
+        metadata['dc_id'] = document.dc_id
+        for attribute in document.attributes or []:
+            if getattr(attribute, 'duration', None):
+                metadata['duration'] = attribute.duration
+            if getattr(attribute, 'w', None):
+                metadata['width'], metadata['height'] = attribute.w, attribute.h
+            if getattr(attribute, 'title', None):
+                performer = getattr(attribute, 'performer', None)
+                metadata['title'] = f"{performer} - {attribute.title}" if performer else attribute.title
+    elif message.photo:
+        sizes = [size for size in message.photo.sizes if getattr(size, 'w', None)]
+        if sizes:
+            largest = max(sizes, key=photo_size_bytes)
+            metadata['media_size'] = photo_size_bytes(largest)
+            metadata['width'], metadata['height'] = largest.w, largest.h
+        metadata['mime_type'] = 'image/jpeg'
+        metadata['dc_id'] = message.photo.dc_id
+    elif message.poll:
+        question = message.poll.poll.question
+        # الإصدارات الأحدث من Telethon تعيد السؤال كنص مع تنسيقاته
+        metadata['title'] = getattr(question, 'text', question)
+
+    # الرابط قد يكون معاينة صفحة تحمل صورة أو ملفاً
+    webpage = message.web_preview
+    if webpage:
+        metadata['url'] = webpage.url
+        metadata['title'] = webpage.title or metadata['title']
+    return metadata
+
+def search_text(row: Dict) -> str:
+    """النص الموحد الذي يفهرسه البحث (نص الرسالة وعنوان الوسائط واسم الملف)"""
+    return index_text(row.get('content'), row.get('title'), row.get('file_name'))
+
+def json_record(row: Dict) -> Dict:
+    """سجل الرسالة في مقطع JSON اليومي (التعديل والحذف يُلحقان سجلاً كاملاً يحل محل السابق)"""
+    record = {
+        'message_id': row['message_id'],
+        'channel_id': row['channel_id'],
+        'date': row['date'],
+        'content': row['content'],
+        'media_type': row['media_type'],
+        'file_id': row['file_id'],
+        'file_name': row['file_name'],
+        'grouped_id': row.get('grouped_id')
+    }
+    record.update({key: row[key] for key in MEDIA_COLUMNS if row.get(key) is not None})
+    for key in ('edited_at', 'deleted_at'):
+        if row.get(key):
+            record[key] = row[key]
+    return record
+
+def build_row(message) -> Dict:
+    """بيانات الرسالة بالشكل الذي يحفظه طابور الكتابة"""
+    msg_date = message.date
+    media_type, file_id, file_name = media_info(message)
+
+    row = {
+        'message_id': message.id,
+        'channel_id': message.chat_id,
+        'date': msg_date.isoformat(),
+        'year': msg_date.year,
+        'month': msg_date.month,
+        'day': msg_date.day,
+        'date_ts': int(msg_date.timestamp()),
+        'local_date': msg_date.astimezone(archive_timezone()).date().isoformat(),
+        # رسائل Telethon لا تملك caption دائماً (تعليق الوسائط يأتي في text)
+        'content': message.text or getattr(message, 'caption', None) or "",
+        'media_type': media_type,
+        'file_id': file_id,
+        'file_name': file_name,
+        'grouped_id': getattr(message, 'grouped_id', None)
+    }
+    row.update(media_metadata(message))
+    row['content_hash'] = content_hash(row)
+    row['search_text'] = search_text(row)
+    return row
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+حاكم معدل الطلبات لـ Telethon
+دلو رموز (Token Bucket) لكل نوع طلب يتعلم الحدود من أخطاء FloodWait ويستأنف تلقائياً
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import Dict, Optional, Callable, Awaitable
+
+try:
+    from telethon import TelegramClient
+    from telethon.errors import FloodWaitError
+except ImportError:
+    print("❌ المكتبات المطلوبة غير مثبتة")
+    print("🔧 قم بتشغيل: python run.py --setup")
+    sys.exit(1)
+
+from utils.fair_scheduler import FairScheduler, current_channel, current_priority, PRIORITY_BACKFILL
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """دلو رموز بمعدل قابل للتعديل وفترة حظر بعد FloodWait"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+        # إحصائيات
+        self.requests = 0
+        self.flood_waits = 0
+        self.last_flood_seconds = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """الوقت المتبقي قبل السماح بالطلب التالي"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """انتظار توفر رمز ثم استهلاكه"""
+        while True:
+            delay = self.wait_time()
+            if delay <= 0:
+                self.tokens -= 1
+                self.requests += 1
+                return
+            await asyncio.sleep(delay)
+
+class RateGovernor:
+    """يوزع الطلبات على دلاء لكل نوع طلب مع دلو عام للحساب يُقسم بالتناوب بين القنوات، ويتكيف مع FloodWait
+
+    طلبات الأرشفة الرجعية تمر أيضاً عبر دلو خاص بنسبة محددة من المعدل العام، وتنتظر خلف الطلبات المباشرة
+    """
+
+    def __init__(self, default_rate: float = 20.0, global_rate: float = 30.0,
+                 min_rate: float = 0.2, max_flood_wait: int = 3600,
+                 recovery_step: float = 0.05, backfill_share: float = 0.5):
+        self.default_rate = default_rate
+        self.min_rate = min_rate
+        self.max_flood_wait = max_flood_wait
+        self.recovery_step = recovery_step
+
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.buckets: Dict[str, TokenBucket] = {}
+
+        # الأرشفة الرجعية لا تتجاوز هذه النسبة من الميزانية العامة
+        backfill_rate = max(min_rate, global_rate * backfill_share)
+        self.backfill_bucket = TokenBucket(backfill_rate, max(1.0, backfill_rate))
+
+        # توزيع رموز الدلو العام بالتناوب بين القنوات
+        self.fair = FairScheduler(concurrency=1)
+
+    def bucket(self, method: str) -> TokenBucket:
+        """دلو نوع الطلب (يُنشأ عند أول استخدام)"""
+        if method not in self.buckets:
+            self.buckets[method] = TokenBucket(self.default_rate, max(1.0, self.default_rate))
+        return self.buckets[method]
+
+    async def acquire(self, method: str):
+        """انتظار السماح بطلب من النوع المحدد"""
+        if current_priority.get() == PRIORITY_BACKFILL:
+            await self.backfill_bucket.acquire()
+        await self.bucket(method).acquire()
+        async with self.fair.turn(current_channel.get()):
+            await self.global_bucket.acquire()
+
+    def on_success(self, method: str):
+        """زيادة تدريجية للمعدل بعد النجاح حتى المعدل الافتراضي"""
+        bucket = self.bucket(method)
+        if bucket.rate < self.default_rate:
+            bucket.rate = min(self.default_rate, bucket.rate + self.recovery_step)
+
+    def on_flood_wait(self, method: str, seconds: int):
+        """تعلم الحد من FloodWait: خفض المعدل إلى النصف وحظر النوع حتى انتهاء المهلة"""
+        bucket = self.bucket(method)
+        bucket.flood_waits += 1
+        bucket.last_flood_seconds = seconds
+        bucket.rate = max(self.min_rate, bucket.rate / 2)
+        bucket.tokens = 0
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+        logger.warning(f"⏳ FloodWait على {method}: {seconds} ثانية - المعدل الجديد {bucket.rate:.2f} طلب/ثانية")
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """المعدل الحالي ووقت الانتظار لكل نوع طلب"""
+        return {
+            method: {
+                'rate': bucket.rate,
+                'wait': bucket.wait_time(),
+                'requests': bucket.requests,
+                'flood_waits': bucket.flood_waits,
+            }
+            for method, bucket in sorted(self.buckets.items())
+        }
+
+    def channel_requests(self) -> Dict[str, int]:
+        """عدد الطلبات الممنوحة لكل قناة من الميزانية العامة"""
+        return {str(key): count for key, count in self.fair.granted.items() if key is not None}
+
+class GovernedTelegramClient(TelegramClient):
+    """عميل Telethon يمرر كل طلب عبر حاكم المعدل ويعيد المحاولة بعد FloodWait"""
+
+    def __init__(self, *args, governor: Optional[RateGovernor] = None, **kwargs):
+        # تعطيل الانتظار التلقائي في Telethon حتى يتعلم الحاكم من كل FloodWait
+        kwargs.setdefault('flood_sleep_threshold', 0)
+        super().__init__(*args, **kwargs)
+        self.governor = governor or RateGovernor()
+        # يُستدعى بعد كل إعادة اتصال تلقائية لاستكمال التحديثات الفائتة
+        self.on_reconnect: Optional[Callable[[], Awaitable[None]]] = None
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        method = type(request).__name__
+        while True:
+            await self.governor.acquire(method)
+            try:
+                result = await super().__call__(request, ordered=ordered, flood_sleep_threshold=0)
+            except FloodWaitError as e:
+                if e.seconds > self.governor.max_flood_wait:
+                    raise
+                self.governor.on_flood_wait(method, e.seconds)
+                continue
+
+            self.governor.on_success(method)
+            return result
+
+    async def _handle_auto_reconnect(self):
+        await super()._handle_auto_reconnect()
+        if self.on_reconnect:
+            logger.info("🔌 تمت إعادة الاتصال - استكمال التحديثات الفائتة")
+            asyncio.create_task(self.on_reconnect())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تتبع تعديل وحذف الرسائل
+النسخ السابقة تُحفظ في جدول message_revisions، والرسائل المحذوفة تبقى في الأرشيف مع علامة حذف
+"""
+
+import logging
+import sqlite3
+from typing import Optional, List, Dict
+
+from utils.storage_executor import ensure_columns
+from utils.write_queue import INSERT_MESSAGE_SQL, row_params
+from utils.albums import UPSERT_GROUP_SQL
+from utils.message_rows import CONTENT_FIELDS, MEDIA_COLUMNS, MEDIA_INDEXES, search_text
+from utils.coverage import IdCoverage
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS message_revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id INTEGER,
+        message_id INTEGER NOT NULL,
+        content TEXT,
+        media_type TEXT,
+        file_id TEXT,
+        file_name TEXT,
+        replaced_at TEXT NOT NULL,
+        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_revisions_message ON message_revisions(channel_id, message_id)'
+]
+
+# الصف كاملاً (مع بيانات الوسائط) لأن سجله في مقطع JSON يحل محل السجل الأصلي عند القراءة
+ROW_COLUMNS = (
+    'message_id', 'channel_id', 'date', 'year', 'month', 'day',
+    'content', 'media_type', 'file_id', 'file_name', 'grouped_id', 'edited_at', 'deleted_at',
+    *MEDIA_COLUMNS
+)
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء جدول النسخ وأعمدة التعديل والحذف"""
+    ensure_columns(conn, 'archived_messages', {'edited_at': 'TEXT', 'deleted_at': 'TEXT', 'content_hash': 'TEXT'})
+    ensure_columns(conn, 'archived_messages', MEDIA_COLUMNS)
+    for statement in SCHEMA + MEDIA_INDEXES:
+        conn.execute(statement)
+
+def _load_row(conn: sqlite3.Connection, channel_id, message_id: int) -> Optional[Dict]:
+    cursor = conn.execute(
+        f'''SELECT {', '.join(ROW_COLUMNS)} FROM archived_messages
+            WHERE channel_id = ? AND message_id = ?''',
+        (channel_id, message_id)
+    )
+    row = cursor.fetchone()
+    return dict(zip(ROW_COLUMNS, row)) if row else None
+
+def _update_row(conn: sqlite3.Connection, row: Dict):
+    conn.execute(
+        f'''UPDATE archived_messages SET content = ?, media_type = ?, file_id = ?, file_name = ?,
+                   content_hash = ?, {', '.join(f'{column} = ?' for column in MEDIA_COLUMNS)}, search_text = ?
+            WHERE channel_id = ? AND message_id = ?''',
+        (row['content'], row['media_type'], row['file_id'], row['file_name'], row.get('content_hash'),
+         *(row.get(column) for column in MEDIA_COLUMNS), search_text(row), row['channel_id'], row['message_id'])
+    )
+
+def apply_edit(conn: sqlite3.Connection, row: Dict, edited_at: str,
+               coverage: Optional[IdCoverage] = None) -> Optional[Dict]:
+    """تطبيق تعديل على رسالة مؤرشفة (يُنفذ في خيط الكتابة)
+
+    يُرجع الصف بعد التعديل، أو None إذا لم تتغير الحقول المؤرشفة.
+    """
+    current = _load_row(conn, row['channel_id'], row['message_id'])
+    changes = []
+
+    if current is None:
+        # رسالة لم تُؤرشف بعد - حفظها بنسختها الحالية
+        conn.execute(INSERT_MESSAGE_SQL, row_params(row))
+        if row.get('grouped_id'):
+            conn.execute(UPSERT_GROUP_SQL, (row['channel_id'], row['grouped_id']))
+        if coverage:
+            changes = coverage.record_rows(conn, [row])
+    elif all(current[field] == row[field] for field in CONTENT_FIELDS):
+        # تعديلات التفاعلات والمشاهدات لا تغيّر الحقول المؤرشفة
+        return None
+    elif current['content'] == row['content'] and current['file_id'] in (None, row['file_id']):
+        # نفس النص ونفس الملف: بيانات أدق للوسائط (تصنيف أو اسم ملف جديد) وليس تعديلاً
+        _update_row(conn, row)
+        conn.commit()
+        return _load_row(conn, row['channel_id'], row['message_id'])
+    else:
+        conn.execute(
+            '''INSERT INTO message_revisions
+               (channel_id, message_id, content, media_type, file_id, file_name, replaced_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            (current['channel_id'], current['message_id'], current['content'],
+             current['media_type'], current['file_id'], current['file_name'], edited_at)
+        )
+        _update_row(conn, row)
+
+    conn.execute(
+        'UPDATE archived_messages SET edited_at = ? WHERE channel_id = ? AND message_id = ?',
+        (edited_at, row['channel_id'], row['message_id'])
+    )
+    conn.commit()
+    if changes:
+        coverage.apply(changes)
+    return _load_row(conn, row['channel_id'], row['message_id'])
+
+def apply_deletes(conn: sqlite3.Connection, channel_id, message_ids: List[int], deleted_at: str) -> List[Dict]:
+    """وضع علامة حذف على الرسائل المؤرشفة (يُنفذ في خيط الكتابة) وإرجاع الصفوف المتأثرة"""
+    rows = []
+    for message_id in message_ids:
+        cursor = conn.execute(
+            '''UPDATE archived_messages SET deleted_at = ?
+               WHERE channel_id = ? AND message_id = ? AND deleted_at IS NULL''',
+            (deleted_at, channel_id, message_id)
+        )
+        if cursor.rowcount:
+            rows.append(_load_row(conn, channel_id, message_id))
+    conn.commit()
+    return rows
+
+def get_revisions(conn: sqlite3.Connection, channel_id, message_id: int) -> List[Dict]:
+    """النسخ السابقة لرسالة من الأقدم إلى الأحدث"""
+    cursor = conn.execute(
+        '''SELECT content, media_type, file_id, file_name, replaced_at FROM message_revisions
+           WHERE channel_id = ? AND message_id = ? ORDER BY id''',
+        (channel_id, message_id)
+    )
+    return [
+        dict(zip(('content', 'media_type', 'file_id', 'file_name', 'replaced_at'), row))
+        for row in cursor.fetchall()
+    ]
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+البحث النصي الكامل في الأرشيف (SQLite FTS5)
+جدول messages_fts يفهرس عمود search_text (النص الموحد للرسالة وعنوان الوسائط واسم الملف) وتحدّثه الـ triggers،
+وفهرسة الأرشيف الموجود تتم على دفعات
+"""
+
+import asyncio
+import logging
+import sqlite3
+from typing import Optional, List, Dict
+
+from utils.storage_executor import StorageExecutor, ensure_columns
+from utils.arabic_text import index_text, query_words, matches
+
+logger = logging.getLogger(__name__)
+
+# الصفوف حتى هذا المعرف مفهرسة وتحدّثها الـ triggers (بعد اكتمال البناء يصبح الحد أكبر معرف ممكن)
+INDEXED_ALL = 2 ** 63 - 1
+INDEXED_UPTO_SQL = '(SELECT indexed_upto FROM search_index_state WHERE id = 1)'
+
+# عدد الصفوف المفهرسة في كل عملية كتابة أثناء البناء
+REINDEX_BATCH = 5000
+
+# علامات الكلمات المطابقة في المقتطف، وعدد كلماته
+SNIPPET_OPEN = '【'
+SNIPPET_CLOSE = '】'
+SNIPPET_WORDS = 16
+
+# الـ triggers السابقة للفهرس (تُحذف عند تغيير أعمدته)
+TRIGGERS = ('messages_fts_insert', 'messages_fts_delete', 'messages_fts_update')
+
+SCHEMA = [
+    # الجدول لا يخزن النص (content=) بل يقرأه من archived_messages عند الحاجة
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        search_text,
+        content='archived_messages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''',
+    '''CREATE TABLE IF NOT EXISTS search_index_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        indexed_upto INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON archived_messages
+        WHEN new.id <= {INDEXED_UPTO_SQL}
+        BEGIN
+            INSERT INTO messages_fts (rowid, search_text) VALUES (new.id, new.search_text);
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON archived_messages
+        WHEN old.id <= {INDEXED_UPTO_SQL}
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        END''',
+    # إعادة أرشفة رسالة بنفس النص لا تعيد فهرستها
+    f'''CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF search_text ON archived_messages
+        WHEN old.id <= {INDEXED_UPTO_SQL} AND old.search_text IS NOT new.search_text
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+            INSERT INTO messages_fts (rowid, search_text) VALUES (new.id, new.search_text);
+        END'''
+]
+
+def init_schema(conn: sqlite3.Connection):
+    """إنشاء فهرس البحث والـ triggers (الأرشيف الموجود يُفهرس لاحقاً بـ SearchIndex.build)"""
+    # فهرس B-tree على النص لا يخدم البحث بـ LIKE '%...%' ويبطئ الإدراج فقط
+    conn.execute('DROP INDEX IF EXISTS idx_content')
+    ensure_columns(conn, 'archived_messages', {'search_text': 'TEXT'})
+
+    # فهرس سابق على النص الأصلي (قبل التوحيد) يُعاد بناؤه
+    existing = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+    if existing and 'search_text' not in existing[0]:
+        for trigger in TRIGGERS:
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute('DROP TABLE messages_fts')
+        conn.execute('DELETE FROM search_index_state')
+
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    if conn.execute('SELECT 1 FROM search_index_state').fetchone() is None:
+        has_rows = conn.execute('SELECT 1 FROM archived_messages LIMIT 1').fetchone()
+        conn.execute(
+            'INSERT INTO search_index_state (id, indexed_upto) VALUES (1, ?)',
+            (0 if has_rows else INDEXED_ALL,)
+        )
+
+def fts_query(text: str) -> Optional[str]:
+    """تحويل نص البحث إلى استعلام FTS5: كل كلمة موحدة بأي من صيغها، و* في آخرها للبحث بالبادئة"""
+    terms = []
+    for forms, prefix in query_words(text):
+        suffix = '*' if prefix else ''
+        terms.append('(' + ' OR '.join(f'"{form}"{suffix}' for form in forms) + ')')
+    return ' AND '.join(terms) or None
+
+def make_snippet(text: str, terms: List[tuple], width: int = SNIPPET_WORDS) -> str:
+    """مقطع من النص الأصلي حول أول كلمة مطابقة مع تمييز الكلمات المطابقة"""
+    words = (text or '').split()
+    hits = {i for i, word in enumerate(words) if matches(word, terms)}
+    start = max(0, min(hits) - width // 3) if hits else 0
+    end = min(len(words), start + width)
+
+    snippet = ' '.join(
+        f"{SNIPPET_OPEN}{word}{SNIPPET_CLOSE}" if i in hits else word
+        for i, word in enumerate(words[start:end], start)
+    )
+    return ('…' if start else '') + snippet + ('…' if end < len(words) else '')
+
+def index_batch(conn: sqlite3.Connection, batch: int = REINDEX_BATCH) -> int:
+    """فهرسة الدفعة التالية من الصفوف غير المفهرسة (يُنفذ في خيط الكتابة) وإرجاع الحد الجديد"""
+    indexed_upto = conn.execute(f'SELECT {INDEXED_UPTO_SQL}').fetchone()[0]
+    if indexed_upto >= INDEXED_ALL:
+        return indexed_upto
+
+    rows = conn.execute(
+        'SELECT id, content, title, file_name FROM archived_messages WHERE id > ? ORDER BY id LIMIT ?',
+        (indexed_upto, batch)
+    ).fetchall()
+    # الصفوف فوق الحد لا تُحدّثها الـ triggers، فيُكتب نصها الموحد ويُفهرس هنا
+    texts = [(index_text(content, title, file_name), row_id) for row_id, content, title, file_name in rows]
+    conn.executemany('UPDATE archived_messages SET search_text = ? WHERE id = ?', texts)
+    conn.executemany('INSERT INTO messages_fts (rowid, search_text) VALUES (?, ?)', [(row_id, text) for text, row_id in texts])
+
+    # آخر دفعة في نفس المعاملة مع رفع الحد، فلا يفوت الفهرس صف أُضيف بينهما
+    indexed_upto = INDEXED_ALL if len(rows) < batch else rows[-1][0]
+    conn.execute(
+        'UPDATE search_index_state SET indexed_upto = ?, updated_at = CURRENT_TIMESTAMP WHERE id = 1',
+        (indexed_upto,)
+    )
+    conn.commit()
+    return indexed_upto
+
+def reset_index(conn: sqlite3.Connection):
+    """تفريغ الفهرس لإعادة بنائه من البداية"""
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')")
+    conn.execute('UPDATE search_index_state SET indexed_upto = 0, updated_at = CURRENT_TIMESTAMP WHERE id = 1')
+    conn.commit()
+
+def search(conn: sqlite3.Connection, text: str, limit: int = 20, offset: int = 0,
+           channel_id: Optional[int] = None) -> List[Dict]:
+    """الرسائل المطابقة مرتبة حسب bm25 مع مقتطف من النص الأصلي حول الكلمات المطابقة"""
+    query = fts_query(text)
+    if query is None:
+        return []
+
+    where = 'messages_fts MATCH ?'
+    params: list = [query]
+    if channel_id is not None:
+        where += ' AND a.channel_id = ?'
+        params.append(channel_id)
+
+    cursor = conn.execute(
+        f'''SELECT a.message_id, a.channel_id, a.date, a.media_type, a.deleted_at,
+                   COALESCE(NULLIF(a.content, ''), a.title, a.file_name) AS text,
+                   bm25(messages_fts) AS rank
+            FROM messages_fts JOIN archived_messages a ON a.id = messages_fts.rowid
+            WHERE {where}
+            ORDER BY rank LIMIT ? OFFSET ?''',
+        [*params, limit, offset]
+    )
+    columns = [column[0] for column in cursor.description]
+    terms = query_words(text)
+    results = []
+    for row in cursor.fetchall():
+        result = dict(zip(columns, row))
+        result['snippet'] = make_snippet(result.pop('text'), terms)
+        results.append(result)
+    return results
+
+def count_matches(conn: sqlite3.Connection, text: str) -> int:
+    """عدد الرسائل المطابقة"""
+    query = fts_query(text)
+    if query is None:
+        return 0
+    return conn.execute('SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?', (query,)).fetchone()[0]
+
+class SearchIndex:
+    """البحث في الأرشيف وبناء فهرسه للرسائل المؤرشفة قبل إنشائه"""
+
+    def __init__(self, storage: StorageExecutor, batch: int = REINDEX_BATCH):
+        self.storage = storage
+        self.batch = batch
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_building(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """إكمال بناء الفهرس في الخلفية إن لم يكتمل"""
+        if not self.is_building:
+            self._task = asyncio.create_task(self._build(), name="search-index")
+
+    async def stop(self):
+        if self.is_building:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def reindex(self):
+        """إعادة بناء الفهرس من البداية (البحث يعطي نتائج جزئية حتى يكتمل)"""
+        await self.stop()
+        await self.storage.write(reset_index)
+        self.start()
+
+    async def _build(self):
+        indexed_upto = await self.storage.fetchone(f'SELECT {INDEXED_UPTO_SQL}')
+        if indexed_upto[0] >= INDEXED_ALL:
+            return
+
+        logger.info("🔎 بدء بناء فهرس البحث للرسائل المؤرشفة...")
+        batches = 0
+        try:
+            while True:
+                indexed_upto = await self.storage.write(index_batch, self.batch)
+                if indexed_upto >= INDEXED_ALL:
+                    break
+                batches += 1
+                if batches % 100 == 0:
+                    logger.info(f"🔎 فهرس البحث: حتى الصف {indexed_upto:,}")
+        except Exception as e:
+            logger.error(f"❌ خطأ في بناء فهرس البحث: {e}")
+            return
+        logger.info("✅ اكتمل بناء فهرس البحث")
+
+    async def progress(self) -> Optional[float]:
+        """نسبة الصفوف المفهرسة، أو None إذا اكتمل الفهرس"""
+        indexed_upto, last_id = await self.storage.fetchone(
+            f'SELECT {INDEXED_UPTO_SQL}, (SELECT MAX(id) FROM archived_messages)'
+        )
+        if indexed_upto >= INDEXED_ALL:
+            return None
+        return min(1.0, indexed_upto / last_id) if last_id else 0.0
+
+    async def search(self, text: str, limit: int = 20, offset: int = 0,
+                     channel_id: Optional[int] = None) -> List[Dict]:
+        return await self.storage.read(search, text, limit, offset, channel_id)
+
+    async def count(self, text: str) -> int:
+        return await self.storage.read(count_matches, text)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ملفات الفائض لطابور الكتابة
+عند امتلاء الطابور تُكتب الدفعات الزائدة بالترتيب في ملف JSON Lines وتُقرأ منه عند توفر مكان،
+وموضع القراءة المحفوظ لا يتقدم إلا بعد حفظ الدفعات المقروءة في قاعدة البيانات
+"""
+
+import json
+import logging
+import os
+import time
+from typing import List, Dict, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# حجم الجزء المقروء من نهاية الملف عند البحث عن آخر سطر كامل
+TAIL_CHUNK = 64 * 1024
+
+class SpillFile:
+    """ملف JSON Lines بترتيب الإضافة مع موضع قراءة محفوظ في ملف جانبي (يُنفذ في خيوط الإدخال/الإخراج)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset_path = f"{path}.offset"
+        # موضع أول دفعة لم يُؤكد حفظها (المحفوظ في الملف الجانبي)، وموضع القراءة التالية
+        self._offset = self._load_offset()
+        self._read_offset = self._offset
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self.offset_path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save_offset(self):
+        with open(self.offset_path, 'w', encoding='utf-8') as f:
+            f.write(str(self._offset))
+
+    def _parse(self, line: bytes) -> Optional[Tuple[float, List[Dict]]]:
+        """(وقت الإضافة، الرسائل) لسطر كامل، أو None لسطر فارغ أو تالف"""
+        if not line.strip():
+            return None
+        try:
+            spilled_at, rows = json.loads(line)
+            return spilled_at, rows
+        except ValueError as e:
+            logger.error(f"❌ تجاهل سطر تالف في ملف الفائض {self.path}: {e}")
+            return None
+
+    def _truncate_torn_tail(self):
+        """حذف سطر أخير لم تكتمل كتابته (انقطاع أثناء الإضافة) حتى لا تلتصق به الإضافة التالية"""
+        with open(self.path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b'\n':
+                return
+
+            size = end
+            keep = 0
+            while end > 0:
+                start = max(0, end - TAIL_CHUNK)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    keep = start + newline + 1
+                    break
+                end = start
+            f.truncate(keep)
+        logger.warning(f"⚠️ حذف {size - keep} بايت من سطر غير مكتمل في نهاية ملف الفائض {self.path}")
+
+    def recover(self) -> List[int]:
+        """أحجام الدفعات المتبقية من تشغيل سابق (لم يُؤكد حفظها)، دون السطر الأخير المقطوع أو التالفة"""
+        if not os.path.exists(self.path):
+            return []
+        self._truncate_torn_tail()
+
+        sizes = []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                record = self._parse(line)
+                if record is not None:
+                    sizes.append(len(record[1]))
+        self._read_offset = self._offset
+        return sizes
+
+    def append(self, rows: List[Dict]):
+        """إضافة دفعة إلى نهاية الملف مع وقت إضافتها"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if os.path.exists(self.path):
+            # إضافة سابقة فشلت في منتصفها تترك سطراً مقطوعاً
+            self._truncate_torn_tail()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps([time.time(), rows], ensure_ascii=False) + '\n')
+
+    def read(self, max_rows: int) -> List[Tuple[float, List[Dict], int]]:
+        """قراءة الدفعات التالية حتى max_rows رسالة (دفعة واحدة على الأقل) مع موضع نهاية كل دفعة
+
+        الموضع المحفوظ لا يتغير: يُؤكد بـ commit بعد حفظ الدفعات.
+        """
+        items: List[Tuple[float, List[Dict], int]] = []
+        if not os.path.exists(self.path):
+            return items
+
+        size = 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._read_offset)
+            while True:
+                line = f.readline()
+                # سطر بلا نهاية لم تكتمل إضافته بعد (أو فشلت) فلا يُقرأ
+                if not line.endswith(b'\n'):
+                    break
+                record = self._parse(line)
+                if record is None:
+                    self._read_offset = f.tell()
+                    continue
+                spilled_at, rows = record
+                if items and size + len(rows) > max_rows:
+                    break
+                self._read_offset = f.tell()
+                items.append((spilled_at, rows, self._read_offset))
+                size += len(rows)
+        return items
+
+    def commit(self, offset: int):
+        """تأكيد حفظ الدفعات حتى offset، وحذف الملف إذا لم يبق فيه ما لم يُحفظ"""
+        if offset <= self._offset:
+            return
+        self._offset = offset
+        if self._read_offset <= offset and os.path.getsize(self.path) <= offset:
+            self.clear()
+        else:
+            self._save_offset()
+
+    def clear(self):
+        """حذف الملف بعد حفظ كل ما فيه"""
+        for path in (self.path, self.offset_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._offset = 0
+        self._read_offset = 0
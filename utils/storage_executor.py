@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+طبقة تنفيذ التخزين خارج حلقة asyncio
+خيط كتابة واحد يملك اتصال الكتابة، ومجموعة خيوط قراءة لكل منها اتصالها الخاص
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+def ensure_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]):
+    """إضافة الأعمدة الناقصة إلى جدول موجود (ترقية قواعد البيانات القديمة)"""
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+class StorageExecutor:
+    """تنفيذ عمليات SQLite والملفات في خيوط منفصلة حتى لا تتوقف حلقة الأحداث"""
+
+    def __init__(self, db_path: str = 'archive.db', readers: int = 2):
+        self.db_path = db_path
+        self.readers = max(1, readers)
+
+        # اتصال الكتابة الوحيد - يُستخدم من خيط الكتابة فقط بعد بدء التشغيل
+        self.conn = self._open_connection()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='db-reader')
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='file-io')
+
+        self._local = threading.local()
+        self._reader_connections = []
+        self._lock = threading.Lock()
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """فتح اتصال SQLite جديد"""
+        return sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        """اتصال القراءة الخاص بالخيط الحالي"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            conn.execute('PRAGMA query_only=ON')
+            self._local.conn = conn
+            with self._lock:
+                self._reader_connections.append(conn)
+        return conn
+
+    async def _submit(self, pool: ThreadPoolExecutor, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, partial(fn, *args, **kwargs))
+
+    async def read(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """تنفيذ fn(conn, ...) للقراءة في أحد خيوط القراءة"""
+        def task():
+            return fn(self._reader_connection(), *args, **kwargs)
+        return await self._submit(self._reader_pool, task)
+
+    async def write(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """تنفيذ fn(conn, ...) في خيط الكتابة (عمليات الكتابة متسلسلة بالترتيب)"""
+        def task():
+            return fn(self.conn, *args, **kwargs)
+        return await self._submit(self._writer, task)
+
+    async def execute(self, query: str, params: tuple = ()):
+        """تنفيذ استعلام كتابة واحد مع commit"""
+        def task(conn):
+            conn.execute(query, params)
+            conn.commit()
+        await self.write(task)
+
+    async def fetchall(self, query: str, params: tuple = ()) -> list:
+        """تنفيذ استعلام قراءة وإرجاع جميع النتائج"""
+        return await self.read(lambda conn: conn.execute(query, params).fetchall())
+
+    async def fetchone(self, query: str, params: tuple = ()):
+        """تنفيذ استعلام قراءة وإرجاع أول نتيجة"""
+        return await self.read(lambda conn: conn.execute(query, params).fetchone())
+
+    async def run_io(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """تنفيذ عملية ملفات (قراءة/كتابة) خارج حلقة الأحداث"""
+        return await self._submit(self._io_pool, fn, *args, **kwargs)
+
+    def close(self):
+        """إيقاف الخيوط وإغلاق جميع الاتصالات"""
+        self._io_pool.shutdown(wait=True)
+        self._reader_pool.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+        with self._lock:
+            for conn in self._reader_connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._reader_connections.clear()
+
+        self.conn.close()
+        logger.info("✅ تم إغلاق طبقة التخزين")
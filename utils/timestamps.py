@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تواريخ الرسائل كأرقام وأيام محلية
+date_ts (ثواني Unix) للاستعلام عن الفترات بنطاقات نصف مفتوحة [بداية، نهاية) على فهرس،
+وlocal_date (YYYY-MM-DD) يوم الرسالة بتوقيت الأرشيف (ARCHIVE_TIMEZONE)، مع ترحيل الأرشيف الموجود على دفعات
+"""
+
+import asyncio
+import logging
+import re
+import sqlite3
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Optional, Tuple, Dict
+
+from utils.storage_executor import StorageExecutor, ensure_columns
+
+logger = logging.getLogger(__name__)
+
+# الصفوف حتى هذا المعرف مُرحّلة (بعد اكتمال الترحيل يصبح الحد أكبر معرف ممكن)
+MIGRATED_ALL = 2 ** 63 - 1
+MIGRATED_UPTO_SQL = '(SELECT migrated_upto FROM timestamp_state WHERE id = 1)'
+
+# عدد الصفوف المُرحّلة في كل عملية كتابة
+MIGRATE_BATCH = 5000
+
+SCHEMA = [
+    'CREATE INDEX IF NOT EXISTS idx_messages_date_ts ON archived_messages(date_ts)',
+    'CREATE INDEX IF NOT EXISTS idx_messages_local_date ON archived_messages(local_date)',
+    # الملفات الأكبر حجماً حسب النوع والشهر بأيام الأرشيف (بدلاً من الفهرس السابق على year وmonth)
+    'DROP INDEX IF EXISTS idx_messages_media_size',
+    'CREATE INDEX IF NOT EXISTS idx_messages_media_local_date ON archived_messages(media_type, local_date, media_size)',
+    '''CREATE TABLE IF NOT EXISTS timestamp_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        timezone TEXT NOT NULL,
+        migrated_upto INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )'''
+]
+
+_OFFSET = re.compile(r'^(?:UTC)?([+-])(\d{1,2})(?::?(\d{2}))?$')
+
+_archive_tz: tzinfo = timezone.utc
+_archive_tz_name = 'UTC'
+
+def parse_timezone(name: str) -> Optional[tzinfo]:
+    """منطقة زمنية بالاسم (Asia/Riyadh) أو بالإزاحة (+03:00)، أو None إذا لم تُعرف"""
+    name = (name or '').strip()
+    if not name or name.upper() in ('UTC', 'Z'):
+        return timezone.utc
+    match = _OFFSET.match(name)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return timezone(-offset if sign == '-' else offset)
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception:
+        return None
+
+def set_archive_timezone(name: str):
+    """ضبط توقيت الأرشيف (يُستدعى عند تحميل الإعدادات قبل إعداد قاعدة البيانات)"""
+    global _archive_tz, _archive_tz_name
+    tz = parse_timezone(name)
+    if tz is None:
+        logger.warning(f"⚠️ المنطقة الزمنية غير معروفة: {name} - سيتم استخدام UTC")
+        tz, name = timezone.utc, 'UTC'
+    _archive_tz, _archive_tz_name = tz, (name or 'UTC').strip()
+
+def archive_timezone() -> tzinfo:
+    return _archive_tz
+
+def archive_timezone_name() -> str:
+    return _archive_tz_name
+
+def local_today() -> date:
+    """تاريخ اليوم بتوقيت الأرشيف"""
+    return datetime.now(_archive_tz).date()
+
+def parse_date(value: str) -> datetime:
+    """تاريخ ISO المخزن (التواريخ بلا منطقة زمنية من إصدارات قديمة تُعامل كـ UTC)"""
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+def row_timestamps(value: str) -> Tuple[int, str]:
+    """(date_ts, local_date) لتاريخ رسالة بصيغة ISO"""
+    moment = parse_date(value)
+    return int(moment.timestamp()), moment.astimezone(_archive_tz).date().isoformat()
+
+def row_local_date(row: Dict) -> date:
+    """اليوم المحلي لصف رسالة (الصفوف المحفوظة قبل إضافة local_date يُحسب يومها من تاريخها)"""
+    return date.fromisoformat(row.get('local_date') or row_timestamps(row['date'])[1])
+
+def day_bounds(start_day: date, end_day: Optional[date] = None, tz: Optional[tzinfo] = None) -> Tuple[int, int]:
+    """نطاق [بداية أول يوم، بداية اليوم التالي لآخر يوم) بثواني Unix (بتوقيت الأرشيف افتراضياً)"""
+    tz = tz or _archive_tz
+    end_day = (end_day or start_day) + timedelta(days=1)
+    # بداية كل يوم تُحسب مستقلة، فاليوم الذي يتغير فيه التوقيت الصيفي يبقى يوماً كاملاً
+    start = datetime(start_day.year, start_day.month, start_day.day, tzinfo=tz)
+    end = datetime(end_day.year, end_day.month, end_day.day, tzinfo=tz)
+    return int(start.timestamp()), int(end.timestamp())
+
+def month_bounds(year: int, month: int) -> Tuple[str, str]:
+    """نطاق أيام الشهر [أول يوم، أول يوم في الشهر التالي) بصيغة local_date"""
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return date(year, month, 1).isoformat(), date(next_year, next_month, 1).isoformat()
+
+def period_bounds(year: int, month: Optional[int] = None, day: Optional[int] = None) -> Tuple[str, str]:
+    """نطاق أيام السنة أو الشهر أو اليوم [أول يوم، اليوم التالي لآخر يوم) بصيغة local_date"""
+    if month is None:
+        return date(year, 1, 1).isoformat(), date(year + 1, 1, 1).isoformat()
+    if day is None:
+        return month_bounds(year, month)
+    start = date(year, month, day)
+    return start.isoformat(), (start + timedelta(days=1)).isoformat()
+
+def range_filter(conn: sqlite3.Connection, start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> Tuple[str, list]:
+    """شرط WHERE للفترة [start_ts, end_ts) على date_ts (أحد الحدين يمكن أن يكون None)
+
+    أثناء الترحيل تُقارن الصفوف غير المُرحّلة بعمود date النصي (صيغة ISO بتوقيت UTC تُقارن نصياً).
+    """
+    ts_terms, date_terms, params, date_params = [], [], [], []
+    for operator, value in (('>=', start_ts), ('<', end_ts)):
+        if value is None:
+            continue
+        ts_terms.append(f'date_ts {operator} ?')
+        params.append(value)
+        date_terms.append(f'date {operator} ?')
+        # الحد بلا لاحقة المنطقة الزمنية يصلح للتواريخ المخزنة بها (+00:00) وبدونها
+        date_params.append(datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None).isoformat())
+
+    where = ' AND '.join(ts_terms)
+    if conn.execute(f'SELECT {MIGRATED_UPTO_SQL}').fetchone()[0] >= MIGRATED_ALL:
+        return where, params
+    return f"(({where}) OR (date_ts IS NULL AND {' AND '.join(date_terms)}))", params + date_params
+
+def init_schema(conn: sqlite3.Connection):
+    """إضافة عمودي date_ts وlocal_date وفهرسيهما (الأرشيف الموجود يُرحّل لاحقاً بـ TimestampMigration)"""
+    ensure_columns(conn, 'archived_messages', {'date_ts': 'INTEGER', 'local_date': 'TEXT'})
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    state = conn.execute('SELECT timezone FROM timestamp_state WHERE id = 1').fetchone()
+    if state is None:
+        has_rows = conn.execute('SELECT 1 FROM archived_messages LIMIT 1').fetchone()
+        conn.execute(
+            'INSERT INTO timestamp_state (id, timezone, migrated_upto) VALUES (1, ?, ?)',
+            (_archive_tz_name, 0 if has_rows else MIGRATED_ALL)
+        )
+    elif state[0] != _archive_tz_name:
+        # تغيير توقيت الأرشيف يعيد حساب local_date لكل الصفوف (date_ts لا يتغير)
+        logger.info(f"🕐 تغير توقيت الأرشيف من {state[0]} إلى {_archive_tz_name} - سيُعاد حساب الأيام المحلية")
+        conn.execute(
+            'UPDATE timestamp_state SET timezone = ?, migrated_upto = 0, updated_at = CURRENT_TIMESTAMP WHERE id = 1',
+            (_archive_tz_name,)
+        )
+
+def migrate_batch(conn: sqlite3.Connection, batch: int = MIGRATE_BATCH) -> int:
+    """ترحيل الدفعة التالية من الصفوف (يُنفذ في خيط الكتابة) وإرجاع الحد الجديد"""
+    migrated_upto = conn.execute(f'SELECT {MIGRATED_UPTO_SQL}').fetchone()[0]
+    if migrated_upto >= MIGRATED_ALL:
+        return migrated_upto
+
+    rows = conn.execute(
+        'SELECT id, date FROM archived_messages WHERE id > ? ORDER BY id LIMIT ?',
+        (migrated_upto, batch)
+    ).fetchall()
+    conn.executemany(
+        'UPDATE archived_messages SET date_ts = ?, local_date = ? WHERE id = ?',
+        [(*row_timestamps(value), row_id) for row_id, value in rows]
+    )
+
+    # آخر دفعة في نفس المعاملة مع رفع الحد، والصفوف الجديدة يكتبها طابور الكتابة بقيمها
+    migrated_upto = MIGRATED_ALL if len(rows) < batch else rows[-1][0]
+    conn.execute(
+        'UPDATE timestamp_state SET migrated_upto = ?, updated_at = CURRENT_TIMESTAMP WHERE id = 1',
+        (migrated_upto,)
+    )
+    conn.commit()
+    return migrated_upto
+
+class TimestampMigration:
+    """ترحيل الرسائل المؤرشفة قبل إضافة date_ts وlocal_date في الخلفية"""
+
+    def __init__(self, storage: StorageExecutor, batch: int = MIGRATE_BATCH):
+        self.storage = storage
+        self.batch = batch
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """إكمال الترحيل في الخلفية إن لم يكتمل"""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run(), name="timestamp-migration")
+
+    async def stop(self):
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        migrated_upto = await self.storage.fetchone(f'SELECT {MIGRATED_UPTO_SQL}')
+        if migrated_upto[0] >= MIGRATED_ALL:
+            return
+
+        logger.info("🕐 بدء ترحيل تواريخ الرسائل المؤرشفة (date_ts وlocal_date)...")
+        batches = 0
+        try:
+            while True:
+                migrated_upto = await self.storage.write(migrate_batch, self.batch)
+                if migrated_upto >= MIGRATED_ALL:
+                    break
+                batches += 1
+                if batches % 100 == 0:
+                    logger.info(f"🕐 ترحيل التواريخ: حتى الصف {migrated_upto:,}")
+        except Exception as e:
+            logger.error(f"❌ خطأ في ترحيل التواريخ: {e}")
+            return
+        logger.info("✅ اكتمل ترحيل تواريخ الرسائل")
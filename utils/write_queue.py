@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+طابور الكتابة المؤجلة للأرشيف (Group Commit)
+يجمع الرسائل في دفعات ويحفظها بعملية commit واحدة، مع تقديم الرسائل المباشرة على الأرشفة الرجعية
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Deque, Tuple, Callable, Awaitable
+
+from utils.storage_executor import StorageExecutor
+from utils.fair_scheduler import current_priority, current_replay, PRIORITIES, PRIORITY_LIVE, PRIORITY_BACKFILL
+from utils.albums import UPSERT_GROUP_SQL, group_keys
+from utils.coverage import IdCoverage
+from utils.dead_letters import DeadLetterQueue
+from utils.spill import SpillFile
+from utils.message_rows import MEDIA_COLUMNS, search_text
+from utils.timestamps import row_timestamps, parse_date
+
+logger = logging.getLogger(__name__)
+
+# أعمدة الإدراج بترتيب row_params
+INSERT_COLUMNS = (
+    'message_id', 'channel_id', 'date', 'year', 'month', 'day', 'content', 'media_type', 'file_id', 'file_name',
+    'grouped_id', 'content_hash', *MEDIA_COLUMNS, 'search_text', 'date_ts', 'local_date'
+)
+
+# تحديث الصف الموجود بدلاً من استبداله حتى تبقى علامات التعديل والحذف ومعرف الصف
+INSERT_MESSAGE_SQL = f'''
+    INSERT INTO archived_messages ({', '.join(INSERT_COLUMNS)})
+    VALUES ({', '.join('?' * len(INSERT_COLUMNS))})
+    ON CONFLICT(message_id, channel_id) DO UPDATE SET
+        {', '.join(f'{column} = excluded.{column}' for column in INSERT_COLUMNS[2:])}
+'''
+
+# إدراج الرسائل غير الموجودة فقط (إعادة محاولة قديمة لا تلغي تعديلاً أحدث منها)
+INSERT_MISSING_SQL = INSERT_MESSAGE_SQL.split('ON CONFLICT')[0] + 'ON CONFLICT(message_id, channel_id) DO NOTHING'
+
+# سياسات التعامل مع امتلاء الطابور
+OVERFLOW_BLOCK = 'block'                  # انتظار المنتجين حتى يتوفر مكان
+OVERFLOW_SPILL = 'spill'                  # كتابة الزائد في ملف فائض وقراءته عند توفر مكان
+OVERFLOW_SHED_BACKFILL = 'shed_backfill'  # قبول الرسائل المباشرة دائماً وإيقاف الأرشفة الرجعية حتى يتوفر مكان
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_SPILL, OVERFLOW_SHED_BACKFILL)
+
+SPILL_NAMES = {PRIORITY_LIVE: 'live', PRIORITY_BACKFILL: 'backfill'}
+
+# عدد العينات المحفوظة لحساب توزيع أزمنة الانتظار، وأقل فاصل (بالثواني) بين تنبيهات التأخر
+LATENCY_SAMPLES = 1000
+LAG_ALERT_INTERVAL = 300.0
+
+def percentile(samples, fraction: float) -> float:
+    """قيمة النسبة المئوية المطلوبة من العينات"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def row_params(row: Dict) -> tuple:
+    """تحويل بيانات الرسالة إلى معاملات الإدراج"""
+    return (
+        row['message_id'],
+        row['channel_id'],
+        row['date'],
+        row['year'], row['month'], row['day'],
+        row['content'],
+        row['media_type'],
+        row['file_id'],
+        row['file_name'],
+        row.get('grouped_id'),
+        row.get('content_hash'),
+        *(row.get(column) for column in MEDIA_COLUMNS),
+        # صفوف محفوظة قبل إضافة البحث (ملفات الفائض والعمليات الفاشلة) بلا نص موحد
+        row['search_text'] if 'search_text' in row else search_text(row),
+        # وبلا date_ts وlocal_date
+        *((row['date_ts'], row['local_date']) if 'date_ts' in row else row_timestamps(row['date']))
+    )
+
+class ArchiveWriteQueue:
+    """طابور كتابة يجمع الرسائل ويحفظها دفعة واحدة حسب الحجم أو زمن الانتظار"""
+
+    def __init__(self, storage: StorageExecutor, max_batch: int = 500, max_latency: float = 0.2,
+                 on_flush: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+                 backfill_share: float = 0.5, coverage: Optional[IdCoverage] = None,
+                 dead_letters: Optional[DeadLetterQueue] = None,
+                 max_pending: int = 10000, overflow: str = OVERFLOW_BLOCK, spill_dir: str = 'spill',
+                 lag_alert: float = 60.0, on_lag_alert: Optional[Callable[[Dict], Awaitable[None]]] = None):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.on_flush = on_flush
+        # خريطة المعرفات المؤرشفة (تُحدّث في نفس عملية الحفظ)
+        self.coverage = coverage
+        # الرسائل التي فشل حفظها تُحفظ لإعادة المحاولة بدلاً من فقدانها
+        self.dead_letters = dead_letters
+
+        # أقصى عدد من رسائل الأرشفة الرجعية في الدفعة الواحدة
+        self.backfill_batch = max(1, int(max_batch * backfill_share))
+
+        # حد الرسائل في الذاكرة (من الإضافة حتى الحفظ) وسياسة التعامل مع امتلائه
+        self.max_pending = max(1, max_pending)
+        if overflow not in OVERFLOW_POLICIES:
+            logger.warning(f"⚠️ سياسة امتلاء غير معروفة '{overflow}' - استخدام {OVERFLOW_BLOCK}")
+            overflow = OVERFLOW_BLOCK
+        self.overflow = overflow
+        self._spill = {
+            priority: SpillFile(os.path.join(spill_dir, f'{SPILL_NAMES[priority]}.jsonl'))
+            for priority in PRIORITIES
+        }
+
+        # تنبيه عند تأخر حفظ الرسائل المباشرة عن وقت نشرها أكثر من lag_alert ثانية (0 لإيقافه)
+        self.lag_alert = lag_alert
+        self.on_lag_alert = on_lag_alert
+        self._last_alert = float('-inf')
+        self._alert_task: Optional[asyncio.Task] = None
+
+        # طابور لكل أولوية: الرسائل المباشرة تُسحب أولاً دائماً
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # تسلسل الرسائل المضافة والمعلقة لكل أولوية (لمعرفة متى أصبحت رسالة ما محفوظة فعلاً)
+        self._enqueued_seq = 0
+        self._outstanding: Dict[int, Deque[int]] = {priority: deque() for priority in PRIORITIES}
+        self._committed: Optional[asyncio.Condition] = None
+
+        # عدد الرسائل في الذاكرة، والدفعات في ملف الفائض (الرقم التسلسلي، عدد الرسائل) لكل أولوية
+        self._depth: Dict[int, int] = {priority: 0 for priority in PRIORITIES}
+        self._spilled: Dict[int, Deque[Tuple[int, int]]] = {priority: deque() for priority in PRIORITIES}
+        # الدفعات المنقولة من ملف الفائض: الرقم التسلسلي -> (الأولوية، موضع نهايتها في الملف) حتى تُحفظ
+        self._spill_acks: Dict[int, Tuple[int, int]] = {}
+        self._spill_lock: Optional[asyncio.Lock] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._waiting: Dict[int, int] = {priority: 0 for priority in PRIORITIES}
+        self._full = False
+
+        # إحصائيات
+        self.total_written = 0
+        self.total_batches = 0
+        self.live_lag = 0.0
+        self.max_live_lag = 0.0
+        self.total_blocked = 0
+        self.blocked_time = 0.0
+        self.total_spilled = 0
+        # زمن الانتظار من الإضافة حتى الحفظ لكل أولوية، والتأخر عن وقت نشر الرسائل المباشرة
+        self.commit_latency: Dict[int, Deque[float]] = {
+            priority: deque(maxlen=LATENCY_SAMPLES) for priority in PRIORITIES
+        }
+        self.end_to_end: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.end_to_end_lag = 0.0
+        self.max_end_to_end_lag = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def pending(self, priority: Optional[int] = None) -> int:
+        """عدد الرسائل المنتظرة في الطابور (أو في أولوية محددة)"""
+        if priority is not None:
+            queue = self._queues.get(priority)
+            return queue.qsize() if queue else 0
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def depth(self, priority: Optional[int] = None) -> int:
+        """عدد الرسائل في الذاكرة التي لم تُحفظ بعد"""
+        if priority is not None:
+            return self._depth[priority]
+        return sum(self._depth.values())
+
+    def spilled(self, priority: Optional[int] = None) -> int:
+        """عدد الرسائل المنتظرة في ملفات الفائض"""
+        priorities = PRIORITIES if priority is None else (priority,)
+        return sum(size for p in priorities for _, size in self._spilled[p])
+
+    async def start(self):
+        """بدء عامل الكتابة في الخلفية"""
+        if self.is_running:
+            return
+
+        self._queues = {priority: asyncio.Queue() for priority in PRIORITIES}
+        self._wakeup = asyncio.Event()
+        self._committed = asyncio.Condition()
+        self._space = asyncio.Condition()
+        self._spill_lock = asyncio.Lock()
+        self._recover_spill()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"✍️ بدء طابور الكتابة (دفعة: {self.max_batch}، انتظار: {self.max_latency * 1000:.0f}ms، "
+            f"الأرشفة الرجعية: {self.backfill_batch} لكل دفعة، الحد: {self.max_pending:,} رسالة، "
+            f"عند الامتلاء: {self.overflow})"
+        )
+
+    def _recover_spill(self):
+        """استعادة الدفعات المتبقية في ملفات الفائض من تشغيل سابق (قبل قبول أي رسالة جديدة)"""
+        for priority, spill in self._spill.items():
+            try:
+                sizes = spill.recover()
+            except Exception as e:
+                logger.error(f"❌ تعذر قراءة ملف الفائض {spill.path}: {e}")
+                continue
+            for size in sizes:
+                self._spilled[priority].append((self._next_seq(priority), size))
+            if sizes:
+                logger.info(f"📂 استعادة {sum(sizes):,} رسالة من ملف الفائض {spill.path}")
+
+    def _next_seq(self, priority: int) -> int:
+        self._enqueued_seq += 1
+        self._outstanding[priority].append(self._enqueued_seq)
+        return self._enqueued_seq
+
+    async def enqueue(self, row: Dict, priority: Optional[int] = None) -> int:
+        """إضافة رسالة إلى طابور الكتابة وإرجاع رقمها التسلسلي (الأولوية من سياق المهمة الحالية)"""
+        return await self.enqueue_group([row], priority)
+
+    async def enqueue_group(self, rows: List[Dict], priority: Optional[int] = None,
+                            replay: Optional[bool] = None) -> int:
+        """إضافة مجموعة رسائل (مثل أجزاء ألبوم) تُحفظ دائماً في نفس الدفعة"""
+        if not self.is_running:
+            await self.start()
+        if priority is None:
+            priority = current_priority.get()
+        if replay is None:
+            replay = current_replay.get()
+        if replay:
+            # رسائل الاستكمال تُعلَّم في الصف نفسه فتبقى العلامة معها في ملف الفائض
+            for row in rows:
+                row['replay'] = True
+
+        if self.overflow == OVERFLOW_SPILL:
+            # بعد أول دفعة في الفائض تتبعها بقية دفعات نفس الأولوية حتى لا يختل الترتيب
+            if self._spilled[priority] or not self._has_room(len(rows)):
+                return await self._spill_group(rows, priority)
+        elif not (self.overflow == OVERFLOW_SHED_BACKFILL and priority == PRIORITY_LIVE):
+            await self._wait_for_room(len(rows), priority)
+
+        seq = self._next_seq(priority)
+        self._put(seq, priority, asyncio.get_running_loop().time(), rows)
+        return seq
+
+    def _put(self, seq: int, priority: int, enqueued_at: float, rows: List[Dict]):
+        self._depth[priority] += len(rows)
+        self._queues[priority].put_nowait((seq, priority, enqueued_at, rows))
+        self._wakeup.set()
+
+    def _has_room(self, size: int) -> bool:
+        """هل يتسع الطابور لـ size رسالة (المجموعة الأكبر من الحد تُقبل في طابور فارغ)"""
+        depth = self.depth()
+        return depth == 0 or depth + size <= self.max_pending
+
+    def _mark_full(self):
+        if not self._full:
+            self._full = True
+            logger.warning(
+                f"⚠️ طابور الكتابة ممتلئ ({self.depth():,}/{self.max_pending:,} رسالة) - السياسة: {self.overflow}"
+            )
+
+    async def _wait_for_room(self, size: int, priority: int):
+        """انتظار توفر مكان في الطابور (الرسائل المباشرة المنتظرة تسبق الأرشفة الرجعية)"""
+        def ready() -> bool:
+            if not self.is_running:
+                return True
+            if priority != PRIORITY_LIVE and self._waiting[PRIORITY_LIVE]:
+                return False
+            return self._has_room(size)
+
+        if ready():
+            return
+
+        self._mark_full()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self._waiting[priority] += 1
+        self.total_blocked += 1
+        try:
+            async with self._space:
+                await self._space.wait_for(ready)
+        finally:
+            self._waiting[priority] -= 1
+            self.blocked_time += loop.time() - started
+
+    async def _spill_group(self, rows: List[Dict], priority: int) -> int:
+        """كتابة مجموعة في ملف الفائض بدلاً من الذاكرة"""
+        self._mark_full()
+        seq = self._next_seq(priority)
+        self._spilled[priority].append((seq, len(rows)))
+        try:
+            async with self._spill_lock:
+                await self.storage.run_io(self._spill[priority].append, rows)
+        except Exception as e:
+            # تعذرت الكتابة على القرص - إبقاؤها في الذاكرة أفضل من فقدانها
+            logger.error(f"❌ تعذرت الكتابة في ملف الفائض ({e}) - إبقاء {len(rows)} رسالة في الذاكرة")
+            self._spilled[priority].remove((seq, len(rows)))
+            self._put(seq, priority, asyncio.get_running_loop().time(), rows)
+            return seq
+
+        self.total_spilled += len(rows)
+        self._wakeup.set()
+        return seq
+
+    async def _refill(self) -> int:
+        """نقل الدفعات من ملفات الفائض إلى الذاكرة بقدر المكان المتاح وإرجاع عددها"""
+        moved = 0
+        for priority in PRIORITIES:
+            spilled = self._spilled[priority]
+            while spilled and self._has_room(spilled[0][1]):
+                async with self._spill_lock:
+                    items = await self.storage.run_io(
+                        self._spill[priority].read, max(1, self.max_pending - self.depth())
+                    )
+                if not items:
+                    break
+
+                # وقت الإضافة الأصلي (بساعة الحلقة) حتى يشمل زمن الانتظار الوقت في الملف
+                offset = asyncio.get_running_loop().time() - time.time()
+                for spilled_at, rows, end in items:
+                    # عدد الدفعات المستعادة يطابق الملف عادة، والاحتياط يمنع فقدان دفعة زائدة
+                    seq = spilled.popleft()[0] if spilled else self._next_seq(priority)
+                    self._spill_acks[seq] = (priority, end)
+                    self._put(seq, priority, spilled_at + offset, rows)
+                moved += len(items)
+        return moved
+
+    @property
+    def last_seq(self) -> int:
+        """الرقم التسلسلي لآخر رسالة مضافة"""
+        return self._enqueued_seq
+
+    @property
+    def committed_seq(self) -> int:
+        """أكبر رقم تسلسلي حُفظت كل الرسائل قبله"""
+        heads = [seqs[0] for seqs in self._outstanding.values() if seqs]
+        return min(heads) - 1 if heads else self._enqueued_seq
+
+    async def wait_committed(self, seq: Optional[int] = None):
+        """انتظار حفظ جميع الرسائل حتى الرقم التسلسلي المحدد"""
+        if seq is None:
+            seq = self._enqueued_seq
+        if self._committed is None:
+            return
+
+        async with self._committed:
+            await self._committed.wait_for(lambda: self.committed_seq >= seq or not self.is_running)
+
+    async def flush(self):
+        """انتظار حفظ جميع الرسائل الموجودة في الطابور وملفات الفائض"""
+        if self.is_running:
+            await self.wait_committed()
+
+    async def stop(self):
+        """حفظ ما تبقى وإيقاف عامل الكتابة"""
+        if not self.is_running:
+            return
+
+        await self.flush()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+        self._worker = None
+        async with self._committed:
+            self._committed.notify_all()
+        async with self._space:
+            self._space.notify_all()
+        logger.info(f"✅ تم إيقاف طابور الكتابة - {self.total_written:,} رسالة في {self.total_batches:,} دفعة")
+
+    def lag_stats(self) -> Dict:
+        """مقاييس الطابور: الحجم والامتلاء وزمن الانتظار حتى الحفظ والتأخر عن وقت النشر"""
+        return {
+            'live_lag': self.live_lag,
+            'max_live_lag': self.max_live_lag,
+            'live_pending': self.pending(PRIORITY_LIVE),
+            'backfill_pending': self.pending(PRIORITY_BACKFILL),
+            'depth': self.depth(),
+            'capacity': self.max_pending,
+            'overflow': self.overflow,
+            'spilled': self.spilled(),
+            'total_spilled': self.total_spilled,
+            'blocked': sum(self._waiting.values()),
+            'total_blocked': self.total_blocked,
+            'blocked_time': self.blocked_time,
+            'live_commit_p50': percentile(self.commit_latency[PRIORITY_LIVE], 0.5),
+            'live_commit_p95': percentile(self.commit_latency[PRIORITY_LIVE], 0.95),
+            'backfill_commit_p95': percentile(self.commit_latency[PRIORITY_BACKFILL], 0.95),
+            'end_to_end_lag': self.end_to_end_lag,
+            'end_to_end_p95': percentile(self.end_to_end, 0.95),
+            'max_end_to_end_lag': self.max_end_to_end_lag,
+        }
+
+    async def _run(self):
+        """حلقة عامل الكتابة"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._wait_for_items()
+            batch: List[tuple] = []
+            deadline = loop.time() + self.max_latency
+
+            while True:
+                # سحب ما هو متاح فوراً: المباشرة أولاً ثم حصة الأرشفة الرجعية
+                size, backfill = self._take(batch)
+                if size >= self.max_batch or backfill >= self.backfill_batch:
+                    break
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    await asyncio.wait_for(self._wait_for_items(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            rows = [row for item in batch for row in item[3]]
+            try:
+                await self._write_batch(rows)
+            except Exception as e:
+                logger.error(f"❌ خطأ في حفظ دفعة من {len(rows)} رسالة: {e}")
+                await self._dead_letter([(row, e) for row in rows])
+            finally:
+                self._record_lag(batch, loop.time())
+                await self._commit_spill(batch)
+                async with self._committed:
+                    for seq, priority, _, group in batch:
+                        self._outstanding[priority].remove(seq)
+                        self._depth[priority] -= len(group)
+                    self._committed.notify_all()
+                for _, priority, _, _ in batch:
+                    self._queues[priority].task_done()
+                await self._release()
+
+    async def _commit_spill(self, batch: List[tuple]):
+        """تقديم الموضع المحفوظ لملفات الفائض بعد حفظ دفعاتها (أو نقلها لطابور إعادة المحاولة)"""
+        offsets: Dict[int, int] = {}
+        for seq, _, _, _ in batch:
+            ack = self._spill_acks.pop(seq, None)
+            if ack:
+                priority, end = ack
+                offsets[priority] = max(end, offsets.get(priority, 0))
+
+        for priority, end in offsets.items():
+            try:
+                async with self._spill_lock:
+                    await self.storage.run_io(self._spill[priority].commit, end)
+            except Exception as e:
+                logger.error(f"❌ تعذر حفظ موضع ملف الفائض {self._spill[priority].path}: {e}")
+
+    async def _release(self):
+        """ملء المكان المتاح من ملفات الفائض ثم إيقاظ المنتجين المنتظرين"""
+        try:
+            await self._refill()
+        except Exception as e:
+            logger.error(f"❌ خطأ في قراءة ملفات الفائض: {e}")
+
+        async with self._space:
+            self._space.notify_all()
+
+        if self._full and not self.spilled() and self.depth() <= self.max_pending // 2:
+            self._full = False
+            logger.info(f"✅ عاد طابور الكتابة للعمل الطبيعي ({self.depth():,}/{self.max_pending:,} رسالة)")
+
+    async def _wait_for_items(self):
+        """انتظار وصول رسالة إلى أي طابور (أو إلى ملفات الفائض)"""
+        while not self.pending():
+            self._wakeup.clear()
+            if self.spilled():
+                try:
+                    if await self._refill():
+                        continue
+                except Exception as e:
+                    logger.error(f"❌ خطأ في قراءة ملفات الفائض: {e}")
+            await self._wakeup.wait()
+
+    def _take(self, batch: List[tuple]) -> Tuple[int, int]:
+        """نقل الرسائل المتاحة إلى الدفعة وإرجاع (عدد الرسائل، عدد رسائل الأرشفة الرجعية) فيها"""
+        size = sum(len(item[3]) for item in batch)
+        backfill = sum(len(item[3]) for item in batch if item[1] == PRIORITY_BACKFILL)
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while size < self.max_batch and not queue.empty():
+                if priority == PRIORITY_BACKFILL and backfill >= self.backfill_batch:
+                    break
+                item = queue.get_nowait()
+                batch.append(item)
+                size += len(item[3])
+                if priority == PRIORITY_BACKFILL:
+                    backfill += len(item[3])
+        return size, backfill
+
+    def _record_lag(self, batch: List[tuple], now: float):
+        """تسجيل زمن بقاء الرسائل في الطابور حتى الحفظ وتأخر الرسائل المباشرة عن وقت نشرها"""
+        for _, priority, enqueued_at, _ in batch:
+            self.commit_latency[priority].append(now - enqueued_at)
+
+        lags = [now - enqueued_at for _, priority, enqueued_at, _ in batch if priority == PRIORITY_LIVE]
+        if lags:
+            self.live_lag = max(lags)
+            self.max_live_lag = max(self.max_live_lag, self.live_lag)
+
+        # رسائل الاستكمال مباشرة لكنها نُشرت قبل الانقطاع، فتأخرها لا يقيس تأخر الأرشفة
+        wall = datetime.now(timezone.utc)
+        delays = []
+        for _, priority, _, rows in batch:
+            if priority != PRIORITY_LIVE:
+                continue
+            for row in rows:
+                if row.get('replay'):
+                    continue
+                try:
+                    delays.append((wall - parse_date(row['date'])).total_seconds())
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+        if delays:
+            self.end_to_end_lag = max(delays)
+            self.max_end_to_end_lag = max(self.max_end_to_end_lag, self.end_to_end_lag)
+            self.end_to_end.extend(delays)
+            self._check_lag_alert()
+
+    def _check_lag_alert(self):
+        """تنبيه (بحد أقصى مرة كل LAG_ALERT_INTERVAL) عند تأخر الأرشفة عن النشر"""
+        if not self.lag_alert or self.end_to_end_lag < self.lag_alert:
+            return
+        now = time.monotonic()
+        if now - self._last_alert < LAG_ALERT_INTERVAL:
+            return
+        self._last_alert = now
+
+        logger.warning(
+            f"🐢 تأخر أرشفة الرسائل المباشرة عن نشرها: {self.end_to_end_lag:.0f} ثانية "
+            f"({self.depth():,} رسالة في الذاكرة، {self.spilled():,} في ملفات الفائض)"
+        )
+        if self.on_lag_alert:
+            self._alert_task = asyncio.create_task(self._send_lag_alert(self.lag_stats()))
+
+    async def _send_lag_alert(self, stats: Dict):
+        try:
+            await self.on_lag_alert(stats)
+        except Exception as e:
+            logger.error(f"❌ خطأ في إرسال تنبيه التأخر: {e}")
+
+    async def _write_batch(self, batch: List[Dict]):
+        """حفظ دفعة من الرسائل بعملية commit واحدة في خيط الكتابة"""
+        failed = await self.storage.write(self._commit_rows, batch)
+        if failed:
+            failed_ids = {id(row) for row, _ in failed}
+            batch = [row for row in batch if id(row) not in failed_ids]
+
+        self.total_written += len(batch)
+        self.total_batches += 1
+
+        if self.on_flush:
+            try:
+                await self.on_flush(batch)
+            except Exception as e:
+                logger.error(f"❌ خطأ في معالجة الدفعة بعد الحفظ: {e}")
+
+        await self._dead_letter(failed)
+
+    async def write_rows(self, rows: List[Dict], keep_existing: bool = False):
+        """حفظ رسائل مباشرة دون المرور بالطابور (لإعادة المحاولة) مع رفع الخطأ عند الفشل"""
+        rows = await self.storage.write(self._save_rows, rows, keep_existing)
+        self.total_written += len(rows)
+        if self.on_flush and rows:
+            await self.on_flush(rows)
+
+    async def _dead_letter(self, failed: List[Tuple[Dict, Exception]]):
+        """حفظ الرسائل الفاشلة في طابور إعادة المحاولة"""
+        if not failed:
+            return
+        if self.dead_letters:
+            await self.dead_letters.add_many('rows', [(row, error) for row, error in failed])
+        else:
+            logger.error(f"❌ فقدان {len(failed)} رسالة بعد فشل حفظها")
+
+    def _save_rows(self, conn: sqlite3.Connection, rows: List[Dict], keep_existing: bool = False) -> List[Dict]:
+        """إدراج الرسائل وتحديث الألبومات وخريطة المعرفات بعملية واحدة وإرجاع الرسائل المحفوظة"""
+        cursor = conn.cursor()
+        if keep_existing:
+            rows = [row for row in rows if cursor.execute(INSERT_MISSING_SQL, row_params(row)).rowcount]
+        else:
+            cursor.executemany(INSERT_MESSAGE_SQL, [row_params(row) for row in rows])
+        cursor.executemany(UPSERT_GROUP_SQL, group_keys(rows))
+        changes = self.coverage.record_rows(conn, rows) if self.coverage else []
+        conn.commit()
+        if changes:
+            self.coverage.apply(changes)
+        return rows
+
+    def _commit_rows(self, conn: sqlite3.Connection, batch: List[Dict]) -> List[Tuple[Dict, Exception]]:
+        """تنفيذ الإدراج لدفعة كاملة مع الرجوع للإدراج الفردي عند الخطأ، وإرجاع الرسائل التي فشل حفظها"""
+        try:
+            self._save_rows(conn, batch)
+            return []
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.warning(f"⚠️ فشل حفظ الدفعة ({e}) - إعادة المحاولة رسالة برسالة")
+
+        cursor = conn.cursor()
+        saved = []
+        failed = []
+        for row in batch:
+            try:
+                cursor.execute(INSERT_MESSAGE_SQL, row_params(row))
+                saved.append(row)
+            except sqlite3.Error as e:
+                logger.error(f"❌ خطأ في أرشفة الرسالة {row['message_id']}: {e}")
+                failed.append((row, e))
+        try:
+            cursor.executemany(UPSERT_GROUP_SQL, group_keys(saved))
+            changes = self.coverage.record_rows(conn, saved) if self.coverage else []
+            conn.commit()
+        except sqlite3.Error:
+            # لا تبقى الصفوف معلقة على اتصال الكتابة فتُحفظ أو تُلغى مع دفعة أخرى
+            conn.rollback()
+            raise
+        if changes:
+            self.coverage.apply(changes)
+        return failed